@@ -0,0 +1,289 @@
+"""
+Game of Thrones Approximate Nearest Neighbor Indexes
+
+The persisted vector index is an exact flat index, which is simple to update
+incrementally but scans every vector on each query. As sources are added
+(companion books, wiki dumps) the scan dominates latency and memory. This
+module builds a faster approximate index from the flat one:
+1. flat: Exact search (optionally with float16/int8 vectors)
+2. hnsw: HNSW graph; fast and accurate, but cannot remove vectors, so it is
+   rebuilt from the flat index after every update
+3. ivf_flat: Inverted lists over k-means clusters, searching nprobe of them
+4. ivf_pq: Inverted lists with product-quantized vectors; the smallest
+
+Vectors can be stored as float32, float16 or int8 (scalar quantization) for
+flat, hnsw and ivf_flat. IVF indexes are trained on the chunk corpus itself.
+
+Run as a script to benchmark every option against the flat baseline on the
+persisted index, reporting recall@k, query latency percentiles and memory:
+    $ python backend/ann_index.py --index-dir faiss_index --k 10
+
+Usage:
+    from ann_index import build_ann_index, configure_search, flat_vectors
+
+    vectors, ids = flat_vectors(vector_store.index)
+    index = build_ann_index(vectors, ids, "hnsw", vector_dtype="int8")
+    configure_search(index, ef_search=64)
+"""
+
+import os
+import time
+import math
+import argparse
+import faiss
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+VECTOR_DTYPES = ("float32", "float16", "int8")
+# Settings that change the built index; the others only affect searching
+BUILD_SETTINGS = ("index_type", "vector_dtype", "hnsw_m", "nlist", "pq_m")
+
+# faiss wants at least this many training points per IVF centroid
+_POINTS_PER_CENTROID = 39
+_ENCODINGS = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8"}
+
+def factory_string(
+    index_type: str,
+    n_vectors: int,
+    dimension: int,
+    vector_dtype: str = "float32",
+    hnsw_m: int = 32,
+    nlist: Optional[int] = None,
+    pq_m: Optional[int] = None,
+) -> str:
+    """
+    Build the faiss.index_factory description of an index.
+
+    Args:
+        index_type: One of INDEX_TYPES
+        n_vectors: Number of vectors the index will hold (sizes IVF lists
+            and PQ codebooks)
+        dimension: Vector dimension
+        vector_dtype: One of VECTOR_DTYPES; ignored for ivf_pq
+        hnsw_m: Neighbors per HNSW node
+        nlist: Number of IVF lists (default: about 4 * sqrt(n_vectors))
+        pq_m: Number of PQ sub-quantizers (default: the largest divisor of
+            dimension up to dimension / 8)
+
+    Returns:
+        The factory string
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+    if vector_dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unsupported vector dtype: {vector_dtype}")
+    encoding = _ENCODINGS[vector_dtype]
+
+    if index_type == "flat":
+        return f"IDMap2,{encoding}"
+    if index_type == "hnsw":
+        return f"IDMap2,HNSW{hnsw_m}" + ("" if encoding == "Flat" else f"_{encoding}")
+
+    if nlist is None:
+        nlist = int(4 * math.sqrt(n_vectors))
+    nlist = max(1, min(nlist, n_vectors // _POINTS_PER_CENTROID))
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},{encoding}"
+
+    if pq_m is None:
+        pq_m = max(m for m in range(1, max(1, dimension // 8) + 1) if dimension % m == 0)
+    # Fewer bits per code when there are too few vectors to train 256 centroids
+    nbits = max(1, min(8, int(math.log2(max(2, n_vectors // _POINTS_PER_CENTROID)))))
+    return f"IVF{nlist},PQ{pq_m}x{nbits}"
+
+def flat_vectors(index: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Extract the vectors and ids of a flat index.
+
+    Args:
+        index: An IndexIDMap2 over a flat index, or a plain flat index
+
+    Returns:
+        Tuple of (float32 vectors, int64 ids)
+    """
+    # Downcast wrappers do not own the index, so `index` keeps it alive
+    outer = faiss.downcast_index(index)
+    if isinstance(outer, faiss.IndexIDMap):
+        ids = faiss.vector_to_array(outer.id_map).astype(np.int64)
+        inner = faiss.downcast_index(outer.index)
+    else:
+        ids = np.arange(outer.ntotal, dtype=np.int64)
+        inner = outer
+    return inner.reconstruct_n(0, inner.ntotal), ids
+
+def build_ann_index(
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    index_type: str,
+    vector_dtype: str = "float32",
+    hnsw_m: int = 32,
+    nlist: Optional[int] = None,
+    pq_m: Optional[int] = None,
+) -> Any:
+    """
+    Build and fill an index of the given type.
+
+    Args:
+        vectors: float32 vectors to index
+        ids: int64 id of each vector (the flat index's ids, so the
+            docstore mapping stays valid)
+        index_type: One of INDEX_TYPES
+        vector_dtype: One of VECTOR_DTYPES
+        hnsw_m: Neighbors per HNSW node
+        nlist: Number of IVF lists
+        pq_m: Number of PQ sub-quantizers
+
+    Returns:
+        The filled faiss index
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    description = factory_string(index_type, len(vectors), vectors.shape[1], vector_dtype, hnsw_m, nlist, pq_m)
+    start = time.time()
+    index = faiss.index_factory(vectors.shape[1], description)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype=np.int64))
+    print(f"Built {description} index over {len(vectors)} vectors in {time.time() - start:.2f}s")
+    return index
+
+def _inner_index(index: Any) -> Any:
+    """Unwrap an IndexIDMap to the index doing the search."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+def configure_search(index: Any, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """
+    Set the search-time accuracy/speed trade-off of an index.
+
+    Settings that do not apply to the index type are ignored.
+
+    Args:
+        index: The faiss index
+        nprobe: IVF lists visited per query
+        ef_search: HNSW candidate list size per query
+    """
+    inner = _inner_index(index)
+    if nprobe is not None and isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = nprobe
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+
+def search_parameters(index: Any, selector: Any) -> Any:
+    """
+    Build search parameters applying an ID selector to an index.
+
+    IVF and HNSW indexes need their own parameter types, which also carry
+    the index's current nprobe or efSearch.
+
+    Args:
+        index: The faiss index to be searched
+        selector: A faiss.IDSelector
+
+    Returns:
+        faiss.SearchParameters (or its IVF/HNSW subclass)
+    """
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def index_memory(index: Any) -> int:
+    """Size of an index in bytes, as serialized (close to its memory use)."""
+    return int(faiss.serialize_index(index).nbytes)
+
+def benchmark(
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    configs: List[Dict[str, Any]],
+    k: int = 10,
+    n_queries: int = 200,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Compare index options against exact search.
+
+    Queries are stored vectors with a little noise, so each has a true
+    neighborhood in the corpus.
+
+    Args:
+        vectors: The corpus vectors
+        ids: Their ids
+        configs: Keyword arguments of build_ann_index plus optional
+            'nprobe' and 'ef_search', one per option
+        k: Neighbors per query for recall@k
+        n_queries: Number of queries
+        seed: Random seed for choosing queries
+
+    Returns:
+        One dict per option with its settings, recall, latency percentiles
+        (milliseconds, one query at a time), build time and memory
+    """
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    queries = queries + rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+
+    exact = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+    exact.add_with_ids(vectors, ids)
+    _, truth = exact.search(queries, k)
+
+    results = []
+    for config in configs:
+        build = {key: value for key, value in config.items() if key in BUILD_SETTINGS}
+        start = time.time()
+        index = build_ann_index(vectors, ids, **build)
+        build_seconds = time.time() - start
+        configure_search(index, config.get('nprobe'), config.get('ef_search'))
+
+        latencies = []
+        found = np.empty_like(truth)
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            _, found[i:i + 1] = index.search(query[None, :], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found.tolist(), truth.tolist())])
+        results.append({
+            **config,
+            "recall": float(recall),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "build_s": build_seconds,
+            "memory_mb": index_memory(index) / 1e6,
+        })
+    return results
+
+if __name__ == "__main__":
+    from index_store import INDEX_FILE
+
+    parser = argparse.ArgumentParser(description="Benchmark ANN index options against exact search")
+    parser.add_argument("--index-dir", default="faiss_index", help="Directory of the persisted index")
+    parser.add_argument("--k", type=int, default=10, help="Neighbors per query for recall@k")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16], help="IVF nprobe values to try")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 128], help="HNSW efSearch values to try")
+    args = parser.parse_args()
+
+    vectors, ids = flat_vectors(faiss.read_index(os.path.join(args.index_dir, INDEX_FILE)))
+    print(f"Benchmarking on {len(vectors)} vectors of dimension {vectors.shape[1]}")
+
+    configs = [{"index_type": "flat", "vector_dtype": dtype} for dtype in VECTOR_DTYPES]
+    for dtype in VECTOR_DTYPES:
+        configs += [{"index_type": "hnsw", "vector_dtype": dtype, "ef_search": ef} for ef in args.ef_search]
+    for dtype in ("float32", "int8"):
+        configs += [{"index_type": "ivf_flat", "vector_dtype": dtype, "nprobe": n} for n in args.nprobe]
+    configs += [{"index_type": "ivf_pq", "nprobe": n} for n in args.nprobe]
+
+    results = benchmark(vectors, ids, configs, k=args.k, n_queries=args.queries)
+    print(f"\n{'index':<10} {'vectors':<8} {'search':<14} {'recall@' + str(args.k):>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'build s':>8} {'MB':>8}")
+    for r in results:
+        search = (f"nprobe={r['nprobe']}" if 'nprobe' in r
+                  else f"efSearch={r['ef_search']}" if 'ef_search' in r else "exact")
+        print(f"{r['index_type']:<10} {r.get('vector_dtype', 'pq'):<8} {search:<14} {r['recall']:>9.3f} "
+              f"{r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['build_s']:>8.2f} {r['memory_mb']:>8.2f}")
@@ -0,0 +1,210 @@
+"""
+Game of Thrones Knowledge Bot - HTTP API
+
+This module serves the knowledge bot over HTTP from an asyncio server
+(FastAPI under gunicorn's uvicorn workers). The Gradio interface from app.py
+is mounted at the root, so one server provides both.
+
+Blocking work (embedding, search, generation) runs on a bounded thread pool
+(see serving.RequestRunner). Identical questions asked while one is being
+answered share its computation, and requests beyond the queue limit are
+rejected with 429 instead of queuing without bound. Each gunicorn worker
+memory-maps the same index files, so extra workers share the index pages
+rather than each holding a copy.
+
+Models and indexes load in the background after startup (see
+lazy_components.py), so the server accepts connections immediately.
+
+Endpoints:
+- POST /api/ask: Answer a question with the most relevant passages
+- POST /api/ask/stream: Stream the answer to a question as newline-delimited
+  JSON events (passages first, then generated tokens)
+- POST /api/converse: Answer a question within a conversation
+- POST /api/batch: Answer many questions at once
+- GET /api/stats: Queue, cache, entity search, reranking, neighbor
+  window, prompt compression and local generation counters
+- GET /api/metrics: Latency histograms and percentiles of each pipeline
+  stage (see metrics.py)
+- GET /api/health: Liveness; answers as soon as the server is up
+- GET /api/ready: Which components are loaded and how long each took; 503
+  until questions can be answered without waiting for a model to load
+
+Both /api/ask endpoints take an optional "book" (title or number) to search
+only that book and "up_to_book" to leave out later books (spoiler-safe).
+
+Usage:
+    $ cd backend && gunicorn -c gunicorn_config.py api:app
+"""
+
+import os
+import json
+import gradio as gr
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import app as gotbot
+from metrics import metrics
+from query_cache import normalize_question
+from serving import Overloaded, RequestRunner
+
+# Threads running blocking work in each server process
+API_WORKER_THREADS = int(os.environ.get("API_WORKER_THREADS", "4"))
+# Requests admitted at once per process before answering 429
+API_MAX_PENDING = int(os.environ.get("API_MAX_PENDING", "32"))
+RETRY_AFTER_SECONDS = 2
+
+runner = RequestRunner(max_workers=API_WORKER_THREADS, max_pending=API_MAX_PENDING)
+app = FastAPI(title="Game of Thrones Knowledge Bot")
+
+def _question_from(body: dict) -> str:
+    """Extract the question from either {"text": ...} or Gradio's {"data": [...]}"""
+    return body.get("text") or (body.get("data") or [""])[0] or ""
+
+def _batch_from(body: dict) -> tuple:
+    """
+    Extract the questions and the generate flag from either
+    {"questions": [...], "generate": ...} or the Gradio batch tab's
+    {"data": ["one question per line", generate]}
+    """
+    if "questions" not in body and isinstance(body.get("data"), list):
+        data = body["data"] + [None, None]
+        if not isinstance(data[0], str):
+            raise HTTPException(status_code=400, detail="data[0] must be the questions, one per line")
+        questions = [line.strip() for line in data[0].splitlines() if line.strip()]
+        return questions, bool(data[1])
+    questions = body.get("questions")
+    if not isinstance(questions, list):
+        raise HTTPException(status_code=400, detail="questions must be a list")
+    return questions, bool(body.get("generate"))
+
+def _overloaded() -> HTTPException:
+    """The response for a request rejected for backpressure"""
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests, please retry shortly.",
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
+
+@app.post("/api/ask")
+async def ask(request: Request):
+    """Answer a question with the most relevant passages."""
+    body = await request.json()
+    question = _question_from(body)
+    book, up_to_book = body.get("book"), body.get("up_to_book")
+    try:
+        answer = await runner.run(
+            ("ask", normalize_question(question), book, up_to_book),
+            gotbot.answer_question, question, book, up_to_book
+        )
+    except Overloaded:
+        raise _overloaded()
+    return {"data": [{"response": answer}]}
+
+@app.post("/api/ask/stream")
+async def ask_stream(request: Request):
+    """
+    Stream an answer as newline-delimited JSON.
+
+    Each line is one event from app.stream_events: 'passages', then 'token'
+    events as the answer is generated, then 'done' (or 'error').
+    """
+    body = await request.json()
+    question = _question_from(body)
+    try:
+        runner.acquire()
+    except Overloaded:
+        raise _overloaded()
+
+    def events():
+        # Holds the queue slot until the stream is finished or abandoned
+        try:
+            for event in gotbot.stream_events(
+                question, book=body.get("book"), up_to_book=body.get("up_to_book")
+            ):
+                yield json.dumps(event) + "\n"
+        finally:
+            runner.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/converse")
+async def converse(request: Request):
+    """Answer a question within the conversation given by 'session_id'."""
+    body = await request.json()
+    session_id = body.get("session_id")
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required")
+    try:
+        # Never coalesced: the answer depends on the session's history
+        answer = await runner.run(None, gotbot.converse, _question_from(body), session_id)
+    except Overloaded:
+        raise _overloaded()
+    return {"data": [{"response": answer}], "session_id": session_id}
+
+@app.post("/api/batch")
+async def batch(request: Request):
+    """
+    Answer a list of questions given as 'questions' ('generate' uses the
+    LLM), or in the Gradio batch tab's 'data' form, answered in that form.
+    """
+    body = await request.json()
+    questions, generate = _batch_from(body)
+    try:
+        results = await runner.run(None, gotbot.answer_questions, questions, 2, generate)
+    except Overloaded:
+        raise _overloaded()
+    if "questions" not in body:
+        return {"data": [results]}
+    return {"results": results}
+
+@app.get("/api/stats")
+async def stats():
+    """Report queue and cache counters of this server process."""
+    caches = [gotbot.query_embedding_cache.stats()]
+    if gotbot.retrieval_cache.loaded:
+        caches.append(gotbot.retrieval_cache.get().stats())
+    return {
+        "runner": runner.stats(),
+        "caches": caches,
+        "sessions": gotbot.sessions.stats(),
+        "search_batches": gotbot.search_scheduler.stats(),
+        "entities": gotbot.entity_index.get().stats() if gotbot.entity_index.loaded else None,
+        "reranker": gotbot.reranker.get().stats() if gotbot.reranker.loaded else None,
+        "neighbors": gotbot.neighbors.get().stats() if gotbot.neighbors.loaded else None,
+        "context_compression": (
+            gotbot.context_compressor.get().stats() if gotbot.context_compressor.loaded else None
+        ),
+        "generation": gotbot.llm.get().stats() if gotbot.llm.loaded else None,
+    }
+
+@app.get("/api/metrics")
+async def stage_metrics():
+    """Report the latency histograms of each pipeline stage in this server process."""
+    return {"pid": os.getpid(), "stages": metrics.snapshot()}
+
+@app.get("/api/health")
+async def health():
+    """Report that the server is up, whether or not the models are loaded."""
+    return {"status": "ok"}
+
+@app.get("/api/ready")
+async def ready():
+    """Report the loading state of each component; 503 until search is ready."""
+    status = gotbot.ready_status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.on_event("startup")
+def startup():
+    gotbot.start_warm_up()
+
+@app.on_event("shutdown")
+def shutdown():
+    runner.shutdown()
+
+# Queuing is required for streaming (generator) handlers in the Gradio UI
+gotbot.demo.queue()
+app = gr.mount_gradio_app(app, gotbot.demo, path="/")
@@ -21,19 +21,16 @@ Usage:
 
 import gradio as gr
 import os
-import json
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.docstore.document import Document
-from langchain.llms import HuggingFacePipeline
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
+import time
+from query_cache import QueryCache, normalize_question
+from batch_scheduler import BatchScheduler
+from session_store import SessionStore
+from lazy_components import LazyComponent, readiness, warm_up
+from metrics import record, timed
 
 # Debug logging
 print("Starting application...")
 print(f"Current directory: {os.getcwd()}")
-print(f"Directory contents: {os.listdir()}")
 
 # Load a minimal fallback dataset directly in code
 FALLBACK_DATA = [
@@ -45,122 +42,558 @@ FALLBACK_DATA = [
      "metadata": {"book_title": "A Storm of Swords", "chapter": "Chapter 51"}}
 ]
 
-def load_documents():
-    """Load documents with extensive error checking"""
-    documents = []
-    rag_dir = "output/rag_chunks"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Embedding backend: "torch" (sentence-transformers, fp32) or "onnx" (int8
+# quantized, ONNX Runtime with ONNX_THREADS intra-op threads; see
+# onnx_embeddings.py; export the model first). Switching backend rebuilds
+# the index.
+EMBEDDING_BACKEND = os.environ.get("GOTBOT_EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = "models/all-MiniLM-L6-v2-onnx"
+ONNX_THREADS = int(os.environ.get("GOTBOT_ONNX_THREADS", "0")) or None
+EMBEDDING_VERSION = EMBEDDING_MODEL + ("@onnx-int8" if EMBEDDING_BACKEND == "onnx" else "")
+LLM_MODEL = "distilgpt2"
+RAG_DIR = "output/rag_chunks"
+INDEX_DIR = "faiss_index"
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_WORKERS = 1
+QUERY_CACHE_SIZE = 1024
+RETRIEVAL_CACHE_TTL = 3600
+# Set to a file path (e.g. "query_cache.sqlite3") to keep caches across restarts
+CACHE_DB = None
+# Concurrent searches arriving within SEARCH_MAX_WAIT seconds run as one batch
+SEARCH_BATCH_SIZE = 16
+SEARCH_MAX_WAIT = 0.005
+# Fuse BM25 keyword results with vector results, taking this many from each
+HYBRID_SEARCH = True
+SEARCH_FETCH_K = 20
+# Also fuse the chunks mentioning the characters, houses and places a
+# question names (see entity_index.py)
+ENTITY_SEARCH = True
+# Vector index searched: "flat" (exact), "hnsw", "ivf_flat" or "ivf_pq", with
+# vectors stored as "float32", "float16" or "int8" (see ann_index.py)
+INDEX_TYPE = "flat"
+INDEX_VECTOR_DTYPE = "float32"
+INDEX_NPROBE = 16
+INDEX_EF_SEARCH = 64
+# Rerank RERANK_FETCH_K search results with a cross-encoder, within
+# RERANK_BUDGET seconds per question; the chain then needs fewer passages
+RERANK = True
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_FETCH_K = 50
+RERANK_BUDGET = 0.25
+# Expand each passage to the NEIGHBOR_WINDOW chunks on either side of it in
+# its chapter (see neighbors.py); the chain then needs fewer passages
+NEIGHBOR_WINDOW = 1
+CHAIN_PASSAGES = 2 if NEIGHBOR_WINDOW else 3 if RERANK else 4
+# Keep only the passage sentences most similar to the question, up to
+# CONTEXT_TOKENS tokens, in the generation prompt
+COMPRESS_CONTEXT = True
+CONTEXT_TOKENS = 384
+# Choices of the book filter and the spoiler-safe limit
+ALL_BOOKS = "All books"
+BOOK_CHOICES = [
+    ALL_BOOKS, "A Game of Thrones", "A Clash of Kings", "A Storm of Swords",
+    "A Feast for Crows", "A Dance with Dragons"
+]
+MAX_NEW_TOKENS = 512
+# Local generation: int8 weights, and prompt plus answer capped at LLM_MAX_TOTAL_TOKENS
+LLM_QUANTIZE = True
+LLM_MAX_TOTAL_TOKENS = 1024
+LLM_THREADS = int(os.environ.get("GOTBOT_LLM_THREADS", "0")) or None
+SESSION_MAX_TURNS = 5
+# History tokens in the condense-question prompt, which must fit in
+# LLM_MAX_TOTAL_TOKENS with MAX_NEW_TOKENS; a longer newest turn is cut to fit
+SESSION_MAX_TOKENS = 256
+SESSION_IDLE_TIMEOUT = 1800
+MAX_SESSIONS = 1000
+# Models and indexes load on first use. At startup, the search components
+# are loaded in a background thread ("0" disables this); the language model
+# too if GOTBOT_WARM_UP_LLM is "1". /api/ready reports the progress.
+WARM_UP = os.environ.get("GOTBOT_WARM_UP", "1") == "1"
+WARM_UP_LLM = os.environ.get("GOTBOT_WARM_UP_LLM", "0") == "1"
+
+def fallback_documents():
+    """Build the minimal fallback dataset used when no chunks can be loaded"""
+    from langchain.docstore.document import Document
+    print("Using fallback data since no documents were found")
+    return [
+        Document(page_content=item["content"], metadata=item["metadata"])
+        for item in FALLBACK_DATA
+    ]
+
+# Repeated questions skip the query embedding
+query_embedding_cache = QueryCache(
+    "query_embeddings", max_size=QUERY_CACHE_SIZE, ttl=None,
+    version=EMBEDDING_VERSION, db_path=CACHE_DB
+)
+
+def load_query_embeddings():
+    """Load the embedding model of EMBEDDING_BACKEND, wrapped to cache query embeddings"""
+    from query_cache import CachedQueryEmbeddings
+    if EMBEDDING_BACKEND == "onnx":
+        from onnx_embeddings import OnnxEmbeddings
+        embeddings = OnnxEmbeddings(ONNX_MODEL_DIR, EMBEDDING_MODEL, threads=ONNX_THREADS)
+    else:
+        from langchain.embeddings import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    return CachedQueryEmbeddings(embeddings, query_embedding_cache)
+
+def embedding_pipeline(checkpoint_path):
+    """Create the batched, checkpointed embedder of index builds"""
+    from embedding_pipeline import EmbeddingPipeline
+    return EmbeddingPipeline(
+        EMBEDDING_VERSION,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        # Worker processes load the sentence-transformers model
+        workers=EMBEDDING_WORKERS if EMBEDDING_BACKEND == "torch" else 1,
+        checkpoint_path=checkpoint_path,
+        model=query_embeddings.get().embeddings.client
+    )
+
+def load_vector_store():
+    """Load the persisted vector store, updating it for changed chunk files"""
+    from chunk_store import list_chunk_files, load_chunk_file
+    from index_store import load_or_update_index
+    return load_or_update_index(
+        INDEX_DIR,
+        list_chunk_files(RAG_DIR),
+        query_embeddings.get(),
+        EMBEDDING_VERSION,
+        load_chunk_file,
+        load_fallback=fallback_documents,
+        embed_texts=embedding_pipeline(f"{INDEX_DIR}.vectors").embed,
+        ann={"index_type": INDEX_TYPE, "vector_dtype": INDEX_VECTOR_DTYPE,
+             "nprobe": INDEX_NPROBE, "ef_search": INDEX_EF_SEARCH}
+    )
+
+def load_lexical_index():
+    """Load or build the BM25 index of the vector store's chunks"""
+    from lexical_index import load_or_build_lexical_index
+    return load_or_build_lexical_index(INDEX_DIR, vector_store.get())
+
+def load_entity_index():
+    """Load the entity index stored with the chunks, resolved to the vector store's chunks"""
+    from entity_index import load_entity_index
+    return load_entity_index(RAG_DIR, INDEX_DIR, vector_store.get())
+
+def load_neighbors():
+    """Order the vector store's chunks by book and chapter, for neighbor windows"""
+    from neighbors import NeighborIndex
+    return NeighborIndex.from_vector_store(vector_store.get())
+
+def load_partitions():
+    """Group vector ids per book and chapter, for scoped searches"""
+    from partitions import PartitionIndex
+    return PartitionIndex.from_vector_store(vector_store.get())
+
+def load_retrieval_cache():
+    """Create the retrieval cache, versioned by the loaded index and the reranker"""
+    from index_store import index_version
+    from entity_index import alias_version
+    vector_store.get()
+    # Retrieval results are only valid for the index they came from
+    return QueryCache(
+        "retrieval",
+        max_size=QUERY_CACHE_SIZE,
+        ttl=RETRIEVAL_CACHE_TTL,
+        version=((index_version(INDEX_DIR) or "fallback") + (f":{RERANK_MODEL}" if RERANK else "")
+                 + (f":{alias_version()}" if ENTITY_SEARCH else "")
+                 + (f":window{NEIGHBOR_WINDOW}" if NEIGHBOR_WINDOW else "")),
+        db_path=CACHE_DB
+    )
+
+def load_reranker():
+    """Load the cross-encoder reranking search results"""
+    from reranker import Reranker, cross_encoder_scorer
+    return Reranker(cross_encoder_scorer(RERANK_MODEL), budget=RERANK_BUDGET, version=RERANK_MODEL)
+
+def load_context_compressor():
+    """Load the sentence index of the vector store's chunks, for compressing prompts"""
+    from context_compression import ContextCompressor, load_or_build_sentence_index
+    embeddings = query_embeddings.get()
+    llm_tokenizer = tokenizer.get()
+
+    def count_tokens(texts):
+        return [len(ids) for ids in llm_tokenizer(texts, add_special_tokens=False)["input_ids"]]
+    return ContextCompressor(
+        embeddings,
+        count_tokens,
+        max_tokens=CONTEXT_TOKENS,
+        sentence_index=load_or_build_sentence_index(
+            INDEX_DIR, vector_store.get(), embedding_pipeline(f"{INDEX_DIR}.sentences.vectors").embed
+        )
+    )
+
+def load_tokenizer():
+    """Load the language model's tokenizer"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(LLM_MODEL)
+
+def load_llm():
+    """
+    Load the language model as a local generator.
     
-    # Check if directory exists
-    if not os.path.exists(rag_dir):
-        print(f"WARNING: Directory {rag_dir} not found!")
-        print(f"Creating directory: {rag_dir}")
-        os.makedirs(rag_dir, exist_ok=True)
-        
-        # Use fallback data
-        print("Using fallback data since no documents were found")
-        for item in FALLBACK_DATA:
-            doc = Document(page_content=item["content"], metadata=item["metadata"])
-            documents.append(doc)
-        return documents
-    
-    # Try to load documents from files
+    Uses a small model, quantized to int8, to fit within memory and CPU
+    constraints. The fixed beginnings of the prompts are encoded once here,
+    so each generation only encodes its passages and question. Only
+    generation needs it, so a server that only lists passages never loads it.
+    """
+    from local_llm import LocalGenerator, default_prefixes
+    return LocalGenerator(
+        LLM_MODEL,
+        tokenizer=tokenizer.get(),
+        quantize=LLM_QUANTIZE,
+        max_new_tokens=MAX_NEW_TOKENS,
+        max_total_tokens=LLM_MAX_TOTAL_TOKENS,
+        prefixes=default_prefixes(),
+        threads=LLM_THREADS
+    )
+
+def load_qa_chain():
+    """
+    Build the conversational retrieval chain.
+    
+    The chain has no memory of its own: each call passes its session's
+    history, so users never share or interleave histories.
+    """
+    from langchain.chains import ConversationalRetrievalChain
+    from local_llm import LocalLLM
+    from retrieval import GenerationTimer, SearchFunctionRetriever
+    return ConversationalRetrievalChain.from_llm(
+        llm=LocalLLM(generator=llm.get(), callbacks=[GenerationTimer()]),
+        retriever=SearchFunctionRetriever(search=search_context, k=CHAIN_PASSAGES)
+    )
+
+query_embeddings = LazyComponent("embeddings", load_query_embeddings)
+vector_store = LazyComponent("vector_store", load_vector_store)
+lexical_index = LazyComponent("lexical_index", load_lexical_index)
+entity_index = LazyComponent("entity_index", load_entity_index)
+neighbors = LazyComponent("neighbors", load_neighbors)
+# Vector ids per book and chapter, for book-scoped and spoiler-safe searches
+partitions = LazyComponent("partitions", load_partitions)
+retrieval_cache = LazyComponent("retrieval_cache", load_retrieval_cache)
+reranker = LazyComponent("reranker", load_reranker)
+context_compressor = LazyComponent("context_compressor", load_context_compressor)
+tokenizer = LazyComponent("tokenizer", load_tokenizer)
+llm = LazyComponent("llm", load_llm)
+qa_chain = LazyComponent("qa_chain", load_qa_chain)
+
+COMPONENTS = [
+    query_embeddings, vector_store, lexical_index, entity_index, partitions, retrieval_cache, reranker,
+    neighbors, context_compressor, tokenizer, llm, qa_chain
+]
+# Needed to answer questions with passages; generation loads the rest
+SEARCH_COMPONENTS = [query_embeddings, vector_store, partitions, retrieval_cache] + (
+    [lexical_index] if HYBRID_SEARCH else []
+) + ([entity_index] if ENTITY_SEARCH else []) + ([reranker] if RERANK else []) + (
+    [neighbors] if NEIGHBOR_WINDOW else []
+) + ([context_compressor] if COMPRESS_CONTEXT else [])
+
+def start_warm_up():
+    """Load the search components (and the LLM if WARM_UP_LLM) in the background"""
+    if WARM_UP:
+        warm_up(SEARCH_COMPONENTS + ([tokenizer, llm, qa_chain] if WARM_UP_LLM else []))
+
+def ready_status():
+    """Report whether questions can be answered without loading anything"""
+    return readiness(COMPONENTS, required=SEARCH_COMPONENTS)
+
+def search_batch(questions, k, scope=None):
+    """Find the k most relevant passages for each of several questions within a scope"""
+    from retrieval import batch_similarity_search, hybrid_batch_search
+    search_params = partitions.get().search_params(scope)
+    if not HYBRID_SEARCH and not ENTITY_SEARCH:
+        return batch_similarity_search(
+            vector_store.get(), query_embeddings.get(), questions, k=k, search_params=search_params
+        )
+    scope_ids = partitions.get().docstore_ids(scope) if scope else None
+    bm25 = lexical_index.get() if HYBRID_SEARCH else None
+    entities = entity_index.get() if ENTITY_SEARCH else None
+    return hybrid_batch_search(
+        vector_store.get(), query_embeddings.get(), bm25, questions, k=k, fetch_k=SEARCH_FETCH_K,
+        search_params=search_params,
+        lexical_mask=bm25.row_mask(scope_ids) if bm25 is not None and scope else None,
+        entity_index=entities,
+        entity_mask=entities.row_mask(scope_ids) if entities is not None and scope else None
+    )
+
+# Concurrent requests share one encoder call and one FAISS search
+search_scheduler = BatchScheduler(
+    search_batch,
+    max_batch_size=SEARCH_BATCH_SIZE,
+    max_wait=SEARCH_MAX_WAIT
+)
+
+def rerank(question, candidates, k):
+    """Keep the k best candidates by cross-encoder score, or the first k if reranking fails"""
     try:
-        file_count = 0
-        for filename in os.listdir(rag_dir):
-            if filename.endswith('.json'):
-                file_count += 1
-                filepath = os.path.join(rag_dir, filename)
-                try:
-                    with open(filepath, 'r') as f:
-                        data = json.load(f)
-                        chunks = data.get('chunks', [])
-                        for chunk in chunks:
-                            content = chunk.get('content', '')
-                            metadata = chunk.get('metadata', {})
-                            doc = Document(page_content=content, metadata=metadata)
-                            documents.append(doc)
-                except Exception as e:
-                    print(f"Error loading file {filepath}: {str(e)}")
-        
-        print(f"Processed {file_count} files, loaded {len(documents)} documents")
-        
-        # If no documents were loaded, use fallback data
-        if not documents:
-            print("No documents were loaded from files, using fallback data")
-            for item in FALLBACK_DATA:
-                doc = Document(page_content=item["content"], metadata=item["metadata"])
-                documents.append(doc)
+        return reranker.get().rerank(question, candidates, k)
     except Exception as e:
-        print(f"Error loading documents: {str(e)}")
-        # Use fallback data
-        print("Using fallback data due to error")
-        for item in FALLBACK_DATA:
-            doc = Document(page_content=item["content"], metadata=item["metadata"])
-            documents.append(doc)
-    
-    return documents
-
-print("Loading embeddings...")
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-print("Loading documents...")
-documents = load_documents()
-print(f"Loaded {len(documents)} documents")
-
-print("Creating vector store...")
-vector_store = FAISS.from_documents(documents, embeddings)
-print("Vector store created successfully")
-
-# Initialize language model for text generation
-# Using a smaller model to ensure it fits within memory constraints
-model_name = "distilgpt2"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForCausalLM.from_pretrained(model_name)
-pipe = pipeline(
-    "text-generation",
-    model=model,
-    tokenizer=tokenizer,
-    max_new_tokens=512
-)
-local_llm = HuggingFacePipeline(pipeline=pipe)
-
-# Set up conversation memory and retrieval chain
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-qa_chain = ConversationalRetrievalChain.from_llm(
-    llm=local_llm,
-    retriever=vector_store.as_retriever(search_kwargs={"k": 4}),
-    memory=memory
+        print(f"Error reranking, keeping the search order: {str(e)}")
+        return candidates[:k]
+
+def expand(docs):
+    """Expand passages to their neighboring chunks, or keep them if expansion fails"""
+    if not NEIGHBOR_WINDOW:
+        return docs
+    try:
+        return neighbors.get().expand(docs, NEIGHBOR_WINDOW)
+    except Exception as e:
+        print(f"Error expanding passages, keeping the chunks: {str(e)}")
+        return docs
+
+def search(question, k, scope=None):
+    """Find the k most relevant passages for a question, reranking over-fetched candidates if RERANK"""
+    if not RERANK:
+        return expand(search_scheduler.search(question, k, scope))
+    return expand(rerank(question, search_scheduler.search(question, max(k, RERANK_FETCH_K), scope), k))
+
+def compress(question, docs):
+    """Shrink passages to the sentences most relevant to a question, for the generation prompt"""
+    if not COMPRESS_CONTEXT:
+        return docs
+    try:
+        return context_compressor.get().compress(question, docs)
+    except Exception as e:
+        print(f"Error compressing context, keeping the full passages: {str(e)}")
+        return docs
+
+def search_context(question, k, scope=None):
+    """Find the passages for a question and compress them into the generation context"""
+    return compress(question, search(question, k, scope))
+
+# Per-session conversation history
+sessions = SessionStore(
+    max_turns=SESSION_MAX_TURNS,
+    max_history_tokens=SESSION_MAX_TOKENS,
+    idle_timeout=SESSION_IDLE_TIMEOUT,
+    max_sessions=MAX_SESSIONS,
+    count_tokens=lambda text: len(tokenizer.get().encode(text))
 )
 
-def answer_question(question):
+def format_response(question, docs):
+    """Format retrieved passages as the answer shown to the user"""
+    if not docs:
+        return "I couldn't find any information about that in the Game of Thrones books."
+    
+    response = f"Here's what I found about '{question}':\n\n"
+    for i, doc in enumerate(docs, 1):
+        source = doc.metadata.get('book_title', 'Game of Thrones')
+        chapter = doc.metadata.get('chapter', 'Unknown chapter')
+        content = doc.page_content
+        print(f"Doc {i}: {source}, {chapter}, content length: {len(content)}")
+        response += f"From {source} ({chapter}):\n{content}\n\n"
+    return response
+
+def retrieve(question, k, scope=None):
+    """Find the k most relevant passages for a question, using the retrieval cache"""
+    cache = retrieval_cache.get()
+    cache_key = (normalize_question(question), k) if scope is None else (normalize_question(question), k, scope)
+    docs = cache.get(cache_key)
+    if docs is None:
+        print(f"Searching for: '{question}'" + (f" in {scope}" if scope else ""))
+        docs = search(question, k, scope)
+        cache.set(cache_key, docs)
+    else:
+        print(f"Retrieval cache hit for: '{question}'")
+    print(f"Found {len(docs)} relevant documents")
+    return docs
+
+def answer_question(question, book=None, up_to_book=None):
     """Simple question answering function with detailed logging"""
+    from partitions import search_scope
     print(f"Received question: '{question}'")
     
     if not question or question.strip() == "":
         return "I didn't receive a question. Please try again."
     
     try:
-        # Get relevant documents
-        print(f"Searching for: '{question}'")
-        docs = vector_store.similarity_search(question, k=2)
-        print(f"Found {len(docs)} relevant documents")
+        with timed("answer_question"):
+            # Get relevant documents
+            docs = retrieve(question, k=2, scope=search_scope(book=book, up_to_book=up_to_book))
+            return format_response(question, docs)
+    except Exception as e:
+        print(f"Error answering question: {str(e)}")
+        return f"Sorry, I encountered an error: {str(e)}"
+
+def converse(question, session_id):
+    """
+    Answer a question in the context of a conversation.
+    
+    Args:
+        question: The user's question
+        session_id: Id of the conversation
+        
+    Returns:
+        The generated answer
+    """
+    if not question or question.strip() == "":
+        return "I didn't receive a question. Please try again."
+    
+    session = sessions.get(session_id)
+    try:
+        # One request at a time per session, so turns are recorded in order
+        with session.lock:
+            result = qa_chain.get()({"question": question, "chat_history": session.history()})
+            session.add_turn(question, result["answer"])
+        return result["answer"]
+    except Exception as e:
+        print(f"Error in conversation {session_id}: {str(e)}")
+        return f"Sorry, I encountered an error: {str(e)}"
+
+def converse_handler(question, request: gr.Request):
+    """Gradio handler for the conversation, keyed by the browser session"""
+    return converse(question, request.session_hash)
+
+def answer_questions(questions, k=2, generate=False):
+    """
+    Answer many questions at once, for offline jobs such as evaluation runs.
+    
+    Questions not in the retrieval cache are embedded in one encoder call
+    and searched with one batched FAISS search. With generate=True, answers
+    are produced by the local LLM one prompt at a time.
+    A failure affects only the questions it concerns.
+    
+    Args:
+        questions: List of questions
+        k: Number of passages to retrieve per question
+        generate: Generate answers with the LLM instead of listing passages
         
-        if not docs:
-            return "I couldn't find any information about that in the Game of Thrones books."
+    Returns:
+        One dict per question, in input order, with 'question', 'answer',
+        'sources' (book_title, chapter and content of each passage) and
+        'error' (None on success)
+    """
+    from retrieval import build_prompt
+    results = [{"question": q, "answer": None, "sources": [], "error": None} for q in questions]
+    cache = retrieval_cache.get()
+    docs_by_item = {}
+    to_search = []
+    cache_hits = 0
+    for i, question in enumerate(questions):
+        if not isinstance(question, str) or not question.strip():
+            results[i]["error"] = "Empty question"
+            continue
+        docs = cache.get((normalize_question(question), k))
+        if docs is None:
+            to_search.append(i)
+        else:
+            docs_by_item[i] = docs
+            cache_hits += 1
+    
+    if to_search:
+        try:
+            found = search_batch([questions[i] for i in to_search], max(k, RERANK_FETCH_K) if RERANK else k)
+            if RERANK:
+                found = [rerank(questions[i], docs, k) for i, docs in zip(to_search, found)]
+            found = [expand(docs) for docs in found]
+            for i, docs in zip(to_search, found):
+                cache.set((normalize_question(questions[i]), k), docs)
+                docs_by_item[i] = docs
+        except Exception as e:
+            print(f"Error in batch search: {str(e)}")
+            for i in to_search:
+                results[i]["error"] = f"Search failed: {str(e)}"
+    print(f"Batch of {len(questions)} questions: {len(to_search)} searched, "
+          f"{cache_hits} from cache")
+    
+    answered = sorted(docs_by_item)
+    for i in answered:
+        results[i]["sources"] = [
+            {
+                "book_title": doc.metadata.get('book_title', 'Game of Thrones'),
+                "chapter": doc.metadata.get('chapter', 'Unknown chapter'),
+                "content": doc.page_content,
+            }
+            for doc in docs_by_item[i]
+        ]
+    
+    if not generate:
+        for i in answered:
+            results[i]["answer"] = format_response(questions[i], docs_by_item[i])
+        return results
+    
+    generator = llm.get()
+    for i in answered:
+        try:
+            prompt = build_prompt(questions[i], compress(questions[i], docs_by_item[i]))
+            with timed("generation"):
+                results[i]["answer"] = generator.generate(prompt).strip()
+        except Exception as e:
+            print(f"Error generating answer: {str(e)}")
+            results[i]["error"] = f"Generation failed: {str(e)}"
+    return results
+
+def stream_events(question, k=2, book=None, up_to_book=None):
+    """
+    Answer a question as a stream of events, for low time-to-first-byte.
+    
+    The retrieved passages are yielded as soon as the search finishes, then
+    the generated answer is yielded token by token as the model produces it.
+    
+    Args:
+        question: The user's question
+        k: Number of passages to retrieve
+        book: Only search this book (title or number)
+        up_to_book: Only search up to this book, to avoid spoilers
         
-        # Format response
-        response = f"Here's what I found about '{question}':\n\n"
-        for i, doc in enumerate(docs, 1):
-            source = doc.metadata.get('book_title', 'Game of Thrones')
-            chapter = doc.metadata.get('chapter', 'Unknown chapter')
-            content = doc.page_content
-            print(f"Doc {i}: {source}, {chapter}, content length: {len(content)}")
-            response += f"From {source} ({chapter}):\n{content}\n\n"
+    Yields:
+        Dicts with a 'type' of 'passages' (with 'passages'), 'token' (with
+        'text'), 'error' (with 'message') or 'done'
+    """
+    from partitions import search_scope
+    from retrieval import build_prompt
+    if not question or question.strip() == "":
+        yield {"type": "error", "message": "I didn't receive a question. Please try again."}
+        return
+    
+    try:
+        docs = retrieve(question, k, scope=search_scope(book=book, up_to_book=up_to_book))
+        yield {
+            "type": "passages",
+            "passages": [
+                {
+                    "book_title": doc.metadata.get('book_title', 'Game of Thrones'),
+                    "chapter": doc.metadata.get('chapter', 'Unknown chapter'),
+                    "content": doc.page_content,
+                }
+                for doc in docs
+            ]
+        }
         
-        return response
+        prompt = build_prompt(question, compress(question, docs))
+        generation_start = time.perf_counter()
+        for text in llm.get().stream(prompt):
+            yield {"type": "token", "text": text}
+        record("generation", time.perf_counter() - generation_start)
+        yield {"type": "done"}
     except Exception as e:
-        print(f"Error answering question: {str(e)}")
-        return f"Sorry, I encountered an error: {str(e)}"
+        print(f"Error streaming answer: {str(e)}")
+        yield {"type": "error", "message": f"Sorry, I encountered an error: {str(e)}"}
+
+def stream_answer(question, book, up_to_book):
+    """Gradio handler streaming the passages and then the generated answer"""
+    passages = ""
+    answer = ""
+    book = None if book == ALL_BOOKS else book
+    up_to_book = None if up_to_book == ALL_BOOKS else up_to_book
+    for event in stream_events(question, book=book, up_to_book=up_to_book):
+        if event["type"] == "passages":
+            passages = "".join(
+                f"From {p['book_title']} ({p['chapter']}):\n{p['content']}\n\n"
+                for p in event["passages"]
+            )
+            yield passages
+        elif event["type"] == "token":
+            answer += event["text"]
+            yield f"{passages}Answer:{answer}"
+        elif event["type"] == "error":
+            yield event["message"]
+
+def answer_questions_text(text, generate):
+    """Gradio handler for the batch tab: one question per line"""
+    questions = [line.strip() for line in text.splitlines() if line.strip()]
+    return answer_questions(questions, generate=generate)
 
 # Create Gradio Interface
 with gr.Blocks() as demo:
@@ -171,6 +604,30 @@ with gr.Blocks() as demo:
         answer_output = gr.Textbox(lines=10)
         submit_btn = gr.Button("Ask")
         submit_btn.click(answer_question, inputs=question_input, outputs=answer_output)
+        with gr.Row():
+            book_input = gr.Dropdown(BOOK_CHOICES, value=ALL_BOOKS, label="Only search this book")
+            spoiler_input = gr.Dropdown(BOOK_CHOICES, value=ALL_BOOKS, label="No spoilers after")
+        generate_btn = gr.Button("Ask and generate answer")
+        generate_btn.click(
+            stream_answer,
+            inputs=[question_input, book_input, spoiler_input],
+            outputs=answer_output,
+            api_name="stream"
+        )
+        converse_btn = gr.Button("Continue conversation")
+        converse_btn.click(converse_handler, inputs=question_input, outputs=answer_output, api_name="converse")
+    
+    with gr.Tab("Batch"):
+        batch_input = gr.Textbox(lines=8, placeholder="One question per line...")
+        generate_checkbox = gr.Checkbox(label="Generate answers with the language model")
+        batch_output = gr.JSON()
+        batch_btn = gr.Button("Ask all")
+        batch_btn.click(
+            answer_questions_text,
+            inputs=[batch_input, generate_checkbox],
+            outputs=batch_output,
+            api_name="batch"
+        )
     
     with gr.Tab("API"):
         gr.Markdown("""
@@ -184,8 +641,18 @@ with gr.Blocks() as demo:
           "data": ["Your question here"]
         }
         ```
+        
+        Batch questions (one per line) go to `https://willhcurry-gotbot.hf.space/api/batch`:
+        ```json
+        {
+          "data": ["Who is Jon Snow?\\nWhere is Harrenhal?", false]
+        }
+        ```
         """)
 
 # Launch the app
 if __name__ == "__main__":
+    # Queuing is required for streaming (generator) handlers
+    start_warm_up()
+    demo.queue()
     demo.launch() 
\ No newline at end of file
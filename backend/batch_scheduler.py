@@ -0,0 +1,147 @@
+"""
+Game of Thrones Search Batch Scheduler
+
+This module batches the similarity searches of concurrent requests. Rather
+than each request embedding its question and searching FAISS on its own, a
+scheduler thread collects the questions arriving within a few milliseconds
+(up to a maximum batch size), embeds them in one encoder call, runs one
+batched index search and hands each waiting request its own results.
+
+Encoder calls and FAISS searches cost little more for a batch than for a
+single query, so under concurrent load this multiplies retrieval throughput
+at the price of at most max_wait extra latency.
+
+Usage:
+    from batch_scheduler import BatchScheduler
+
+    scheduler = BatchScheduler(
+        lambda questions, k, scope: batch_similarity_search(vector_store, embeddings, questions, k=k),
+        max_batch_size=16, max_wait=0.005
+    )
+    docs = scheduler.search("Who is Jon Snow?", k=4)
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+class BatchScheduler:
+    """
+    Collects concurrent searches into batches run by a background thread.
+
+    Attributes:
+        max_batch_size: Maximum number of questions searched together
+        max_wait: Seconds to wait for more questions after the first one
+        batches: Number of batched searches run
+        questions: Number of questions searched
+    """
+
+    def __init__(
+        self,
+        search_batch: Callable[[List[str], int, Optional[Hashable]], List[List[Any]]],
+        max_batch_size: int = 16,
+        max_wait: float = 0.005,
+    ):
+        """
+        Start the scheduler thread.
+
+        Args:
+            search_batch: Function returning the k best results within a
+                scope for each of a list of questions, in order
+            max_batch_size: Maximum number of questions searched together
+            max_wait: Seconds to wait for more questions after the first one;
+                0 only batches questions that are already waiting
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.questions = 0
+        self._search_batch = search_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def search(self, question: str, k: int = 4, scope: Optional[Hashable] = None) -> List[Any]:
+        """
+        Search for a question, blocking until its batch has run.
+
+        Args:
+            question: The question to search for
+            k: Number of results
+            scope: Restricts the search (see partitions.search_scope), or
+                None to search everything; questions of the same batch are
+                searched together per scope
+
+        Returns:
+            The k best results for the question
+        """
+        future: Future = Future()
+        self._queue.put((question, k, scope, future))
+        return future.result()
+
+    def _collect(self) -> List[tuple]:
+        """Wait for a question, then gather more until the batch is full or max_wait passes."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size and batch[-1] is not None:
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        """Run batches until close() is called."""
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                self._run(batch)
+            if stop:
+                return
+
+    def _run(self, batch: List[tuple]) -> None:
+        """Search one batch, one call per scope, and deliver the results."""
+        groups: Dict[Any, List[tuple]] = {}
+        for item in batch:
+            groups.setdefault(item[2], []).append(item)
+        for scope, items in groups.items():
+            # Repeated questions are searched once, with the largest k asked for
+            unique = list(dict.fromkeys(question for question, _, _, _ in items))
+            k = max(k for _, k, _, _ in items)
+            try:
+                results = dict(zip(unique, self._search_batch(unique, k, scope)))
+            except Exception as e:
+                for _, _, _, future in items:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.questions += len(items)
+            for question, item_k, _, future in items:
+                future.set_result(results[question][:item_k])
+
+    def close(self) -> None:
+        """Stop the scheduler thread after the queued searches have run."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the scheduler's counters.
+
+        Returns:
+            Dictionary with batches, questions and the average batch size
+        """
+        return {
+            "batches": self.batches,
+            "questions": self.questions,
+            "average_batch_size": self.questions / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,284 @@
+"""
+Game of Thrones RAG Benchmark
+
+This module replays a question set against the bot at several levels of
+concurrency and reports, for each level:
+- Throughput (answered questions per second) and end-to-end p50/p95/p99
+- The p50/p95/p99 of each pipeline stage (query embedding, FAISS search,
+  BM25 and entity search, reranking, neighbor expansion, compression,
+  prompt assembly, generation), read from the in-process stage metrics
+  (see metrics.py)
+and, once per run, the startup breakdown (time to load each model and
+index) and the peak resident memory of the process.
+
+Two targets are measured:
+1. app: The Gradio app's answer_question (retrieval only, no LLM)
+2. bot: GameOfThronesBot.ask with a stub LLM (fully offline), a small local
+   model run int8 on CPU (see local_llm.py), or the Hugging Face Hub model
+
+Caches are cleared before each concurrency level, so every level starts
+cold; with --rounds above 1 the later rounds show the cached path.
+
+Usage:
+    # Retrieval path of the app
+    $ python backend/benchmark.py --target app --concurrency 1 4 8
+
+    # GameOfThronesBot.ask offline, with a stub LLM taking 50ms per call
+    $ python backend/benchmark.py --target bot --llm stub --concurrency 1 4
+
+    # ... with distilgpt2 generating locally, saving the results to compare runs
+    $ python backend/benchmark.py --target bot --llm local --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+from concurrent.futures import ThreadPoolExecutor
+from langchain.llms.base import LLM
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from metrics import latency_summary, metrics
+
+# Default question set, mixing characters, places and events
+QUESTIONS = [
+    "Who is Jon Snow?",
+    "Who are Jon Snow's parents?",
+    "What happened at the Red Wedding?",
+    "Who killed Joffrey?",
+    "Where is Winterfell?",
+    "What is the Night's Watch?",
+    "Who is the Hand of the King at the start of the story?",
+    "How did Daenerys hatch her dragons?",
+    "What are the words of House Stark?",
+    "Who is Ser Barristan Selmy?",
+    "Where is Harrenhal?",
+    "What is Valyrian steel?",
+    "Why was Ned Stark executed?",
+    "Who are the Others?",
+    "What happened to Bran at Winterfell?",
+    "Who rules the Iron Islands?",
+]
+# Stages reported per concurrency level, in pipeline order
+PIPELINE_STAGES = (
+    "embed", "search", "lexical_search", "entity_search", "rerank", "expand", "compress", "prompt", "generation",
+    "answer_question", "ask",
+)
+# Responses of answer_question and GameOfThronesBot.ask to a failed request
+ERROR_PREFIXES = ("Sorry, I encountered an error", "I'm sorry, I encountered an error")
+
+class StubLLM(LLM):
+    """LLM answering every prompt with the same text after a fixed delay, for runs without a model."""
+
+    answer: str = "Jon Snow is a member of the Night's Watch."
+    delay: float = 0.05
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        time.sleep(self.delay)
+        return self.answer
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_load(ask: Callable[[int, str], Any], questions: Sequence[str], concurrency: int) -> Dict[str, Any]:
+    """
+    Send questions with a fixed number of requests in flight.
+
+    Args:
+        ask: Function answering the i-th question; raising counts as an error
+        questions: Questions to send, in order
+        concurrency: Requests in flight at once
+
+    Returns:
+        Dictionary with 'concurrency', 'requests', 'errors', 'seconds',
+        'throughput_qps' and the latency_summary of successful requests
+    """
+    def timed_ask(item: Tuple[int, str]) -> Tuple[float, bool]:
+        start = time.perf_counter()
+        try:
+            ask(*item)
+            return time.perf_counter() - start, True
+        except Exception as e:
+            print(f"Error answering '{item[1]}': {str(e)}")
+            return time.perf_counter() - start, False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed_ask, enumerate(questions)))
+    seconds = time.perf_counter() - start
+    latencies = [latency for latency, ok in outcomes if ok]
+    return {
+        "concurrency": concurrency,
+        "requests": len(outcomes),
+        "errors": len(outcomes) - len(latencies),
+        "seconds": seconds,
+        "throughput_qps": len(latencies) / seconds if seconds else 0.0,
+        **latency_summary(latencies),
+    }
+
+def run_benchmark(
+    ask: Callable[[int, str], Any],
+    questions: Sequence[str],
+    concurrency_levels: Sequence[int],
+    rounds: int = 1,
+    reset: Optional[Callable[[], None]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Run the question set at each concurrency level.
+
+    Args:
+        ask: Function answering the i-th question
+        questions: The question set
+        concurrency_levels: Requests in flight, one run per value
+        rounds: Times the question set is sent per run
+        reset: Function clearing caches before each run, or None
+
+    Returns:
+        One run_load result per level, with the summary of each pipeline
+        stage recorded during the run under 'stages'
+    """
+    results = []
+    for concurrency in concurrency_levels:
+        if reset is not None:
+            reset()
+        metrics.reset()
+        result = run_load(ask, list(questions) * rounds, concurrency)
+        result["stages"] = {
+            stage: {key: value for key, value in summary.items() if key != "buckets"}
+            for stage, summary in metrics.snapshot(list(PIPELINE_STAGES)).items()
+        }
+        results.append(result)
+    return results
+
+def _check_answer(answer: str) -> str:
+    """Raise for the error responses of answer_question and GameOfThronesBot.ask."""
+    if answer.startswith(ERROR_PREFIXES):
+        raise RuntimeError(answer)
+    return answer
+
+def load_app() -> Tuple[Callable[[int, str], Any], Callable[[], None], Dict[str, float]]:
+    """
+    Import the Gradio app and load its search components.
+
+    Returns:
+        Tuple of (ask function, cache reset function, startup seconds per
+        step; a component's time includes the components it loads)
+    """
+    # Load components here, in order, rather than in the background
+    os.environ.setdefault("GOTBOT_WARM_UP", "0")
+    start = time.time()
+    import app
+    startup = {"import": time.time() - start}
+    for component in app.SEARCH_COMPONENTS:
+        component.get()
+        startup[component.name] = component.seconds
+
+    def reset():
+        app.query_embedding_cache.clear()
+        app.retrieval_cache.get().clear()
+    return (lambda i, question: _check_answer(app.answer_question(question))), reset, startup
+
+def load_bot(
+    llm: str = "stub",
+    model_name: str = "distilgpt2",
+    stub_delay: float = 0.05,
+    **bot_options: Any,
+) -> Tuple[Callable[[int, str], Any], Callable[[], None], Dict[str, float]]:
+    """
+    Create a GameOfThronesBot.
+
+    Args:
+        llm: 'stub' (StubLLM), 'local' (model_name run with local_llm)
+            or 'hub' (model_name on the Hugging Face Hub)
+        model_name: The language model
+        stub_delay: Seconds each stub LLM call takes
+        **bot_options: Further GameOfThronesBot arguments
+
+    Returns:
+        Tuple of (ask function, cache reset function, startup seconds per
+        step)
+    """
+    from chatbot import GameOfThronesBot
+    bot_llm = StubLLM(delay=stub_delay) if llm == "stub" else None
+    metrics.reset()
+    start = time.time()
+    bot = GameOfThronesBot(
+        model_name=model_name, llm=bot_llm, llm_backend="local" if llm == "local" else "hub", **bot_options
+    )
+    startup = {"total": time.time() - start}
+    startup.update(
+        (stage, summary["total_s"]) for stage, summary in metrics.snapshot().items()
+        if stage.startswith("load:")
+    )
+
+    def reset():
+        bot.query_embeddings.cache.clear()
+        bot.answer_cache.clear()
+        if bot.semantic_cache is not None:
+            bot.semantic_cache.clear()
+    # A session per request, so no answer depends on another's history
+    return (lambda i, question: _check_answer(bot.ask(question, session_id=f"benchmark-{i}"))), reset, startup
+
+def format_report(results: List[Dict[str, Any]], startup: Dict[str, float], rss_mb: float) -> str:
+    """Describe a benchmark run as tables."""
+    lines = ["Startup:"]
+    lines += [f"  {step:<24} {seconds:>8.2f}s" for step, seconds in startup.items()]
+    lines.append(f"Peak RSS: {rss_mb:.0f} MB")
+    for result in results:
+        lines.append(
+            f"\nConcurrency {result['concurrency']}: {result['requests']} requests, {result['errors']} errors, "
+            f"{result['throughput_qps']:.2f} q/s"
+        )
+        lines.append(f"  {'stage':<16} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        rows = [("end-to-end", {"count": result['requests'] - result['errors'], **result})]
+        rows += list(result["stages"].items())
+        for stage, summary in rows:
+            lines.append(
+                f"  {stage:<16} {summary['count']:>6} {summary['p50_ms']:>9.2f} "
+                f"{summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f}"
+            )
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline")
+    parser.add_argument("--target", choices=["app", "bot"], default="app", help="Entry point to benchmark")
+    parser.add_argument("--questions", help="File with one question per line (default: built-in set)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Requests in flight")
+    parser.add_argument("--rounds", type=int, default=1, help="Times the question set is sent per level")
+    parser.add_argument("--llm", choices=["stub", "local", "hub"], default="stub", help="LLM of the bot target")
+    parser.add_argument("--llm-model", default="distilgpt2", help="Model of the local or hub LLM")
+    parser.add_argument("--stub-delay", type=float, default=0.05, help="Seconds per stub LLM call")
+    parser.add_argument("--rerank", action="store_true", help="Rerank with a cross-encoder (bot target)")
+    parser.add_argument("--compress", action="store_true", help="Compress the context (bot target)")
+    parser.add_argument("--neighbor-window", type=int, default=0,
+                        help="Expand passages to this many neighboring chunks (bot target)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    questions = QUESTIONS
+    if args.questions:
+        with open(args.questions, 'r', encoding='utf-8') as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    if args.target == "app":
+        ask, reset, startup = load_app()
+    else:
+        ask, reset, startup = load_bot(
+            args.llm, args.llm_model, args.stub_delay,
+            rerank=args.rerank, compress_context=args.compress, neighbor_window=args.neighbor_window,
+        )
+    results = run_benchmark(ask, questions, args.concurrency, rounds=args.rounds, reset=reset)
+    rss_mb = peak_rss_mb()
+    print(format_report(results, startup, rss_mb))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"target": args.target, "startup": startup, "peak_rss_mb": rss_mb, "results": results}, f, indent=2)
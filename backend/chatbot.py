@@ -7,7 +7,7 @@ needed to:
 1. Process user queries about Game of Thrones
 2. Retrieve relevant context from the book corpus
 3. Generate accurate, book-based responses
-4. Maintain conversation context
+4. Maintain conversation context for each chat session
 
 The chatbot uses LangChain components to implement a production-ready RAG system
 with vector search capabilities.
@@ -26,13 +26,31 @@ import os
 import json
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.llms import HuggingFaceHub
 from langchain.chains import ConversationalRetrievalChain
 from langchain.document_loaders.text import TextLoader
-from langchain.memory import ConversationBufferMemory
 from langchain.docstore.document import Document
 from typing import List, Dict, Optional, Any, Union
+from chunk_store import BINARY_SUFFIX, list_chunk_files, load_chunk_file
+from chunker import default_chunker, model_token_counter
+from index_store import index_version, list_source_files, load_or_update_index
+from embedding_pipeline import EmbeddingPipeline
+from query_cache import CachedQueryEmbeddings, QueryCache, normalize_question
+from semantic_cache import SemanticCache
+from retrieval import (
+    GenerationTimer, SearchFunctionRetriever, batch_similarity_search, build_prompt, hybrid_batch_search
+)
+from lexical_index import load_or_build_lexical_index
+from entity_index import alias_version, load_entity_index
+from partitions import PartitionIndex, search_scope
+from batch_scheduler import BatchScheduler
+from session_store import SessionStore
+from onnx_embeddings import ONNX_MODEL_DIR, OnnxEmbeddings
+from metrics import timed
+from local_llm import LocalGenerator, LocalLLM, default_prefixes
+from reranker import RERANK_MODEL, Reranker, cross_encoder_scorer
+from neighbors import NeighborIndex
+from context_compression import CONTEXT_TOKENS, ContextCompressor, load_or_build_sentence_index
 
 class GameOfThronesBot:
     """
@@ -41,14 +59,23 @@ class GameOfThronesBot:
     This class manages the complete RAG pipeline:
     1. Loading and managing document embeddings
     2. Storing and retrieving vectors efficiently
-    3. Maintaining conversation context
+    3. Maintaining bounded conversation context per session
     4. Generating contextually relevant responses using an LLM
     
     Attributes:
         embeddings: The embedding model used for text vectorization
+        query_embeddings: The embedding model with cached query embeddings
         vector_store: FAISS vector database for similarity search
-        memory: Conversation memory buffer for context retention
+        lexical_index: BM25 index fused with vector search results, or None
+        partitions: Vector ids per book and chapter, for scoped searches
+        search_scheduler: Batches the searches of concurrent questions
+        reranker: Cross-encoder reordering over-fetched passages, or None
+        context_compressor: Shrinks passages to their most relevant
+            sentences before generation, or None
+        sessions: Conversation history of each chat session
         qa_chain: The retrieval and generation chain
+        answer_cache: Cache of answers to questions asked without history
+        semantic_cache: Cache of answers to paraphrased questions, or None
     """
     
     def __init__(
@@ -57,6 +84,35 @@ class GameOfThronesBot:
         books_dir: str = "input",
         rag_chunks_dir: str = "output/rag_chunks",
         model_name: str = "HuggingFaceH4/zephyr-7b-beta",
+        cache_size: int = 1024,
+        cache_ttl: Optional[float] = 3600,
+        cache_db: Optional[str] = None,
+        semantic_cache_threshold: Optional[float] = None,
+        semantic_cache_size: int = 1000,
+        semantic_cache_eviction: str = "lru",
+        session_max_turns: int = 5,
+        session_max_tokens: Optional[int] = 1000,
+        session_idle_timeout: Optional[float] = 1800,
+        max_sessions: int = 1000,
+        search_batch_size: int = 16,
+        search_max_wait: float = 0.005,
+        hybrid_search: bool = True,
+        search_fetch_k: int = 20,
+        entity_search: bool = True,
+        ann_index: Optional[Dict[str, Any]] = None,
+        rerank: bool = False,
+        rerank_fetch_k: int = 50,
+        rerank_budget: Optional[float] = 0.25,
+        neighbor_window: int = 0,
+        compress_context: bool = False,
+        context_tokens: int = CONTEXT_TOKENS,
+        llm: Optional[Any] = None,
+        llm_backend: str = "hub",
+        llm_max_total_tokens: Optional[int] = None,
+        llm_threads: Optional[int] = None,
+        embedding_backend: str = "torch",
+        onnx_model_dir: str = ONNX_MODEL_DIR,
+        onnx_threads: Optional[int] = None,
     ):
         """
         Initialize the Game of Thrones chatbot.
@@ -65,90 +121,272 @@ class GameOfThronesBot:
             vector_store_path: Path to store/load FAISS index
             books_dir: Directory containing book text files
             rag_chunks_dir: Directory containing pre-processed RAG chunks
-            model_name: Name of the HuggingFace model to use
+            model_name: Name of the HuggingFace model to use (with llm, the
+                model whose tokenizer budgets compressed passages)
+            cache_size: Maximum entries in the query embedding and answer caches
+            cache_ttl: Seconds a cached answer stays valid, or None for no expiry
+            cache_db: SQLite file to keep caches across restarts, or None
+            semantic_cache_threshold: Cosine similarity at which a paraphrased
+                question reuses a cached answer (e.g. 0.95), or None to
+                disable; with entity_search, the question must also name the
+                same entities
+            semantic_cache_size: Maximum questions in the semantic cache
+            semantic_cache_eviction: Semantic cache eviction policy
+                ('lru', 'lfu' or 'fifo')
+            session_max_turns: Maximum conversation turns kept per session
+            session_max_tokens: Maximum tokens of history kept per session
+            session_idle_timeout: Seconds before an unused session is dropped
+            max_sessions: Maximum number of sessions kept
+            search_batch_size: Maximum questions searched in one batch
+            search_max_wait: Seconds a search waits for others to batch with
+            hybrid_search: Fuse BM25 keyword results with vector results
+            search_fetch_k: Candidates taken from each retriever when fusing
+            entity_search: Fuse the chunks mentioning the characters, houses
+                and places a question names (see entity_index.py)
+            ann_index: Approximate index settings (see
+                index_store.load_or_update_index), or None for exact search
+            rerank: Rerank search results with a cross-encoder
+            rerank_fetch_k: Candidates searched for the reranker
+            rerank_budget: Seconds a rerank may take before the search order
+                is kept, or None for no limit
+            neighbor_window: Expand each passage to this many chunks on
+                either side of it in its chapter (see neighbors.py); 0 to
+                keep single chunks
+            compress_context: Keep only the passage sentences most similar
+                to the question in the generation prompt
+            context_tokens: Maximum tokens of compressed passages
+            llm: LangChain LLM to use instead of model_name on the Hugging
+                Face Hub, e.g. a local pipeline or benchmark.StubLLM
+            llm_backend: 'hub' to call model_name on the Hugging Face Hub, or
+                'local' to run it on CPU, int8 quantized and with cached
+                prompt prefixes (see local_llm.py); use a small model such
+                as distilgpt2
+            llm_max_total_tokens: With the local backend, the cap on prompt
+                plus generated tokens (default: the model's context length)
+            llm_threads: With the local backend, PyTorch intra-op threads
+            embedding_backend: 'torch' for the default HuggingFaceEmbeddings
+                model, or 'onnx' for int8 all-MiniLM-L6-v2 run with ONNX
+                Runtime (see onnx_embeddings.py); switching rebuilds the index
+            onnx_model_dir: Directory of the exported ONNX model
+            onnx_threads: ONNX Runtime intra-op threads (default: one per core)
         """
-        self.embeddings = HuggingFaceEmbeddings()
-        
-        # Try to load existing vector store or create a new one
-        if os.path.exists(vector_store_path):
-            self.vector_store = FAISS.load_local(vector_store_path, self.embeddings)
-        else:
-            # Try to load from pre-processed chunks first
-            documents = self._load_rag_chunks(rag_chunks_dir)
-            
-            # If no chunks available, process raw book files
-            if not documents:
-                documents = self._load_book_files(books_dir)
-                
-            if documents:
-                self.vector_store = FAISS.from_documents(documents, self.embeddings)
-                # Save for future use
-                self.vector_store.save_local(vector_store_path)
+        with timed("load:embeddings"):
+            if embedding_backend == "onnx":
+                self.embeddings = OnnxEmbeddings(onnx_model_dir, threads=onnx_threads)
             else:
-                raise ValueError("No documents found to create vector store")
+                self.embeddings = HuggingFaceEmbeddings()
+            # Vectors of different backends must not be mixed in one index
+            embedding_version = getattr(self.embeddings, 'version', self.embeddings.model_name)
+            self.query_embeddings = CachedQueryEmbeddings(
+                self.embeddings,
+                QueryCache("query_embeddings", max_size=cache_size, ttl=None,
+                           version=embedding_version, db_path=cache_db)
+            )
+        
+        # Load the persisted vector store, updating it for any changed sources.
+        # Pre-processed chunks are preferred over raw book files.
+        source_files = (
+            list_chunk_files(rag_chunks_dir)
+            or list_source_files(books_dir, ('.txt',))
+        )
+        with timed("load:vector_store"):
+            self.vector_store = load_or_update_index(
+                vector_store_path,
+                source_files,
+                self.query_embeddings,
+                embedding_version,
+                self._load_source_file,
+                embed_texts=EmbeddingPipeline(
+                    embedding_version,
+                    checkpoint_path=f"{vector_store_path}.vectors",
+                    model=self.embeddings.client,
+                ).embed,
+                ann=ann_index,
+            )
+        
+        self.search_fetch_k = search_fetch_k
+        with timed("load:lexical_index"):
+            self.lexical_index = (
+                load_or_build_lexical_index(vector_store_path, self.vector_store)
+                if hybrid_search else None
+            )
+        with timed("load:entity_index"):
+            self.entity_index = (
+                load_entity_index(rag_chunks_dir, vector_store_path, self.vector_store)
+                if entity_search else None
+            )
+        self.partitions = PartitionIndex.from_vector_store(self.vector_store)
+        
+        # Concurrent questions share one encoder call and one FAISS search
+        self.search_scheduler = BatchScheduler(
+            self._search_batch,
+            max_batch_size=search_batch_size,
+            max_wait=search_max_wait,
+        )
+        self.rerank_fetch_k = rerank_fetch_k
+        self.reranker = (
+            Reranker(cross_encoder_scorer(), budget=rerank_budget) if rerank else None
+        )
+        self.neighbor_window = neighbor_window
+        self.neighbors = NeighborIndex.from_vector_store(self.vector_store) if neighbor_window else None
+        self.context_compressor = None
+        if compress_context:
+            self.context_compressor = ContextCompressor(
+                self.query_embeddings,
+                model_token_counter(model_name),
+                max_tokens=context_tokens,
+                sentence_index=load_or_build_sentence_index(
+                    vector_store_path, self.vector_store, self.embeddings.embed_documents
+                ),
+            )
+        
+        # Answers depend on the index, the reranker, compression and the LLM
+        self.answer_cache = QueryCache(
+            "answers",
+            max_size=cache_size,
+            ttl=cache_ttl,
+            version=(f"{index_version(vector_store_path)}:{RERANK_MODEL if rerank else ''}:"
+                     f"{context_tokens if compress_context else ''}:{model_name}:{llm_backend}:"
+                     f"{alias_version() if entity_search else ''}:{neighbor_window}"),
+            db_path=cache_db
+        )
+        self.semantic_cache = None
+        if semantic_cache_threshold is not None:
+            self.semantic_cache = SemanticCache(
+                self.query_embeddings,
+                threshold=semantic_cache_threshold,
+                capacity=semantic_cache_size,
+                eviction=semantic_cache_eviction,
+                key=self.entity_index.match if self.entity_index is not None else None,
+            )
         
         # Initialize LLM
-        self.llm = HuggingFaceHub(
+        if llm is None and llm_backend == "local":
+            with timed("load:llm"):
+                llm = LocalLLM(generator=LocalGenerator(
+                    model_name,
+                    max_total_tokens=llm_max_total_tokens,
+                    prefixes=default_prefixes(),
+                    threads=llm_threads,
+                ))
+        self.llm = llm or HuggingFaceHub(
             repo_id=model_name,
             model_kwargs={"temperature": 0.7, "max_length": 512}
         )
+        # Passed to every chain and LLM call, so each LLM call is timed
+        self._callbacks = [GenerationTimer()]
         
-        # Set up memory and conversation chain
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        # Set up per-session history and the conversation chain. The chain
+        # has no memory of its own; each call passes its session's history,
+        # so one chain serves every session.
+        self.sessions = SessionStore(
+            max_turns=session_max_turns,
+            max_history_tokens=session_max_tokens,
+            idle_timeout=session_idle_timeout,
+            max_sessions=max_sessions,
+        )
         self.qa_chain = ConversationalRetrievalChain.from_llm(
             llm=self.llm,
-            retriever=self.vector_store.as_retriever(search_kwargs={"k": 4}),
-            memory=self.memory,
+            retriever=SearchFunctionRetriever(search=self._search_context, k=4),
+            return_source_documents=True,
         )
     
-    def _load_rag_chunks(self, rag_chunks_dir: str) -> List[Document]:
+    def _search_batch(
+        self, questions: List[str], k: int, scope: Optional[tuple] = None
+    ) -> List[List[Document]]:
         """
-        Load pre-processed RAG chunks from JSON files.
+        Find the k most relevant chunks for each of several questions.
         
         Args:
-            rag_chunks_dir: Directory containing RAG chunk JSON files
+            questions: Questions to search for
+            k: Number of chunks per question
+            scope: Part of the saga to search (see partitions.search_scope),
+                or None to search everything
             
         Returns:
-            List of Document objects ready for vector embedding
+            One list of Documents per question, in input order
         """
-        documents = []
-        if os.path.exists(rag_chunks_dir):
-            for filename in os.listdir(rag_chunks_dir):
-                if filename.endswith('.json'):
-                    filepath = os.path.join(rag_chunks_dir, filename)
-                    with open(filepath, 'r') as f:
-                        data = json.load(f)
-                        chunks = data.get('chunks', [])
-                        for chunk in chunks:
-                            content = chunk.get('content', '')
-                            metadata = chunk.get('metadata', {})
-                            doc = Document(page_content=content, metadata=metadata)
-                            documents.append(doc)
-        return documents
-    
-    def _load_book_files(self, books_dir: str) -> List[Document]:
+        search_params = self.partitions.search_params(scope)
+        if self.lexical_index is None and self.entity_index is None:
+            return batch_similarity_search(
+                self.vector_store, self.query_embeddings, questions, k=k, search_params=search_params
+            )
+        lexical_mask = entity_mask = None
+        if scope is not None:
+            scope_ids = self.partitions.docstore_ids(scope)
+            if self.lexical_index is not None:
+                lexical_mask = self.lexical_index.row_mask(scope_ids)
+            if self.entity_index is not None:
+                entity_mask = self.entity_index.row_mask(scope_ids)
+        return hybrid_batch_search(
+            self.vector_store, self.query_embeddings, self.lexical_index,
+            questions, k=k, fetch_k=self.search_fetch_k,
+            search_params=search_params, lexical_mask=lexical_mask,
+            entity_index=self.entity_index, entity_mask=entity_mask
+        )
+    
+    def _search(self, question: str, k: int, scope: Optional[tuple] = None) -> List[Document]:
+        """Find the k most relevant chunks for a question, reranking over-fetched candidates."""
+        if self.reranker is None:
+            return self._expand(self.search_scheduler.search(question, k, scope))
+        candidates = self.search_scheduler.search(question, max(k, self.rerank_fetch_k), scope)
+        return self._expand(self.reranker.rerank(question, candidates, k))
+    
+    def _expand(self, docs: List[Document]) -> List[Document]:
+        """Expand chunks to their neighbor windows, if enabled."""
+        if self.neighbors is None:
+            return docs
+        return self.neighbors.expand(docs, self.neighbor_window)
+    
+    def _compress(self, question: str, docs: List[Document]) -> List[Document]:
+        """Shrink passages to the sentences most relevant to a question, if enabled."""
+        if self.context_compressor is None:
+            return docs
+        return self.context_compressor.compress(question, docs)
+    
+    def _search_context(self, question: str, k: int, scope: Optional[tuple] = None) -> List[Document]:
+        """Find the chunks for a question, compressed for the generation prompt."""
+        return self._compress(question, self._search(question, k, scope))
+    
+    def _chain(self, scope: Optional[tuple]) -> ConversationalRetrievalChain:
+        """Get the conversation chain, retrieving only within a scope."""
+        if scope is None:
+            return self.qa_chain
+        # Shares the LLM chains; only the retriever differs
+        return ConversationalRetrievalChain(
+            combine_docs_chain=self.qa_chain.combine_docs_chain,
+            question_generator=self.qa_chain.question_generator,
+            retriever=SearchFunctionRetriever(search=self._search_context, k=4, scope=scope),
+            return_source_documents=True,
+        )
+    
+    def _load_source_file(self, path: str) -> List[Document]:
         """
-        Load and process raw book text files.
+        Load the documents of a single source file.
+        
+        RAG chunk files (JSON or binary chunk store) are used as-is; raw
+        book text files are split into chunks the same way convert_books.py
+        splits EPUB books.
         
         Args:
-            books_dir: Directory containing book text files
+            path: Path to a RAG chunk file or a book text file
             
         Returns:
             List of Document objects ready for vector embedding
         """
-        documents = []
-        if os.path.exists(books_dir):
-            for filename in os.listdir(books_dir):
-                if filename.endswith('.txt'):
-                    loader = TextLoader(os.path.join(books_dir, filename))
-                    documents.extend(loader.load())
-            
-            # Split into chunks
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-            documents = text_splitter.split_documents(documents)
-        return documents
+        if path.endswith(('.json', BINARY_SUFFIX)):
+            return load_chunk_file(path)
+        
+        documents = TextLoader(path).load()
+        return default_chunker(model_name=self.embeddings.model_name).split_documents(documents)
     
-    def ask(self, question: str) -> str:
+    def ask(
+        self,
+        question: str,
+        session_id: str = "default",
+        book: Optional[Union[str, int]] = None,
+        up_to_book: Optional[Union[str, int]] = None,
+    ) -> str:
         """
         Process a user question and generate a response using RAG.
         
@@ -159,24 +397,175 @@ class GameOfThronesBot:
         
         Args:
             question: The user's question about Game of Thrones
+            session_id: Id of the conversation the question belongs to
+            book: Only search this book (title or number)
+            up_to_book: Only search this book and the ones before it, so
+                the answer contains no spoilers from later books
             
         Returns:
             Generated response based on book knowledge
         """
+        with timed("ask"):
+            return self.ask_with_sources(question, session_id, book, up_to_book)["answer"]
+    
+    def ask_with_sources(
+        self,
+        question: str,
+        session_id: str = "default",
+        book: Optional[Union[str, int]] = None,
+        up_to_book: Optional[Union[str, int]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Answer a question and return the source documents used.
+        
+        At the start of a conversation the answer does not depend on any
+        history, so it is served from the answer cache for repeated
+        questions, or from the semantic cache for paraphrases of questions
+        already answered, without calling the LLM. Fresh answers are stored
+        in both caches. The semantic cache only holds unscoped answers.
+        
+        Requests of different sessions run concurrently; requests of the same
+        session run one at a time so its turns are recorded in order.
+        
+        Args:
+            question: The user's question about Game of Thrones
+            session_id: Id of the conversation the question belongs to
+            book: Only search this book (title or number)
+            up_to_book: Only search this book and the ones before it
+            
+        Returns:
+            Dictionary with the 'answer' and its 'sources' (Documents)
+        """
         if not question or question.strip() == "":
-            return "Please ask a question about Game of Thrones."
+            return {"answer": "Please ask a question about Game of Thrones.", "sources": []}
         
+        scope = search_scope(book=book, up_to_book=up_to_book)
+        use_semantic_cache = self.semantic_cache is not None and scope is None
+        session = self.sessions.get(session_id)
         try:
-            # Process through the QA chain
-            response = self.qa_chain({"question": question})
-            return response["answer"]
+            with session.lock:
+                history = session.history()
+                stateless = not history
+                if stateless:
+                    cache_key = self._answer_key(question, scope)
+                    cached = self.answer_cache.get(cache_key)
+                    if cached is None and use_semantic_cache:
+                        hit = self.semantic_cache.lookup(question)
+                        if hit is not None:
+                            cached = {"answer": hit["answer"], "sources": hit["sources"]}
+                    if cached is not None:
+                        # Keep the conversation as if the chain had run
+                        session.add_turn(question, cached["answer"])
+                        return cached
+                
+                # Process through the QA chain
+                response = self._chain(scope)(
+                    {"question": question, "chat_history": history}, callbacks=self._callbacks
+                )
+                result = {"answer": response["answer"], "sources": response.get("source_documents", [])}
+                session.add_turn(question, result["answer"])
+                if stateless:
+                    self.answer_cache.set(cache_key, result)
+                    if use_semantic_cache:
+                        self.semantic_cache.add(question, result["answer"], result["sources"])
+                return result
         except Exception as e:
-            return f"I'm sorry, I encountered an error: {str(e)}"
+            return {"answer": f"I'm sorry, I encountered an error: {str(e)}", "sources": []}
+    
+    def _answer_key(self, question: str, scope: Optional[tuple]) -> Any:
+        """Key of a question's answer in the answer cache."""
+        key = normalize_question(question)
+        return key if scope is None else (key, scope)
     
-    def reset_conversation(self) -> None:
+    def ask_many(
+        self,
+        questions: List[str],
+        k: int = 4,
+        book: Optional[Union[str, int]] = None,
+        up_to_book: Optional[Union[str, int]] = None,
+    ) -> List[Dict[str, Any]]:
         """
-        Reset the conversation history.
+        Answer many independent questions at once, for offline jobs.
         
-        This clears the memory buffer, starting a fresh conversation context.
+        Questions are answered without conversation history. Cached answers
+        are reused; the remaining questions are embedded in one encoder call,
+        searched with one batched FAISS search and sent to the LLM as one
+        batch. A failure affects only the questions it concerns.
+        
+        Args:
+            questions: List of questions about Game of Thrones
+            k: Number of passages to retrieve per question
+            book: Only search this book (title or number)
+            up_to_book: Only search this book and the ones before it
+            
+        Returns:
+            One dict per question, in input order, with 'question', 'answer',
+            'sources' (Documents) and 'error' (None on success)
+        """
+        scope = search_scope(book=book, up_to_book=up_to_book)
+        use_semantic_cache = self.semantic_cache is not None and scope is None
+        results = [{"question": q, "answer": None, "sources": [], "error": None} for q in questions]
+        pending = []
+        for i, question in enumerate(questions):
+            if not isinstance(question, str) or not question.strip():
+                results[i]["error"] = "Empty question"
+                continue
+            cached = self.answer_cache.get(self._answer_key(question, scope))
+            if cached is None and use_semantic_cache:
+                cached = self.semantic_cache.lookup(question)
+            if cached is not None:
+                results[i].update(answer=cached["answer"], sources=cached["sources"])
+            else:
+                pending.append(i)
+        
+        if not pending:
+            return results
+        try:
+            if self.reranker is None:
+                found = self._search_batch([questions[i] for i in pending], k, scope)
+            else:
+                found = [
+                    self.reranker.rerank(questions[i], docs, k)
+                    for i, docs in zip(pending, self._search_batch(
+                        [questions[i] for i in pending], max(k, self.rerank_fetch_k), scope
+                    ))
+                ]
+            found = [self._expand(docs) for docs in found]
+        except Exception as e:
+            for i in pending:
+                results[i]["error"] = f"Search failed: {str(e)}"
+            return results
+        
+        prompts = [build_prompt(questions[i], self._compress(questions[i], docs)) for i, docs in zip(pending, found)]
+        try:
+            answers = [generation[0].text for generation in self.llm.generate(prompts, callbacks=self._callbacks).generations]
+        except Exception:
+            # Retry one by one so a single bad prompt does not fail the batch
+            answers = []
+            for prompt in prompts:
+                try:
+                    answers.append(self.llm(prompt, callbacks=self._callbacks))
+                except Exception as e:
+                    answers.append(e)
+        
+        for i, docs, answer in zip(pending, found, answers):
+            if isinstance(answer, Exception):
+                results[i].update(sources=docs, error=f"Generation failed: {str(answer)}")
+                continue
+            answer = answer.strip()
+            results[i].update(answer=answer, sources=docs)
+            self.answer_cache.set(self._answer_key(questions[i], scope), {"answer": answer, "sources": docs})
+            if use_semantic_cache:
+                self.semantic_cache.add(questions[i], answer, docs)
+        return results
+    
+    def reset_conversation(self, session_id: str = "default") -> None:
+        """
+        Reset the conversation history of a session.
+        
+        This drops the session's history, starting a fresh conversation context.
+        
+        Args:
+            session_id: Id of the conversation to reset
         """
-        self.memory.clear()
\ No newline at end of file
+        self.sessions.reset(session_id)
\ No newline at end of file
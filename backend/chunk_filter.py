@@ -0,0 +1,365 @@
+"""
+Game of Thrones Chunk Filter
+
+This module removes chunks that only add noise to retrieval: front and back
+matter (title pages, dedications, tables of contents, copyright notices,
+"About the Author") and chunks repeated within or across books. Every such
+chunk would otherwise be embedded, take space in the index and could crowd
+real passages out of the few retrieved for a question.
+
+Duplicates are found in two ways:
+1. Exact: The same text after lowercasing and collapsing whitespace
+2. Near: 64-bit SimHash fingerprints of word shingles that differ in at most
+   a few bits, found through 8-bit bands (two fingerprints within 7 bits
+   share at least one of their 8 bands), confirmed by the Jaccard
+   similarity of the two chunks' shingle sets and by their capitalized
+   words: SimHash alone also pairs short appendix entries differing in a
+   name or title ("King Joffrey's banner ..." / "King Tommen's banner
+   ..."), which are distinct facts.
+
+The first occurrence of a duplicated chunk is kept, so books are processed
+in a fixed order.
+
+Filtered chunks are marked by default, with the reason in their 'filtered'
+metadata; dropping them is opt-in, since it deletes text from the chunk
+files.
+
+Usage:
+    from chunk_filter import filter_chunk_files
+
+    report = filter_chunk_files(list_chunk_files("output/rag_chunks"))
+    print(format_report(report))
+
+    # Mark filtered chunks in existing chunk files (--drop removes them):
+    $ python backend/chunk_filter.py output/rag_chunks
+"""
+
+import re
+import sys
+import hashlib
+import numpy as np
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+from chunk_store import BINARY_SUFFIX, JSON_SUFFIX, chunk_writer, list_chunk_files, load_chunk_file
+
+# Chapter names of front and back matter
+BOILERPLATE_CHAPTERS = re.compile(
+    r"^(contents?|table of contents|copyright|dedication|title page|cover|"
+    r"acknowledge?ments?|about the author|(other books|also) by\b.*|praise for\b.*)$"
+)
+# Phrases that only occur in publishing boilerplate
+BOILERPLATE_PHRASES = re.compile(
+    r"\b(is a work of fiction|all rights reserved|isbn|library of congress|sold his first story)\b"
+)
+# Chunks with fewer words are headings and signatures
+MIN_CHUNK_WORDS = 8
+# A chunk whose lines are nearly all short, without commas, quotes or
+# sentence punctuation is a list of titles (a table of contents), not prose,
+# dialogue or an appendix entry
+LIST_MIN_LINES = 5
+LIST_SHORT_LINE_WORDS = 6
+LIST_SHORT_LINE_SHARE = 0.8
+_NOT_A_TITLE = re.compile(r'[,.?!…"“”]')
+SHINGLE_WORDS = 5
+# Edits of a word or two change up to about 5 bits; distinct chunks differ
+# in 20 or more
+NEAR_DUPLICATE_BITS = 6
+# Share of shingles near-duplicates have in common: a one word edit keeps
+# about 85% of a passage's, 80% of a one-line entry's
+NEAR_DUPLICATE_JACCARD = 0.8
+_BANDS = 8
+_BAND_BITS = 64 // _BANDS
+
+def _normalize(text: str) -> str:
+    """Lowercase a title and collapse whitespace for matching."""
+    return re.sub(r'\s+', ' ', text.strip().lower())
+
+def _words(text: str) -> List[str]:
+    """Lowercase words of a text."""
+    return re.findall(r"\w+", text.lower())
+
+def _names(text: str) -> Set[str]:
+    """Lowercase forms of a text's capitalized words: names, titles and sentence starts."""
+    return {word.lower() for word in re.findall(r"\w+", text) if word[0].isupper()}
+
+def shingle_hashes(text: str, shingle_words: int = SHINGLE_WORDS) -> np.ndarray:
+    """
+    Hash the word shingles of a text.
+
+    Args:
+        text: The text
+        shingle_words: Words per shingle
+
+    Returns:
+        8-byte hashes (dtype 'S8'), one per shingle in text order
+    """
+    words = _words(text)
+    shingles = [
+        ' '.join(words[i:i + shingle_words])
+        for i in range(max(1, len(words) - shingle_words + 1))
+    ]
+    return np.array(
+        [hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest() for shingle in shingles],
+        dtype='S8'
+    )
+
+def simhash(text: str, shingle_words: int = SHINGLE_WORDS, hashes: Optional[np.ndarray] = None) -> int:
+    """
+    Compute the 64-bit SimHash of a text's word shingles.
+
+    Similar texts get fingerprints differing in few bits.
+
+    Args:
+        text: The text
+        shingle_words: Words per shingle
+        hashes: The text's shingle_hashes, if already computed
+
+    Returns:
+        The fingerprint as an unsigned 64-bit integer
+    """
+    if hashes is None:
+        hashes = shingle_hashes(text, shingle_words)
+    bits = np.unpackbits(np.frombuffer(hashes.tobytes(), dtype=np.uint8).reshape(-1, 8), axis=1)
+    # Each bit is set where most shingle hashes have it set
+    majority = bits.sum(axis=0) * 2 > len(hashes)
+    return int.from_bytes(np.packbits(majority).tobytes(), 'big')
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Compute the Jaccard similarity of two sets of hashes.
+
+    Args:
+        a: Sorted unique hashes
+        b: Sorted unique hashes
+
+    Returns:
+        Size of the intersection over size of the union
+    """
+    common = len(np.intersect1d(a, b, assume_unique=True))
+    return common / (len(a) + len(b) - common)
+
+def boilerplate_reason(content: str, chapter: str = "", book_title: str = "") -> Optional[str]:
+    """
+    Decide whether a chunk is front or back matter rather than story text.
+
+    Chunks under a chapter named like the book itself come before the first
+    chapter heading: the title page and the dedication.
+
+    Args:
+        content: The chunk text
+        chapter: The chunk's chapter name
+        book_title: The title of the chunk's book
+
+    Returns:
+        The kind of boilerplate ('front/back matter', 'too short' or
+        'list'), or None for a chunk worth indexing
+    """
+    chapter = _normalize(chapter)
+    if BOILERPLATE_CHAPTERS.match(chapter) or (chapter and _normalize(book_title).startswith(chapter)):
+        return "front/back matter"
+    if BOILERPLATE_PHRASES.search(content.lower()):
+        return "front/back matter"
+    if len(_words(content)) < MIN_CHUNK_WORDS:
+        return "too short"
+    lines = [line for line in content.splitlines() if line.strip()]
+    short = sum(1 for line in lines if len(_words(line)) <= LIST_SHORT_LINE_WORDS and not _NOT_A_TITLE.search(line))
+    if len(lines) >= LIST_MIN_LINES and short >= LIST_SHORT_LINE_SHARE * len(lines):
+        return "list"
+    return None
+
+class ChunkFilter:
+    """
+    Finds boilerplate and duplicate chunks among the chunks shown to it.
+
+    Attributes:
+        near_duplicate_bits: Maximum differing SimHash bits of near-duplicates
+        near_duplicate_jaccard: Minimum shingle Jaccard similarity of
+            near-duplicates
+        stats: Counter with 'chunks' and 'bytes' seen, and the number and
+            bytes of filtered chunks per reason
+    """
+
+    def __init__(self, near_duplicate_bits: int = NEAR_DUPLICATE_BITS, near_duplicate_jaccard: float = NEAR_DUPLICATE_JACCARD):
+        """
+        Create a filter that has seen no chunks.
+
+        Args:
+            near_duplicate_bits: Maximum differing SimHash bits for chunks to
+                count as near-duplicates (0 to only drop exact duplicates);
+                at most 7 so that near-duplicates share a band
+            near_duplicate_jaccard: Minimum Jaccard similarity of the shingle
+                sets of near-duplicates
+        """
+        if not 0 <= near_duplicate_bits < _BANDS:
+            raise ValueError(f"near_duplicate_bits must be between 0 and {_BANDS - 1}")
+        self.near_duplicate_bits = near_duplicate_bits
+        self.near_duplicate_jaccard = near_duplicate_jaccard
+        self.stats: Counter = Counter()
+        self._exact: Dict[str, str] = {}
+        self._bands: Dict[Tuple[int, int], List[Tuple[int, str]]] = {}
+        # Sorted unique shingle hashes, words and capitalized words of each kept chunk, by ref
+        self._kept: Dict[str, Tuple[np.ndarray, Set[str], Set[str]]] = {}
+
+    def _near_duplicate(self, fingerprint: int, content: Tuple[np.ndarray, Set[str], Set[str]]) -> Optional[str]:
+        """
+        Find a kept chunk whose fingerprint is within near_duplicate_bits,
+        whose shingles are similar enough and which has the same names.
+        """
+        shingles, words, names = content
+        seen = set()
+        for band in range(_BANDS):
+            key = (band, (fingerprint >> (_BAND_BITS * band)) & 0xFF)
+            for other, ref in self._bands.get(key, ()):
+                if ref in seen or bin(fingerprint ^ other).count('1') > self.near_duplicate_bits:
+                    continue
+                seen.add(ref)
+                other_shingles, other_words, other_names = self._kept[ref]
+                if jaccard(shingles, other_shingles) < self.near_duplicate_jaccard:
+                    continue
+                # A name or title only one of them has makes them different facts
+                if (words ^ other_words) & (names | other_names):
+                    continue
+                return ref
+        return None
+
+    def check(self, content: str, metadata: Dict[str, Any], ref: str = "") -> Optional[str]:
+        """
+        Decide whether to filter a chunk, remembering it if it is kept.
+
+        Args:
+            content: The chunk text
+            metadata: The chunk metadata ('chapter' and 'book_title' are used)
+            ref: Name of the chunk in reports (e.g. "book#12")
+
+        Returns:
+            Why the chunk is filtered ('duplicate of <ref>', 'near-duplicate
+            of <ref>' or a boilerplate_reason), or None to keep it
+        """
+        size = len(content.encode('utf-8'))
+        self.stats['chunks'] += 1
+        self.stats['bytes'] += size
+
+        reason = boilerplate_reason(
+            content, str(metadata.get('chapter', '')), str(metadata.get('book_title', ''))
+        )
+        if reason is None:
+            key = hashlib.sha1(' '.join(content.lower().split()).encode('utf-8')).hexdigest()
+            if key in self._exact:
+                reason, kind = f"duplicate of {self._exact[key]}", "duplicate"
+            else:
+                hashes = shingle_hashes(content)
+                fingerprint = simhash(content, hashes=hashes)
+                kept = (np.unique(hashes), set(_words(content)), _names(content))
+                other = self._near_duplicate(fingerprint, kept) if self.near_duplicate_bits else None
+                if other is not None:
+                    reason, kind = f"near-duplicate of {other}", "near-duplicate"
+                else:
+                    self._exact[key] = ref
+                    self._kept[ref] = kept
+                    for band in range(_BANDS):
+                        key_band = (band, (fingerprint >> (_BAND_BITS * band)) & 0xFF)
+                        self._bands.setdefault(key_band, []).append((fingerprint, ref))
+                    return None
+        else:
+            kind = reason
+
+        self.stats[f'filtered {kind}'] += 1
+        self.stats[f'filtered {kind} bytes'] += size
+        return reason
+
+def filter_chunk_files(
+    paths: List[str],
+    mark: bool = True,
+    near_duplicate_bits: int = NEAR_DUPLICATE_BITS,
+    near_duplicate_jaccard: float = NEAR_DUPLICATE_JACCARD,
+) -> Dict[str, Any]:
+    """
+    Mark or drop boilerplate and duplicate chunks of chunk files, in place.
+
+    Files are processed in the given order, so duplicates are found in
+    later books. Pass every chunk file of a directory, not only the books
+    just converted, so duplicates across books are always found. Dropping
+    renumbers the remaining chunks' chunk_index. Files without filtered
+    chunks are left untouched.
+
+    Args:
+        paths: Chunk files in either format
+        mark: Keep filtered chunks, recording the reason in their 'filtered'
+            metadata field; False drops them from the files
+        near_duplicate_bits: See ChunkFilter
+        near_duplicate_jaccard: See ChunkFilter
+
+    Returns:
+        Report with 'chunks' and 'bytes' before filtering, 'kept_chunks',
+        'saved_bytes', and the count and bytes per reason under 'reasons'
+    """
+    chunk_filter = ChunkFilter(near_duplicate_bits, near_duplicate_jaccard)
+    for path in paths:
+        docs = load_chunk_file(path)
+        book = docs[0].metadata.get('book_title', '') if docs else ''
+        kept = []
+        changed = False
+        for i, doc in enumerate(docs):
+            ref = f"{book or path}#{doc.metadata.get('chunk_index', i)}"
+            reason = chunk_filter.check(doc.page_content, doc.metadata, ref)
+            if reason is None:
+                kept.append(doc)
+            elif mark:
+                changed = changed or doc.metadata.get('filtered') != reason
+                doc.metadata['filtered'] = reason
+                kept.append(doc)
+            else:
+                changed = True
+        if not changed:
+            continue
+
+        for suffix, chunk_format in ((BINARY_SUFFIX, 'binary'), (JSON_SUFFIX, 'json')):
+            if path.endswith(suffix):
+                writer = chunk_writer(path[:-len(suffix)], book, chunk_format)
+                break
+        else:
+            raise ValueError(f"Not a chunk file: {path}")
+        try:
+            for i, doc in enumerate(kept):
+                metadata = dict(doc.metadata)
+                if not mark and 'chunk_index' in metadata:
+                    metadata['chunk_index'] = i
+                writer.add(doc.page_content, metadata)
+        except Exception:
+            writer.discard()
+            raise
+        writer.close()
+        print(f"Filtered {path}: {len(docs)} chunks, {len(docs) - len(kept)} dropped")
+
+    stats = chunk_filter.stats
+    reasons = {
+        name[len('filtered '):]: {"chunks": count, "bytes": stats[f'{name} bytes']}
+        for name, count in stats.items()
+        if name.startswith('filtered ') and not name.endswith(' bytes')
+    }
+    filtered = sum(reason["chunks"] for reason in reasons.values())
+    return {
+        "chunks": stats['chunks'],
+        "bytes": stats['bytes'],
+        "kept_chunks": stats['chunks'] - (0 if mark else filtered),
+        "saved_bytes": 0 if mark else sum(reason["bytes"] for reason in reasons.values()),
+        "reasons": reasons,
+    }
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Describe a filter_chunk_files report in a few lines."""
+    lines = [
+        f"Chunks: {report['chunks']} -> {report['kept_chunks']}, "
+        f"bytes saved: {report['saved_bytes']} of {report['bytes']}"
+    ]
+    for reason, counts in sorted(report['reasons'].items()):
+        lines.append(f"  {reason}: {counts['chunks']} chunks, {counts['bytes']} bytes")
+    return '\n'.join(lines)
+
+if __name__ == "__main__":
+    """
+    Filter the chunk files of the given directory (default output/rag_chunks).
+    """
+    args = [arg for arg in sys.argv[1:] if arg != '--drop']
+    rag_dir = args[0] if args else "output/rag_chunks"
+    print(format_report(filter_chunk_files(list_chunk_files(rag_dir), mark='--drop' not in sys.argv)))
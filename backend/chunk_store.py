@@ -0,0 +1,489 @@
+"""
+Game of Thrones Chunk Store
+
+This module reads and writes the RAG chunk files produced by convert_books.py.
+Two formats are supported:
+1. JSON (*_rag.json): The original human-readable format
+2. Binary chunk store (*_rag.chunks): A compact columnar format
+
+The binary chunk store keeps all chunk content in one contiguous UTF-8 blob
+addressed by an offsets array, and stores metadata column by column. String
+metadata values (book title, source file, chapter) are interned: each distinct
+value is stored once in a string table and chunks refer to it by index.
+Files are memory-mapped, so opening a store costs almost nothing and a
+chunk's content is only decoded when it is accessed: iter_chunk_file()
+decodes one chunk at a time, and a ChunkStore used as a context manager
+unmaps its file on exit.
+
+File layout (all integers little-endian):
+- 8 bytes: magic b"GOTCHNK1"
+- 8 bytes: header length
+- Header: UTF-8 JSON with the string table and column descriptions, padded
+  to a multiple of 8 bytes
+- Offsets: uint64[total_chunks + 1] into the content blob
+- One array per metadata column: int32 string table ids (-1 if missing) for
+  string and JSON columns, int64 for integer columns
+- Content blob
+
+Usage:
+    from chunk_store import ChunkStore, iter_chunk_file, list_chunk_files
+
+    with ChunkStore("output/rag_chunks/A Game Of Thrones_rag.chunks") as store:
+        print(store.content(0), store.metadata(0))
+
+    for doc in iter_chunk_file("output/rag_chunks/A Game Of Thrones_rag.chunks"):
+        print(doc.metadata["chunk_index"])
+
+    # Convert existing JSON chunk files to the binary format:
+    $ python backend/chunk_store.py output/rag_chunks
+"""
+
+import os
+import sys
+import json
+import mmap
+import shutil
+import numpy as np
+from langchain.docstore.document import Document
+from typing import Any, Dict, Iterator, List, Optional
+
+MAGIC = b"GOTCHNK1"
+FORMAT_VERSION = 1
+JSON_SUFFIX = "_rag.json"
+BINARY_SUFFIX = "_rag.chunks"
+INT_MISSING = np.iinfo(np.int64).min
+
+def chunk_key(metadata: Dict[str, Any]) -> str:
+    """Identify a chunk by its book (or source file) and chunk_index, stable from conversion to the vector store."""
+    return f"{metadata.get('book_title') or metadata.get('source', '')}#{metadata.get('chunk_index', '')}"
+
+def content_key(text: str) -> str:
+    """
+    Identify a chunk by its content: the hash the index manifest stores for
+    it (see index_store.hash_text), so a chunk has one identity across the
+    manifest, the sentence index and neighbor passages.
+    """
+    # Imported here, as index_store imports this module
+    from index_store import hash_text
+    return hash_text(text)
+
+def _align(size: int) -> int:
+    """Round a byte count up to a multiple of 8."""
+    return (size + 7) & ~7
+
+class ChunkStoreWriter:
+    """
+    Streaming writer for the binary chunk store.
+
+    Content is appended to a temporary blob file as chunks are added, so the
+    writer holds only offsets and interned metadata ids in memory. The store
+    is assembled and moved into place by close().
+
+    Attributes:
+        path: Final path of the chunk store
+        total_chunks: Number of chunks added so far
+    """
+
+    def __init__(self, path: str, book_title: str):
+        """
+        Start writing a chunk store.
+
+        Args:
+            path: Final path of the chunk store
+            book_title: Title of the book the chunks belong to
+        """
+        self.path = path
+        self.book_title = book_title
+        self.total_chunks = 0
+        self._blob = open(path + '.blob.tmp', 'wb')
+        self._offsets = [0]
+        self._strings: Dict[str, int] = {}
+        self._columns: Dict[str, Dict[str, Any]] = {}
+
+    def _intern(self, value: str) -> int:
+        """Return the string table id of a value, adding it if new."""
+        if value not in self._strings:
+            self._strings[value] = len(self._strings)
+        return self._strings[value]
+
+    def add(self, content: str, metadata: Dict[str, Any]) -> None:
+        """
+        Append one chunk.
+
+        Args:
+            content: The chunk text
+            metadata: The chunk metadata
+        """
+        data = content.encode('utf-8')
+        self._blob.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+        for name, value in metadata.items():
+            if isinstance(value, str):
+                kind, stored = 'str', self._intern(value)
+            elif isinstance(value, int) and not isinstance(value, bool):
+                kind, stored = 'int', value
+            else:
+                kind, stored = 'json', self._intern(json.dumps(value))
+
+            column = self._columns.get(name)
+            if column is None:
+                missing = INT_MISSING if kind == 'int' else -1
+                column = {"kind": kind, "values": [missing] * self.total_chunks}
+                self._columns[name] = column
+            elif column['kind'] != kind:
+                raise ValueError(f"Metadata field '{name}' mixes {column['kind']} and {kind} values")
+            column['values'].append(stored)
+
+        self.total_chunks += 1
+        for column in self._columns.values():
+            if len(column['values']) < self.total_chunks:
+                column['values'].append(INT_MISSING if column['kind'] == 'int' else -1)
+
+    def close(self) -> str:
+        """
+        Assemble the chunk store and move it to its final path.
+
+        Returns:
+            Path of the written chunk store
+        """
+        self._blob.close()
+        arrays = [np.asarray(self._offsets, dtype='<u8')]
+        columns = []
+        position = arrays[0].nbytes
+        for name, column in self._columns.items():
+            dtype = '<i8' if column['kind'] == 'int' else '<i4'
+            array = np.asarray(column['values'], dtype=dtype)
+            columns.append({"name": name, "kind": column['kind'], "offset": position})
+            arrays.append(array)
+            position = _align(position + array.nbytes)
+
+        header = json.dumps({
+            "version": FORMAT_VERSION,
+            "book_title": self.book_title,
+            "total_chunks": self.total_chunks,
+            "strings": list(self._strings),
+            "columns": columns,
+            "content_offset": position,
+        }).encode('utf-8')
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(np.uint64(len(header)).tobytes())
+            f.write(header.ljust(_align(len(header)), b' '))
+            for array in arrays:
+                f.write(array.tobytes())
+                f.write(b'\0' * (_align(array.nbytes) - array.nbytes))
+            with open(self.path + '.blob.tmp', 'rb') as blob:
+                shutil.copyfileobj(blob, f)
+        os.remove(self.path + '.blob.tmp')
+        os.replace(tmp_path, self.path)
+        return self.path
+
+    def discard(self) -> None:
+        """Abandon the store and remove any temporary files."""
+        self._blob.close()
+        for tmp_path in (self.path + '.blob.tmp', self.path + '.tmp'):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+class JsonChunkWriter:
+    """
+    Streaming writer for the JSON chunk format, with the same interface as
+    ChunkStoreWriter.
+
+    Attributes:
+        path: Final path of the JSON file
+        total_chunks: Number of chunks added so far
+    """
+
+    def __init__(self, path: str, book_title: str):
+        """
+        Start writing a JSON chunk file.
+
+        Args:
+            path: Final path of the JSON file
+            book_title: Title of the book the chunks belong to
+        """
+        self.path = path
+        self.total_chunks = 0
+        self._file = open(path + '.tmp', 'w', encoding='utf-8')
+        self._file.write(f'{{\n  "book_title": {json.dumps(book_title)},\n  "chunks": [')
+
+    def add(self, content: str, metadata: Dict[str, Any]) -> None:
+        """
+        Append one chunk.
+
+        Args:
+            content: The chunk text
+            metadata: The chunk metadata
+        """
+        separator = ',' if self.total_chunks else ''
+        self._file.write(f"{separator}\n    {json.dumps({'content': content, 'metadata': metadata})}")
+        self.total_chunks += 1
+
+    def close(self) -> str:
+        """
+        Finish the JSON document and move it to its final path.
+
+        Returns:
+            Path of the written JSON file
+        """
+        self._file.write(f'\n  ],\n  "total_chunks": {self.total_chunks}\n}}')
+        self._file.close()
+        os.replace(self.path + '.tmp', self.path)
+        return self.path
+
+    def discard(self) -> None:
+        """Abandon the file and remove the temporary output."""
+        self._file.close()
+        if os.path.exists(self.path + '.tmp'):
+            os.remove(self.path + '.tmp')
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view of a binary chunk store.
+
+    Chunks are decoded on access. Metadata string values are shared Python
+    objects taken from the store's string table, so documents built from the
+    same store do not duplicate them in memory (and pickling those documents
+    stores each value once).
+
+    Attributes:
+        path: Path of the chunk store
+        book_title: Title of the book the chunks belong to
+    """
+
+    def __init__(self, path: str):
+        """
+        Open a chunk store.
+
+        Args:
+            path: Path of the *_rag.chunks file
+
+        Raises:
+            ValueError: If the file is not a chunk store of a supported version
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a chunk store")
+
+        header_length = int(np.frombuffer(self._mmap, dtype='<u8', count=1, offset=len(MAGIC))[0])
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._mmap[header_start:header_start + header_length].decode('utf-8'))
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk store version in {path}: {header.get('version')}")
+
+        base = header_start + _align(header_length)
+        self.book_title = header['book_title']
+        self._length = header['total_chunks']
+        self._strings: List[str] = header['strings']
+        self._offsets = np.frombuffer(self._mmap, dtype='<u8', count=self._length + 1, offset=base)
+        self._columns = [
+            (
+                column['name'],
+                column['kind'],
+                np.frombuffer(
+                    self._mmap,
+                    dtype='<i8' if column['kind'] == 'int' else '<i4',
+                    count=self._length,
+                    offset=base + column['offset']
+                )
+            )
+            for column in header['columns']
+        ]
+        self._content_start = base + header['content_offset']
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __enter__(self) -> "ChunkStore":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Unmap the file. Documents built from the store stay valid, since
+        their content was decoded when they were built.
+        """
+        if self._mmap.closed:
+            return
+        # The arrays are views of the mapping, which cannot be closed while they exist
+        self._offsets = None
+        self._columns = []
+        self._mmap.close()
+
+    def content(self, i: int) -> str:
+        """
+        Decode the text of one chunk.
+
+        Args:
+            i: Row number of the chunk
+
+        Returns:
+            The chunk text
+        """
+        start = self._content_start + int(self._offsets[i])
+        end = self._content_start + int(self._offsets[i + 1])
+        return self._mmap[start:end].decode('utf-8')
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        """
+        Rebuild the metadata dictionary of one chunk.
+
+        Args:
+            i: Row number of the chunk
+
+        Returns:
+            The chunk metadata, without fields the chunk did not have
+        """
+        metadata = {}
+        for name, kind, values in self._columns:
+            value = int(values[i])
+            if kind == 'int':
+                if value != INT_MISSING:
+                    metadata[name] = value
+            elif value >= 0:
+                metadata[name] = self._strings[value] if kind == 'str' else json.loads(self._strings[value])
+        return metadata
+
+    def document(self, i: int) -> Document:
+        """
+        Build a LangChain Document for one chunk.
+
+        Args:
+            i: Row number of the chunk
+
+        Returns:
+            Document with the chunk text and metadata
+        """
+        return Document(page_content=self.content(i), metadata=self.metadata(i))
+
+    def __iter__(self) -> Iterator[Document]:
+        return (self.document(i) for i in range(self._length))
+
+    def documents(self) -> List[Document]:
+        """
+        Build Documents for every chunk in the store.
+
+        Returns:
+            List of Document objects in chunk order
+        """
+        return list(self)
+
+def chunk_writer(path: str, book_title: str, chunk_format: str = 'binary'):
+    """
+    Create a streaming chunk writer for the given output format.
+
+    Args:
+        path: Output path without the format suffix (e.g. 'output/rag_chunks/Book')
+        book_title: Title of the book the chunks belong to
+        chunk_format: 'binary' for a chunk store or 'json' for the JSON format
+
+    Returns:
+        A ChunkStoreWriter or JsonChunkWriter
+    """
+    if chunk_format == 'binary':
+        return ChunkStoreWriter(path + BINARY_SUFFIX, book_title)
+    if chunk_format == 'json':
+        return JsonChunkWriter(path + JSON_SUFFIX, book_title)
+    raise ValueError(f"Unknown chunk format: {chunk_format}")
+
+def list_chunk_files(rag_dir: str) -> List[str]:
+    """
+    List the chunk files of a directory, one per book.
+
+    When a book has both a binary chunk store and a JSON file, only the
+    binary chunk store is listed.
+
+    Args:
+        rag_dir: Directory containing chunk files
+
+    Returns:
+        Sorted list of chunk file paths, empty if the directory does not exist
+    """
+    if not os.path.exists(rag_dir):
+        return []
+    filenames = set(os.listdir(rag_dir))
+    chunk_files = []
+    for filename in sorted(filenames):
+        if filename.endswith(BINARY_SUFFIX):
+            chunk_files.append(os.path.join(rag_dir, filename))
+        elif filename.endswith('.json'):
+            stem = filename[:-len(JSON_SUFFIX)] if filename.endswith(JSON_SUFFIX) else None
+            if stem is None or stem + BINARY_SUFFIX not in filenames:
+                chunk_files.append(os.path.join(rag_dir, filename))
+    return chunk_files
+
+def iter_chunk_file(path: str) -> Iterator[Document]:
+    """
+    Read the chunks of one chunk file in either format, one at a time.
+
+    A binary chunk store is decoded chunk by chunk as the iterator advances
+    and unmapped once it is exhausted or closed.
+
+    Args:
+        path: Path of a *_rag.chunks or *_rag.json file
+
+    Yields:
+        One Document per chunk, in chunk order
+    """
+    if path.endswith(BINARY_SUFFIX):
+        with ChunkStore(path) as store:
+            yield from store
+        return
+
+    with open(path, 'r') as f:
+        data = json.load(f)
+    for chunk in data.get('chunks', []):
+        yield Document(page_content=chunk.get('content', ''), metadata=chunk.get('metadata', {}))
+
+def load_chunk_file(path: str) -> List[Document]:
+    """
+    Load the chunks of one chunk file in either format.
+
+    Args:
+        path: Path of a *_rag.chunks or *_rag.json file
+
+    Returns:
+        List of Document objects, one per chunk
+    """
+    return list(iter_chunk_file(path))
+
+def convert_json_to_binary(json_path: str) -> str:
+    """
+    Write a binary chunk store next to a JSON chunk file.
+
+    Args:
+        json_path: Path of the *_rag.json file
+
+    Returns:
+        Path of the written chunk store
+    """
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    writer = ChunkStoreWriter(json_path[:-len(JSON_SUFFIX)] + BINARY_SUFFIX, data.get('book_title', ''))
+    try:
+        for chunk in data.get('chunks', []):
+            writer.add(chunk.get('content', ''), chunk.get('metadata', {}))
+    except Exception:
+        writer.discard()
+        raise
+    return writer.close()
+
+if __name__ == "__main__":
+    """
+    Convert every JSON chunk file in the given directory (default
+    output/rag_chunks) to a binary chunk store.
+    """
+    rag_dir = sys.argv[1] if len(sys.argv) > 1 else "output/rag_chunks"
+    for filename in sorted(os.listdir(rag_dir)):
+        if filename.endswith(JSON_SUFFIX):
+            json_path = os.path.join(rag_dir, filename)
+            store_path = convert_json_to_binary(json_path)
+            print(f"{filename}: {os.path.getsize(json_path)} -> {os.path.getsize(store_path)} bytes")
@@ -0,0 +1,264 @@
+"""
+Game of Thrones Text Chunker
+
+This module splits book text into chunks for embedding, budgeted in tokens
+of the embedding model rather than characters. The embedding model only
+reads its first MAX_TOKENS tokens (256 for all-MiniLM-L6-v2), so anything
+past that in a chunk is silently ignored: the chunk is found only by its
+opening and the rest of its text never helps retrieval.
+
+Text is split into sentences, keeping paragraph breaks, and sentences are
+packed greedily into chunks of at most max_tokens tokens. Consecutive chunks
+can overlap by whole sentences, so a passage cut at a chunk boundary is
+still found in one piece. Sentences longer than a chunk are split on words.
+Token counts are computed once per distinct sentence, in one batched
+tokenizer call per text, which keeps a whole book to a single linear pass.
+
+Both convert_books.py (EPUB conversion) and chatbot.py (raw text files) use
+this chunker, so chunks look the same whichever path produced them.
+
+Usage:
+    from chunker import default_chunker
+
+    chunks = default_chunker().split(text)
+    documents = default_chunker().split_documents(documents)
+"""
+
+import re
+import threading
+from langchain.docstore.document import Document
+from typing import Callable, Dict, List, Optional, Tuple
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Tokens the embedding model reads, including its start and end tokens
+MAX_TOKENS = 256
+SPECIAL_TOKENS = 2
+OVERLAP_TOKENS = 32
+# Token counts kept between texts before the cache is cleared
+_CACHE_SIZE = 200000
+
+# Sentence ends: punctuation, optionally followed by closing quotes or brackets
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s+|(?<=[.!?…]["”’)\]])\s+')
+_LINE_BREAKS = re.compile(r'(\n\s*\n|\n)')
+
+def model_token_counter(model_name: str = EMBEDDING_MODEL) -> Callable[[List[str]], List[int]]:
+    """
+    Count tokens with the tokenizer of a Hugging Face model.
+
+    Args:
+        model_name: The embedding model
+
+    Returns:
+        Function returning the number of tokens of each of a list of texts,
+        without special tokens
+    """
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    def count_tokens(texts: List[str]) -> List[int]:
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False, verbose=False)['input_ids']]
+    return count_tokens
+
+def split_sentences(text: str) -> List[Tuple[str, str]]:
+    """
+    Split text into sentences, keeping track of paragraph breaks.
+
+    Args:
+        text: The text
+
+    Returns:
+        (separator, sentence) pairs, where separator is what joins the
+        sentence to the previous one: '' for the first, ' ' within a
+        paragraph, '\\n' after a line break or '\\n\\n' after a blank line
+    """
+    sentences = []
+    separator = ''
+    for i, part in enumerate(_LINE_BREAKS.split(text)):
+        if i % 2:
+            if sentences:
+                separator = '\n\n' if separator == '\n\n' or part.count('\n') > 1 else '\n'
+            continue
+        for sentence in _SENTENCE_END.split(part.strip()):
+            sentence = sentence.strip()
+            if sentence:
+                sentences.append((separator, sentence))
+                separator = ' '
+    return sentences
+
+def join_sentence_runs(runs: List[List[Tuple[str, str]]]) -> Tuple[List[Tuple[str, str]], List[int]]:
+    """
+    Join the sentences of consecutive chunks, dropping the sentences each
+    chunk repeats from the end of the previous one (its overlap).
+
+    Args:
+        runs: (separator, sentence) pairs of each chunk, in text order (see
+            split_sentences)
+
+    Returns:
+        Tuple of (joined pairs, number of leading sentences dropped from
+        each chunk)
+    """
+    joined: List[Tuple[str, str]] = []
+    dropped = []
+    for pairs in runs:
+        overlap = 0
+        for n in range(min(len(joined), len(pairs)), 0, -1):
+            if [sentence for _, sentence in joined[-n:]] == [sentence for _, sentence in pairs[:n]]:
+                overlap = n
+                break
+        rest = pairs[overlap:]
+        if joined and rest and not rest[0][0]:
+            # The chunk's first sentence continues the previous chunk
+            rest = [(' ', rest[0][1])] + rest[1:]
+        joined.extend(rest)
+        dropped.append(overlap)
+    return joined, dropped
+
+class Chunker:
+    """
+    Token-budgeted, sentence-aware text splitter.
+
+    Attributes:
+        max_tokens: Maximum tokens per chunk, including the model's special
+            tokens
+        overlap_tokens: Maximum tokens of whole sentences repeated from the
+            end of the previous chunk
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[List[str]], List[int]],
+        max_tokens: int = MAX_TOKENS,
+        overlap_tokens: int = OVERLAP_TOKENS,
+        special_tokens: int = SPECIAL_TOKENS,
+    ):
+        """
+        Create a chunker.
+
+        Args:
+            count_tokens: Function returning the token count of each of a
+                list of texts (see model_token_counter)
+            max_tokens: Maximum tokens per chunk, including special tokens
+            overlap_tokens: Maximum overlap between consecutive chunks, in
+                tokens; 0 for no overlap
+            special_tokens: Tokens the model adds to every text
+        """
+        if overlap_tokens >= max_tokens - special_tokens:
+            raise ValueError("overlap_tokens must be smaller than the chunk budget")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self._budget = max_tokens - special_tokens
+        self._count_tokens = count_tokens
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _token_counts(self, texts: List[str]) -> List[int]:
+        """Count the tokens of texts, tokenizing only those not seen before."""
+        with self._lock:
+            missing = list(dict.fromkeys(text for text in texts if text not in self._counts))
+            if missing:
+                if len(self._counts) + len(missing) > _CACHE_SIZE:
+                    self._counts.clear()
+                self._counts.update(zip(missing, self._count_tokens(missing)))
+            return [self._counts[text] for text in texts]
+
+    def _fit_sentences(self, sentences: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, str]], List[int]]:
+        """Split sentences over the token budget on words, and count every piece."""
+        counts = self._token_counts([sentence for _, sentence in sentences])
+        if all(count <= self._budget for count in counts):
+            return sentences, counts
+
+        pieces, piece_counts = [], []
+        for (separator, sentence), count in zip(sentences, counts):
+            if count <= self._budget:
+                pieces.append((separator, sentence))
+                piece_counts.append(count)
+                continue
+            words = sentence.split(' ')
+            start, total = 0, 0
+            for end, word_count in enumerate(self._token_counts(words)):
+                if total + word_count > self._budget and end > start:
+                    pieces.append((separator if start == 0 else ' ', ' '.join(words[start:end])))
+                    piece_counts.append(total)
+                    start, total = end, 0
+                total += word_count
+            pieces.append((separator if start == 0 else ' ', ' '.join(words[start:])))
+            piece_counts.append(total)
+        return pieces, piece_counts
+
+    def split(self, text: str) -> List[str]:
+        """
+        Split a text into chunks.
+
+        Args:
+            text: The text
+
+        Returns:
+            Chunks of at most max_tokens tokens each, in order
+        """
+        sentences, counts = self._fit_sentences(split_sentences(text))
+        chunks = []
+        start = 0
+        while start < len(sentences):
+            # Take sentences while they fit the budget
+            end, total = start, 0
+            while end < len(sentences) and (end == start or total + counts[end] <= self._budget):
+                total += counts[end]
+                end += 1
+            chunks.append(
+                sentences[start][1] + ''.join(separator + sentence for separator, sentence in sentences[start + 1:end])
+            )
+            if end == len(sentences):
+                break
+
+            # Start the next chunk with the last whole sentences that fit the overlap
+            next_start, overlap = end, 0
+            while next_start - 1 > start and overlap + counts[next_start - 1] <= self.overlap_tokens:
+                next_start -= 1
+                overlap += counts[next_start]
+            start = next_start
+        return chunks
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Split documents into chunk documents.
+
+        Args:
+            documents: The documents
+
+        Returns:
+            One document per chunk, with the metadata of its source document
+            plus its 'chunk_index' within that document
+        """
+        return [
+            Document(page_content=chunk, metadata={**document.metadata, 'chunk_index': i})
+            for document in documents
+            for i, chunk in enumerate(self.split(document.page_content))
+        ]
+
+_default_chunkers: Dict[Tuple[int, int, str], Chunker] = {}
+_default_lock = threading.Lock()
+
+def default_chunker(
+    max_tokens: int = MAX_TOKENS,
+    overlap_tokens: int = OVERLAP_TOKENS,
+    model_name: Optional[str] = None,
+) -> Chunker:
+    """
+    Get the chunker budgeted in tokens of the embedding model, created once
+    per process and settings.
+
+    Args:
+        max_tokens: Maximum tokens per chunk
+        overlap_tokens: Maximum overlap between consecutive chunks
+        model_name: Embedding model whose tokenizer counts tokens (default:
+            EMBEDDING_MODEL)
+
+    Returns:
+        The shared chunker
+    """
+    key = (max_tokens, overlap_tokens, model_name or EMBEDDING_MODEL)
+    with _default_lock:
+        if key not in _default_chunkers:
+            _default_chunkers[key] = Chunker(model_token_counter(key[2]), max_tokens, overlap_tokens)
+        return _default_chunkers[key]
@@ -0,0 +1,457 @@
+"""
+Game of Thrones Context Compression
+
+This module shrinks the passages put into the LLM prompt to the sentences
+most relevant to the question. A retrieved chunk is typically about one
+scene, while the question is about one fact in it; stuffing whole chunks
+both slows generation and, with distilgpt2's 1024-token context, gets the
+prompt truncated.
+
+Every chunk's sentences are embedded once, when the index is built, and
+stored next to the FAISS index in compressed sparse row form: the
+sentences of all chunks in one matrix, with the rows of each chunk given
+by an offsets array. Like the chunk store, sentence texts are kept in one
+UTF-8 buffer addressed by an offsets array, and what joins each sentence to
+the previous one as a one-byte code. Compressing
+a prompt then costs one matrix-vector product over the retrieved chunks'
+sentence rows. Sentences are taken best first until the token budget of
+the context is reached, and each passage keeps its kept sentences in their
+original order, with an ellipsis where sentences were left out.
+
+Passages joined from neighboring chunks (see neighbors.py) are assembled
+from their chunks' stored sentences. Chunks that are not in the stored
+index (e.g. the fallback data) are split and embedded on the fly, and kept
+in a small in-memory cache.
+
+Usage:
+    from context_compression import ContextCompressor, load_or_build_sentence_index
+
+    sentence_index = load_or_build_sentence_index("faiss_index", vector_store, embedding_pipeline.embed)
+    compressor = ContextCompressor(embeddings, count_tokens, max_tokens=384, sentence_index=sentence_index)
+    prompt = build_prompt(question, compressor.compress(question, docs))
+"""
+
+import os
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from langchain.vectorstores import FAISS
+from langchain.docstore.document import Document
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from chunker import join_sentence_runs, split_sentences
+from chunk_store import content_key
+from index_store import index_lock, read_index_meta
+from metrics import record
+from retrieval import embed_questions
+
+SENTENCE_FILE = "sentences.npz"
+# Version of the sentence file layout
+SENTENCE_FORMAT = 3
+# Separators of chunker.split_sentences, stored as their position here
+SEPARATORS = ('', ' ', '\n', '\n\n')
+# Tokens of passages put into the prompt
+CONTEXT_TOKENS = 384
+# Joins sentences that were not adjacent in the passage
+GAP_SEPARATOR = " … "
+# Sentences of chunks not in the index, kept in memory
+_CACHE_SIZE = 1000
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors to unit length, so dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class SentenceIndex:
+    """
+    Sentences of every chunk with their embeddings, in compressed sparse
+    row form.
+
+    Attributes:
+        keys: Content key of each chunk
+        indptr: Offsets of each chunk's sentences; chunk i has sentence rows
+            indptr[i] to indptr[i + 1]
+        separators: uint8 code of what joins each sentence to the previous
+            one in its chunk (an index into SEPARATORS)
+        text: UTF-8 bytes of all sentences, as a uint8 array
+        offsets: int64 byte offsets of each sentence in text; sentence i is
+            text[offsets[i]:offsets[i + 1]]
+        vectors: Unit-length float32 embedding of each sentence
+    """
+
+    def __init__(
+        self,
+        keys: np.ndarray,
+        indptr: np.ndarray,
+        separators: np.ndarray,
+        text: np.ndarray,
+        offsets: np.ndarray,
+        vectors: np.ndarray,
+    ):
+        self.keys = keys
+        self.indptr = indptr
+        self.separators = separators
+        self.text = text
+        self.offsets = offsets
+        self.vectors = vectors
+        self._rows = {key: row for row, key in enumerate(keys.tolist())}
+
+    @classmethod
+    def build(cls, texts: Iterable[str], embed_texts: Callable[[List[str]], Any]) -> "SentenceIndex":
+        """
+        Split chunks into sentences and embed them all.
+
+        Args:
+            texts: Chunk texts; repeated texts are stored once
+            embed_texts: Function embedding a list of texts
+
+        Returns:
+            The index
+        """
+        codes = {separator: code for code, separator in enumerate(SEPARATORS)}
+        keys, indptr, separators, sentences = [], [0], [], []
+        seen = set()
+        for text in texts:
+            key = content_key(text)
+            if key in seen:
+                continue
+            seen.add(key)
+            pairs = split_sentences(text)
+            keys.append(key)
+            separators.extend(codes[separator] for separator, _ in pairs)
+            sentences.extend(sentence for _, sentence in pairs)
+            indptr.append(len(sentences))
+
+        encoded = [sentence.encode('utf-8') for sentence in sentences]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        vectors = _normalize_rows(embed_texts(sentences)) if sentences else np.zeros((0, 0), dtype=np.float32)
+        return cls(
+            np.array(keys, dtype=str),
+            np.asarray(indptr, dtype=np.int64),
+            np.asarray(separators, dtype=np.uint8),
+            np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            offsets,
+            vectors,
+        )
+
+    @classmethod
+    def from_vector_store(cls, vector_store: FAISS, embed_texts: Callable[[List[str]], Any]) -> "SentenceIndex":
+        """
+        Build the index over the documents of a vector store.
+
+        Args:
+            vector_store: The FAISS vector store
+            embed_texts: Function embedding a list of texts
+
+        Returns:
+            The index
+        """
+        def texts():
+            for doc_id in vector_store.index_to_docstore_id.values():
+                doc = vector_store.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    yield doc.page_content
+        return cls.build(texts(), embed_texts)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def sentence_count(self) -> int:
+        """Number of sentences over all chunks."""
+        return len(self.offsets) - 1
+
+    def sentence(self, i: int) -> str:
+        """
+        Get the text of a sentence.
+
+        Args:
+            i: Sentence row
+
+        Returns:
+            The sentence
+        """
+        return self.text[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def lookup(self, text: str) -> Optional[Tuple[List[Tuple[str, str]], np.ndarray]]:
+        """
+        Get the sentences of a chunk.
+
+        Args:
+            text: The chunk text
+
+        Returns:
+            Tuple of ((separator, sentence) pairs, their vectors), or None
+            if the chunk is not in the index
+        """
+        return self.lookup_key(content_key(text))
+
+    def lookup_key(self, key: str) -> Optional[Tuple[List[Tuple[str, str]], np.ndarray]]:
+        """
+        Get the sentences of a chunk by its content key (see
+        chunk_store.content_key).
+
+        Args:
+            key: The chunk's content key
+
+        Returns:
+            Tuple of ((separator, sentence) pairs, their vectors), or None
+            if the chunk is not in the index
+        """
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        start, end = self.indptr[row], self.indptr[row + 1]
+        pairs = [(SEPARATORS[code], self.sentence(i))
+                 for i, code in zip(range(start, end), self.separators[start:end].tolist())]
+        return pairs, self.vectors[start:end]
+
+    def save(self, path: str, version: Optional[str] = None) -> None:
+        """
+        Write the index to a .npz file, atomically.
+
+        Args:
+            path: Target file
+            version: Version of the vector index it was built from
+        """
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(
+            tmp_path,
+            keys=self.keys,
+            indptr=self.indptr,
+            separators=self.separators,
+            text=self.text,
+            offsets=self.offsets,
+            vectors=self.vectors,
+            format=np.array(SENTENCE_FORMAT, dtype=np.int64),
+            version=np.array(version or "", dtype=str),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["SentenceIndex", str]:
+        """
+        Read an index written by save().
+
+        Args:
+            path: The .npz file
+
+        Returns:
+            Tuple of (index, version it was saved with)
+
+        Raises:
+            ValueError: If the file has another layout than SENTENCE_FORMAT
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if 'format' not in data.files or int(data['format']) != SENTENCE_FORMAT:
+                raise ValueError(f"{path} is not a sentence index of format {SENTENCE_FORMAT}")
+            index = cls(data['keys'], data['indptr'], data['separators'], data['text'], data['offsets'],
+                        data['vectors'])
+            return index, str(data['version'])
+
+def load_or_build_sentence_index(
+    index_dir: str,
+    vector_store: FAISS,
+    embed_texts: Callable[[List[str]], Any],
+) -> SentenceIndex:
+    """
+    Load the persisted sentence index matching a vector store, or build it.
+
+    Args:
+        index_dir: Directory of the persisted vector index
+        vector_store: The vector store loaded from index_dir (or the
+            unpersisted fallback store)
+        embed_texts: Function embedding a list of texts with the model of
+            the vector store, e.g. EmbeddingPipeline.embed, which batches
+            and checkpoints the embedding of every sentence
+
+    Returns:
+        A sentence index over the vector store's documents
+    """
+    path = os.path.join(index_dir, SENTENCE_FILE)
+    manifest = read_index_meta(index_dir)
+    persisted_chunks = (
+        sum(len(entry['chunks']) for entry in manifest.get('sources', {}).values())
+        if manifest else None
+    )
+    if persisted_chunks != vector_store.index.ntotal:
+        # Not the persisted index (e.g. the fallback store); keep it in memory
+        return SentenceIndex.from_vector_store(vector_store, embed_texts)
+    version = manifest.get('fingerprint')
+
+    with index_lock(index_dir):
+        if os.path.exists(path):
+            try:
+                index, saved_version = SentenceIndex.load(path)
+                if saved_version == version:
+                    return index
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error loading sentence index from {path}: {str(e)}")
+
+        start = time.time()
+        index = SentenceIndex.from_vector_store(vector_store, embed_texts)
+        index.save(path, version)
+        print(f"Built sentence index over {len(index)} chunks ({index.sentence_count} sentences) "
+              f"in {time.time() - start:.2f}s")
+        return index
+
+class ContextCompressor:
+    """
+    Keeps the sentences of retrieved passages most similar to the question,
+    within a token budget.
+
+    Attributes:
+        max_tokens: Maximum tokens of the compressed passages
+        sentence_index: Stored sentences and embeddings of the indexed
+            chunks, or None to embed every passage's sentences on the fly
+    """
+
+    def __init__(
+        self,
+        embeddings: Any,
+        count_tokens: Callable[[List[str]], List[int]],
+        max_tokens: int = CONTEXT_TOKENS,
+        sentence_index: Optional[SentenceIndex] = None,
+    ):
+        """
+        Create a compressor.
+
+        Args:
+            embeddings: Embedding model of the sentence index; questions are
+                embedded with retrieval.embed_questions, unindexed sentences
+                with embed_documents
+            count_tokens: Function returning the token count of each of a
+                list of texts, in tokens of the LLM (see
+                chunker.model_token_counter)
+            max_tokens: Maximum tokens of the compressed passages
+            sentence_index: Stored sentences of the indexed chunks
+        """
+        self.max_tokens = max_tokens
+        self.sentence_index = sentence_index
+        self._embeddings = embeddings
+        self._count_tokens = count_tokens
+        self._cache: "OrderedDict[str, Tuple[List[Tuple[str, str]], np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._tokens_before = 0
+        self._tokens_after = 0
+        self._seconds = 0.0
+
+    def _window_sentences(self, doc: Document) -> Optional[Tuple[List[Tuple[str, str]], np.ndarray]]:
+        """Get the sentences of a passage joined from several indexed chunks (see neighbors.py)."""
+        keys = doc.metadata.get('chunks')
+        if not keys:
+            return None
+        entries = [self.sentence_index.lookup_key(key) for key in keys]
+        if any(entry is None for entry in entries):
+            return None
+        pairs, dropped = join_sentence_runs([entry[0] for entry in entries])
+        return pairs, np.concatenate([entry[1][n:] for entry, n in zip(entries, dropped)])
+
+    def _sentences(self, docs: List[Document]) -> List[Tuple[List[Tuple[str, str]], np.ndarray]]:
+        """Get the sentences and sentence vectors of passages, embedding unindexed ones in one call."""
+        found: Dict[int, Tuple[List[Tuple[str, str]], np.ndarray]] = {}
+        missing = []
+        with self._lock:
+            for i, doc in enumerate(docs):
+                entry = None
+                if self.sentence_index is not None:
+                    entry = self.sentence_index.lookup(doc.page_content) or self._window_sentences(doc)
+                if entry is None:
+                    key = content_key(doc.page_content)
+                    entry = self._cache.get(key)
+                    if entry is not None:
+                        self._cache.move_to_end(key)
+                if entry is None:
+                    missing.append(i)
+                else:
+                    found[i] = entry
+
+        if missing:
+            split = [split_sentences(docs[i].page_content) for i in missing]
+            sentences = [sentence for pairs in split for _, sentence in pairs]
+            vectors = _normalize_rows(self._embeddings.embed_documents(sentences)) if sentences else None
+            offset = 0
+            with self._lock:
+                for i, pairs in zip(missing, split):
+                    entry = (pairs, vectors[offset:offset + len(pairs)] if vectors is not None else np.zeros((0, 0)))
+                    offset += len(pairs)
+                    found[i] = entry
+                    self._cache[content_key(docs[i].page_content)] = entry
+                    while len(self._cache) > _CACHE_SIZE:
+                        self._cache.popitem(last=False)
+        return [found[i] for i in range(len(docs))]
+
+    def compress(self, question: str, docs: List[Document]) -> List[Document]:
+        """
+        Shrink passages to their sentences most relevant to a question.
+
+        Args:
+            question: The question
+            docs: Retrieved passages, best first
+
+        Returns:
+            The passages with only their kept sentences, in retrieval order,
+            leaving out passages with none kept; the passages themselves if
+            they already fit the budget
+        """
+        if not docs:
+            return docs
+        start = time.perf_counter()
+        entries = self._sentences(docs)
+        sentences = [sentence for pairs, _ in entries for _, sentence in pairs]
+        # One extra token per sentence for the separators
+        counts = np.asarray(self._count_tokens(sentences), dtype=np.int64) + 1 if sentences else np.zeros(0, np.int64)
+        total = int(counts.sum())
+
+        if total <= self.max_tokens:
+            compressed, kept_tokens = docs, total
+        else:
+            question_vector = _normalize_rows(embed_questions(self._embeddings, [question]))[0]
+            scores = np.concatenate([vectors @ question_vector for pairs, vectors in entries if pairs])
+            # Best sentences first, skipping those that no longer fit
+            keep = np.zeros(len(sentences), dtype=bool)
+            kept_tokens = 0
+            for row in np.argsort(-scores, kind='stable'):
+                if kept_tokens + counts[row] <= self.max_tokens:
+                    keep[row] = True
+                    kept_tokens += int(counts[row])
+            compressed = []
+            offset = 0
+            for doc, (pairs, _) in zip(docs, entries):
+                kept = np.flatnonzero(keep[offset:offset + len(pairs)])
+                offset += len(pairs)
+                if not len(kept):
+                    continue
+                text = pairs[kept[0]][1]
+                for previous, row in zip(kept, kept[1:]):
+                    text += (pairs[row][0] if row == previous + 1 else GAP_SEPARATOR) + pairs[row][1]
+                compressed.append(Document(page_content=text, metadata=dict(doc.metadata)))
+
+        elapsed = time.perf_counter() - start
+        record("compress", elapsed)
+        with self._lock:
+            self._requests += 1
+            self._tokens_before += total
+            self._tokens_after += kept_tokens
+            self._seconds += elapsed
+        return compressed
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the compressor's counters.
+
+        Returns:
+            Dictionary with the number of compressed requests, the average
+            context tokens before and after compression and the average
+            milliseconds per request
+        """
+        requests = self._requests
+        return {
+            "requests": requests,
+            "average_tokens_before": self._tokens_before / requests if requests else 0.0,
+            "average_tokens_after": self._tokens_after / requests if requests else 0.0,
+            "average_ms": 1000 * self._seconds / requests if requests else 0.0,
+        }
@@ -4,17 +4,27 @@ Game of Thrones Book Conversion Utility
 This module processes Game of Thrones EPUB books into multiple formats:
 1. Plain markdown files for easy reading
 2. Lambda-style documentation markdown for structured search
-3. JSON files containing chunked content for vector-based RAG retrieval
+3. Chunked content for vector-based RAG retrieval, as a compact binary
+   chunk store or JSON (see chunk_store.py)
+
+Once every book is converted, front/back matter and chunks duplicated within
+or across books are marked (or, with --filter drop, removed) in the RAG
+chunks of every book in the output directory (see chunk_filter.py), and
+the chunks mentioning each character, house and place are indexed next to
+them (see entity_index.py).
 
 The processing pipeline handles:
 - EPUB parsing and text extraction
 - Content cleaning and formatting
-- Text chunking for optimal retrieval
+- Token-budgeted text chunking for optimal retrieval
+- Boilerplate and duplicate chunk filtering
+- Entity/alias indexing of the chunks
 - Metadata preservation
 - Structured output for downstream use
 
 Usage:
-    python convert_books.py
+    python convert_books.py [--workers N] [--chunk-format {binary,json}] [--filter {mark,drop,off}]
+                            [--max-tokens N] [--overlap-tokens N]
 
 Environment:
     Input EPUB files should be placed in the 'input' directory.
@@ -22,65 +32,53 @@ Environment:
 """
 
 import os
-import json
 import ebooklib
 from ebooklib import epub
 from bs4 import BeautifulSoup
 import re
-from typing import List, Dict
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional
+from chunk_store import chunk_writer, list_chunk_files
+from chunker import MAX_TOKENS, OVERLAP_TOKENS, Chunker, default_chunker
+from chunk_filter import filter_chunk_files, format_report
+from entity_index import ENTITY_FILE, write_entity_index
 
-def split_into_chunks(text: str, max_chunk_size: int = 512) -> List[str]:
+def split_into_chunks(text: str, max_chunk_size: Optional[int] = None, chunker: Optional[Chunker] = None) -> List[str]:
     """
     Split text into semantically meaningful chunks for RAG processing.
     
-    This function breaks text into chunks of approximately max_chunk_size
-    characters, attempting to preserve paragraph boundaries for context.
+    This function breaks text into chunks that fit the embedding model's
+    token limit, splitting between sentences and keeping paragraph breaks
+    (see chunker.py).
     
     Args:
         text: The input text to be chunked
-        max_chunk_size: Maximum target size for each chunk
+        max_chunk_size: Maximum size of each chunk, now in embedding model
+            tokens rather than characters (default: MAX_TOKENS)
+        chunker: The chunker to use instead of one budgeted by
+            max_chunk_size
         
     Returns:
         A list of text chunks suitable for embedding and retrieval
     """
-    paragraphs = text.split('\n\n')
-    chunks = []
-    current_chunk = []
-    current_length = 0
-    
-    for paragraph in paragraphs:
-        if len(paragraph.strip()) == 0:
-            continue
-            
-        if current_length + len(paragraph) > max_chunk_size and current_chunk:
-            chunks.append('\n\n'.join(current_chunk))
-            current_chunk = [paragraph]
-            current_length = len(paragraph)
-        else:
-            current_chunk.append(paragraph)
-            current_length += len(paragraph)
-    
-    if current_chunk:
-        chunks.append('\n\n'.join(current_chunk))
-    
-    return chunks
+    if chunker is None:
+        max_tokens = max_chunk_size or MAX_TOKENS
+        chunker = default_chunker(max_tokens, min(OVERLAP_TOKENS, max_tokens // 4))
+    return chunker.split(text)
 
-def create_lambda_style_markdown(text: str, title: str) -> str:
+def lambda_style_header(title: str) -> List[str]:
     """
-    Convert text to AWS Lambda documentation style markdown.
-    
-    This creates a structured markdown document following AWS documentation
-    patterns, which includes a clear hierarchy of sections with proper
-    heading levels. This format is optimized for documentation systems.
+    Build the opening lines of a Lambda-style markdown document.
     
     Args:
-        text: The raw text content to format
         title: The title of the document
         
     Returns:
-        Formatted markdown text in Lambda documentation style
+        List of markdown lines preceding the document sections
     """
-    lambda_doc = [
+    return [
         f"# {title}",
         "",
         "## Overview",
@@ -89,22 +87,49 @@ def create_lambda_style_markdown(text: str, title: str) -> str:
         "## Contents",
         "",
     ]
+
+def lambda_style_sections(sections: List[str]) -> List[str]:
+    """
+    Convert paragraphs to Lambda-style markdown section lines.
     
-    sections = text.split('\n\n')
-    current_section = "Main Content"
+    Paragraphs starting with '#' become '###' section headings and all other
+    paragraphs are kept as body text. Because each paragraph is handled on
+    its own, a book can be converted piece by piece as it is parsed.
     
+    Args:
+        sections: Paragraphs of the text, as split on blank lines
+        
+    Returns:
+        List of markdown lines for the paragraphs
+    """
+    lines = []
     for section in sections:
         if section.strip().startswith('#'):
-            current_section = section.strip('# \n')
-            lambda_doc.append(f"### {current_section}")
-            lambda_doc.append("")
+            heading = section.strip('# \n')
+            lines.append(f"### {heading}")
         else:
-            lambda_doc.append(section)
-            lambda_doc.append("")
+            lines.append(section)
+        lines.append("")
+    return lines
+
+def create_lambda_style_markdown(text: str, title: str) -> str:
+    """
+    Convert text to AWS Lambda documentation style markdown.
+    
+    This creates a structured markdown document following AWS documentation
+    patterns, which includes a clear hierarchy of sections with proper
+    heading levels. This format is optimized for documentation systems.
     
-    return '\n'.join(lambda_doc)
+    Args:
+        text: The raw text content to format
+        title: The title of the document
+        
+    Returns:
+        Formatted markdown text in Lambda documentation style
+    """
+    return '\n'.join(lambda_style_header(title) + lambda_style_sections(text.split('\n\n')))
 
-def epub_to_all_formats(epub_path: str, book_markdown_dir: str, lambda_markdown_dir: str, rag_dir: str):
+def epub_to_all_formats(epub_path: str, book_markdown_dir: str, lambda_markdown_dir: str, rag_dir: str, chunk_format: str = 'binary', max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS):
     """
     Convert a single EPUB file to all target formats.
     
@@ -115,109 +140,136 @@ def epub_to_all_formats(epub_path: str, book_markdown_dir: str, lambda_markdown_
     4. Creates a Lambda-style documentation version
     5. Generates chunked content for RAG with metadata
     
+    All three outputs are streamed: each EPUB document item is written to
+    every output as soon as it is parsed, so only one chapter is held in
+    memory at a time. Outputs are written to temporary files and renamed
+    into place once the book converted successfully.
+    
     Args:
         epub_path: Path to the EPUB file
         book_markdown_dir: Output directory for standard markdown
         lambda_markdown_dir: Output directory for Lambda-style markdown
-        rag_dir: Output directory for RAG chunks JSON
+        rag_dir: Output directory for RAG chunks
+        chunk_format: 'binary' for a compact chunk store (*_rag.chunks) or
+            'json' for the JSON format (*_rag.json)
+        max_tokens: Maximum embedding model tokens per RAG chunk
+        overlap_tokens: Maximum tokens shared by consecutive RAG chunks
         
     Returns:
         Tuple containing paths to the generated files, or None values if conversion failed
     """
+    base_name = os.path.splitext(os.path.basename(epub_path))[0]
+    book_filename = os.path.join(book_markdown_dir, f"{base_name}.md")
+    lambda_filename = os.path.join(lambda_markdown_dir, f"{base_name}_lambda.md")
+    outputs = [book_filename, lambda_filename]
+    rag_writer = None
+    
     try:
+        chunker = default_chunker(max_tokens, overlap_tokens)
         book = epub.read_epub(epub_path)
         title = book.get_metadata('DC', 'title')[0][0] if book.get_metadata('DC', 'title') else os.path.basename(epub_path)
         
-        # Prepare content
-        book_content = [f'# {title}\n\n']
-        rag_chunks = []
-        current_chapter = "Introduction"
-        chunk_index = 0
-        
-        for item in book.get_items():
-            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                soup = BeautifulSoup(item.get_content(), 'html.parser')
-                
-                # Try to identify chapter title
-                chapter_header = soup.find(['h1', 'h2', 'h3'])
-                if chapter_header:
-                    current_chapter = chapter_header.get_text().strip()
-                
-                # Extract and clean text
-                text = soup.get_text()
-                text = re.sub(r'\n\s*\n', '\n\n', text)
-                text = re.sub(r' +', ' ', text)
-                
-                book_content.append(text)
-                
-                # Create RAG chunks
-                chunks = split_into_chunks(text)
-                for chunk in chunks:
-                    if chunk.strip():
-                        chunk_doc = {
-                            "content": chunk.strip(),
-                            "metadata": {
+        rag_writer = chunk_writer(os.path.join(rag_dir, base_name), title, chunk_format)
+        with open(book_filename + '.tmp', 'w', encoding='utf-8') as book_file, \
+                open(lambda_filename + '.tmp', 'w', encoding='utf-8') as lambda_file:
+            heading = f'# {title}\n\n'
+            book_file.write(heading)
+            lambda_file.write('\n'.join(lambda_style_header(title)))
+            # The last paragraph of each item may continue into the next one,
+            # so it is carried over instead of written immediately
+            lambda_tail = heading
+            
+            current_chapter = "Introduction"
+            chunk_index = 0
+            
+            for item in book.get_items():
+                if item.get_type() == ebooklib.ITEM_DOCUMENT:
+                    soup = BeautifulSoup(item.get_content(), 'html.parser')
+                    
+                    # Try to identify chapter title
+                    chapter_header = soup.find(['h1', 'h2', 'h3'])
+                    if chapter_header:
+                        current_chapter = chapter_header.get_text().strip()
+                    
+                    # Extract and clean text
+                    text = soup.get_text()
+                    text = re.sub(r'\n\s*\n', '\n\n', text)
+                    text = re.sub(r' +', ' ', text)
+                    
+                    book_file.write('\n' + text)
+                    sections = (lambda_tail + '\n' + text).split('\n\n')
+                    lambda_tail = sections.pop()
+                    if sections:
+                        lambda_file.write('\n' + '\n'.join(lambda_style_sections(sections)))
+                    
+                    # Create RAG chunks
+                    chunks = split_into_chunks(text, chunker=chunker)
+                    for chunk in chunks:
+                        if chunk.strip():
+                            rag_writer.add(chunk.strip(), {
                                 "book_title": title,
                                 "source": os.path.basename(epub_path),
                                 "chapter": current_chapter,
                                 "chunk_index": chunk_index
-                            }
-                        }
-                        rag_chunks.append(chunk_doc)
-                        chunk_index += 1
-        
-        # Combine all content
-        full_content = '\n'.join(book_content)
-        
-        # Save book markdown
-        book_filename = os.path.join(
-            book_markdown_dir, 
-            f"{os.path.splitext(os.path.basename(epub_path))[0]}.md"
-        )
-        with open(book_filename, 'w', encoding='utf-8') as f:
-            f.write(full_content)
-        
-        # Save Lambda-style markdown
-        lambda_content = create_lambda_style_markdown(full_content, title)
-        lambda_filename = os.path.join(
-            lambda_markdown_dir,
-            f"{os.path.splitext(os.path.basename(epub_path))[0]}_lambda.md"
-        )
-        with open(lambda_filename, 'w', encoding='utf-8') as f:
-            f.write(lambda_content)
+                            })
+                            chunk_index += 1
+            
+            lambda_file.write('\n' + '\n'.join(lambda_style_sections([lambda_tail])))
         
-        # Save RAG chunks
-        rag_filename = os.path.join(
-            rag_dir,
-            f"{os.path.splitext(os.path.basename(epub_path))[0]}_rag.json"
-        )
-        with open(rag_filename, 'w', encoding='utf-8') as f:
-            json.dump({
-                "book_title": title,
-                "chunks": rag_chunks,
-                "total_chunks": len(rag_chunks)
-            }, f, indent=2)
+        for filename in outputs:
+            os.replace(filename + '.tmp', filename)
+        rag_filename = rag_writer.close()
         
         print(f"Successfully converted: {os.path.basename(epub_path)}")
-        print(f"  - Created {len(rag_chunks)} RAG chunks")
+        print(f"  - Created {chunk_index} RAG chunks")
         return book_filename, lambda_filename, rag_filename
     
     except Exception as e:
         print(f"Error converting {os.path.basename(epub_path)}: {str(e)}")
+        for filename in outputs:
+            if os.path.exists(filename + '.tmp'):
+                os.remove(filename + '.tmp')
+        if rag_writer is not None:
+            rag_writer.discard()
         return None, None, None
 
-def convert_folder(input_folder: str, book_markdown_dir: str, lambda_markdown_dir: str, rag_dir: str):
+def _convert_timed(epub_path: str, book_markdown_dir: str, lambda_markdown_dir: str, rag_dir: str, chunk_format: str, max_tokens: int, overlap_tokens: int):
+    """
+    Run epub_to_all_formats and measure how long it took.
+    
+    Defined at module level so it can be sent to worker processes.
+    
+    Returns:
+        Tuple of (output paths, seconds taken)
+    """
+    start = time.perf_counter()
+    results = epub_to_all_formats(epub_path, book_markdown_dir, lambda_markdown_dir, rag_dir, chunk_format, max_tokens, overlap_tokens)
+    return results, time.perf_counter() - start
+
+def convert_folder(input_folder: str, book_markdown_dir: str, lambda_markdown_dir: str, rag_dir: str, workers: int = 1, chunk_format: str = 'binary', chunk_filter: str = 'mark', max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS):
     """
     Process all EPUB files in a directory, converting each to all target formats.
     
     This function creates the necessary output directories and processes
-    each EPUB file in the input folder.
+    each EPUB file in the input folder. With more than one worker, books are
+    converted concurrently in a process pool, one book per process. The RAG
+    chunks of every book in rag_dir, including books converted by earlier
+    runs, are then filtered together, so that duplicates are found across
+    books whatever the number of workers or books converted, and the entity
+    index is built over the final chunks.
     
     Args:
         input_folder: Directory containing EPUB files to process
         book_markdown_dir: Output directory for standard markdown
         lambda_markdown_dir: Output directory for Lambda-style markdown
-        rag_dir: Output directory for RAG chunks JSON
+        rag_dir: Output directory for RAG chunks
+        workers: Number of books to convert in parallel
+        chunk_format: Format of the RAG chunk files, 'binary' or 'json'
+        chunk_filter: 'mark' to keep boilerplate and duplicate chunks with
+            the reason in their 'filtered' metadata, 'drop' to remove them,
+            or 'off'
+        max_tokens: Maximum embedding model tokens per RAG chunk
+        overlap_tokens: Maximum tokens shared by consecutive RAG chunks
         
     Returns:
         List of tuples, each containing the output paths for a successfully converted book
@@ -227,19 +279,41 @@ def convert_folder(input_folder: str, book_markdown_dir: str, lambda_markdown_di
     os.makedirs(lambda_markdown_dir, exist_ok=True)
     os.makedirs(rag_dir, exist_ok=True)
     
+    input_paths = [
+        os.path.join(input_folder, filename)
+        for filename in sorted(os.listdir(input_folder))
+        if filename.lower().endswith('.epub')
+    ]
+    args = [
+        (path, book_markdown_dir, lambda_markdown_dir, rag_dir, chunk_format, max_tokens, overlap_tokens)
+        for path in input_paths
+    ]
+    
+    if workers > 1 and len(input_paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(input_paths))) as executor:
+            timed_results = list(executor.map(_convert_timed, *zip(*args)))
+    else:
+        timed_results = [_convert_timed(*arg) for arg in args]
+    
     converted_files = []
+    print("\nPer-book conversion times:")
+    for path, (results, seconds) in zip(input_paths, timed_results):
+        status = "ok" if all(results) else "failed"
+        print(f"  {os.path.basename(path)}: {seconds:.2f}s ({status})")
+        if all(results):
+            converted_files.append(results)
+    
+    if chunk_filter != 'off' and converted_files:
+        start = time.perf_counter()
+        report = filter_chunk_files(list_chunk_files(rag_dir), mark=chunk_filter == 'mark')
+        print(f"\nChunk filtering ({chunk_filter}) took {time.perf_counter() - start:.2f}s:")
+        print(format_report(report))
     
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith('.epub'):
-            input_path = os.path.join(input_folder, filename)
-            results = epub_to_all_formats(
-                input_path, 
-                book_markdown_dir, 
-                lambda_markdown_dir,
-                rag_dir
-            )
-            if all(results):
-                converted_files.append(results)
+    if converted_files:
+        start = time.perf_counter()
+        entity_index = write_entity_index(rag_dir)
+        print(f"\nIndexed {entity_index.stats()['entities']} entities over {len(entity_index)} chunks "
+              f"in {time.perf_counter() - start:.2f}s ({ENTITY_FILE})")
     
     return converted_files
 
@@ -250,6 +324,19 @@ if __name__ == "__main__":
     This sets up the directory paths relative to the script location and
     executes the conversion process for all EPUB files found in the input directory.
     """
+    parser = argparse.ArgumentParser(description="Convert EPUB books to markdown and RAG chunks")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of books to convert in parallel (default: 1)")
+    parser.add_argument("--chunk-format", choices=["binary", "json"], default="binary",
+                        help="Format of the RAG chunk files (default: binary)")
+    parser.add_argument("--filter", choices=["mark", "drop", "off"], default="mark",
+                        help="Mark or drop boilerplate and duplicate chunks (default: mark)")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS,
+                        help=f"Maximum embedding model tokens per chunk (default: {MAX_TOKENS})")
+    parser.add_argument("--overlap-tokens", type=int, default=OVERLAP_TOKENS,
+                        help=f"Maximum tokens shared by consecutive chunks (default: {OVERLAP_TOKENS})")
+    args = parser.parse_args()
+    
     current_dir = os.path.dirname(os.path.abspath(__file__))
     INPUT_FOLDER = os.path.join(current_dir, "input")
     BOOK_MARKDOWN_DIR = os.path.join(current_dir, "output", "book_markdown")
@@ -257,7 +344,8 @@ if __name__ == "__main__":
     RAG_DIR = os.path.join(current_dir, "output", "rag_chunks")
     
     print(f"Starting conversion of EPUB files from {INPUT_FOLDER}")
-    converted = convert_folder(INPUT_FOLDER, BOOK_MARKDOWN_DIR, LAMBDA_MARKDOWN_DIR, RAG_DIR)
+    converted = convert_folder(INPUT_FOLDER, BOOK_MARKDOWN_DIR, LAMBDA_MARKDOWN_DIR, RAG_DIR, args.workers, args.chunk_format, args.filter,
+                               args.max_tokens, args.overlap_tokens)
     print(f"\nConverted {len(converted)} files successfully!")
     print(f"Output files are in:")
     print(f"  Book Markdown: {BOOK_MARKDOWN_DIR}")
@@ -0,0 +1,212 @@
+"""
+Game of Thrones Embedding Pipeline
+
+This module embeds large numbers of chunks for the index builder. Compared to
+handing every text to HuggingFaceEmbeddings in one call, it:
+1. Sorts texts by length so each batch pads to a similar length
+2. Encodes in batches of a configurable size
+3. Optionally fans batches out to a pool of worker processes, each with its
+   own copy of the model and a share of the CPU threads
+4. Writes finished batches to a memory-mapped checkpoint (float32 or
+   float16), so a crashed or interrupted build resumes where it stopped
+
+Usage:
+    from embedding_pipeline import EmbeddingPipeline
+
+    pipeline = EmbeddingPipeline(
+        "sentence-transformers/all-MiniLM-L6-v2", batch_size=64, workers=4,
+        checkpoint_path="faiss_index.vectors"
+    )
+    vectors = pipeline.embed(texts)
+"""
+
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, List, Optional
+
+# Model loaded once per worker process by _init_worker
+_worker_model = None
+
+def _init_worker(model_name: str, threads: int) -> None:
+    """Load the embedding model in a worker process."""
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+def _encode(model: Any, texts: List[str]) -> np.ndarray:
+    """Encode one batch of texts with a sentence-transformers model."""
+    return np.asarray(
+        model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False),
+        dtype=np.float32
+    )
+
+def _encode_in_worker(batch_number: int, texts: List[str]) -> tuple:
+    """Encode one batch in a worker process."""
+    return batch_number, _encode(_worker_model, texts)
+
+class EmbeddingPipeline:
+    """
+    Batched, optionally multi-process document embedder.
+
+    Attributes:
+        model_name: Name of the sentence-transformers model
+        batch_size: Number of texts encoded per batch
+        workers: Number of worker processes; 1 encodes in this process
+        threads: CPU threads per worker process
+        dtype: Storage type of the checkpoint, 'float32' or 'float16'
+        checkpoint_path: Path of the memory-mapped checkpoint, or None
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 64,
+        workers: int = 1,
+        threads: Optional[int] = None,
+        dtype: str = 'float32',
+        checkpoint_path: Optional[str] = None,
+        model: Any = None,
+    ):
+        """
+        Configure the pipeline.
+
+        Args:
+            model_name: Name of the sentence-transformers model
+            batch_size: Number of texts encoded per batch
+            workers: Number of worker processes; 1 encodes in this process
+            threads: CPU threads per worker (default: CPU count / workers)
+            dtype: Storage type of the checkpoint, 'float32' or 'float16'
+            checkpoint_path: Path of a memory-mapped checkpoint to write
+                vectors to as they are produced, or None to keep them in memory
+            model: Already loaded model to use in-process (e.g. the client of
+                a HuggingFaceEmbeddings), to avoid loading it twice
+        """
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        self.dtype = dtype
+        self.checkpoint_path = checkpoint_path
+        self._model = model
+
+    def _fingerprint(self, texts: List[str]) -> str:
+        """Identify a set of texts and settings a checkpoint belongs to."""
+        digest = hashlib.sha256(f"{self.model_name}\0{self.batch_size}\0{self.dtype}".encode('utf-8'))
+        for text in texts:
+            digest.update(b'\0' + text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _open_checkpoint(self, fingerprint: str, rows: int, batches: int) -> tuple:
+        """
+        Open the checkpoint for this run, resuming a matching earlier one.
+
+        Returns:
+            Tuple of (vectors memmap, or None until the first batch is
+            stored, per-batch done flags memmap)
+        """
+        try:
+            with open(self.checkpoint_path + '.meta.json', 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+
+        if (meta and meta.get('fingerprint') == fingerprint
+                and os.path.exists(self.checkpoint_path)
+                and os.path.exists(self.checkpoint_path + '.done')):
+            done = np.memmap(self.checkpoint_path + '.done', dtype=np.uint8, mode='r+', shape=(batches,))
+            vectors = np.memmap(self.checkpoint_path, dtype=self.dtype, mode='r+', shape=(rows, meta['dimension']))
+            print(f"Resuming embedding checkpoint: {int(done.sum())}/{batches} batches done")
+            return vectors, done
+
+        done = np.memmap(self.checkpoint_path + '.done', dtype=np.uint8, mode='w+', shape=(batches,))
+        return None, done
+
+    def _create_vectors(self, fingerprint: str, rows: int, dimension: int) -> np.ndarray:
+        """Create the vectors array once the embedding dimension is known."""
+        if self.checkpoint_path is None:
+            return np.zeros((rows, dimension), dtype=self.dtype)
+        vectors = np.memmap(self.checkpoint_path, dtype=self.dtype, mode='w+', shape=(rows, dimension))
+        # Written last, so the checkpoint is only resumed once it is complete
+        with open(self.checkpoint_path + '.meta.json', 'w') as f:
+            json.dump({"fingerprint": fingerprint, "dimension": dimension}, f)
+        return vectors
+
+    def _remove_checkpoint(self) -> None:
+        """Delete the checkpoint files after a completed run."""
+        for path in (self.checkpoint_path, self.checkpoint_path + '.done', self.checkpoint_path + '.meta.json'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts, returning float32 vectors in input order.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Array of shape (len(texts), dimension)
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        start = time.time()
+        # Longest first, so batches pad to similar lengths and the slowest
+        # batches are not left for the end
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        batches = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        fingerprint = self._fingerprint(texts)
+
+        vectors = None
+        done = np.zeros(len(batches), dtype=np.uint8)
+        if self.checkpoint_path is not None:
+            vectors, done = self._open_checkpoint(fingerprint, len(texts), len(batches))
+
+        pending = [n for n in range(len(batches)) if not done[n]]
+
+        def store(batch_number: int, batch_vectors: np.ndarray) -> None:
+            nonlocal vectors
+            if vectors is None:
+                vectors = self._create_vectors(fingerprint, len(texts), batch_vectors.shape[1])
+            vectors[batches[batch_number]] = batch_vectors
+            if isinstance(vectors, np.memmap):
+                vectors.flush()
+            done[batch_number] = 1
+            if isinstance(done, np.memmap):
+                done.flush()
+
+        if self.workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(pending)),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.threads),
+            ) as executor:
+                futures = [
+                    executor.submit(_encode_in_worker, n, [texts[i] for i in batches[n]])
+                    for n in pending
+                ]
+                for future in as_completed(futures):
+                    store(*future.result())
+        else:
+            if pending and self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name)
+            for n in pending:
+                store(n, _encode(self._model, [texts[i] for i in batches[n]]))
+
+        result = np.array(vectors, dtype=np.float32)
+        if self.checkpoint_path is not None:
+            del vectors
+            self._remove_checkpoint()
+        print(f"Embedded {len(texts)} texts in {len(batches)} batches "
+              f"({len(pending)} computed) in {time.time() - start:.2f}s")
+        return result
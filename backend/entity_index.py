@@ -0,0 +1,663 @@
+"""
+Game of Thrones Entity Index
+
+Most questions name a character, house or place ("Who killed Joffrey?",
+"Where is Harrenhal?"). This module maps such names to the chunks that
+mention them, so that the retriever gets a precise candidate set for them
+without any embedding:
+
+- ENTITIES lists canonical names with their aliases ("Ned" and "Lord
+  Eddard" for Eddard Stark, "the Imp" for Tyrion Lannister, ...).
+- AliasMatcher finds every alias in a text in one pass, with an
+  Aho-Corasick automaton over words; overlapping matches keep the longest
+  ("Eddard Stark" rather than "Stark").
+- EntityIndex stores, per entity, the chunks mentioning it and how often, in
+  compressed sparse row form like the BM25 index, and ranks the chunks for
+  a question by how many of its entities they mention, then by mentions.
+
+convert_books.py builds the index when it writes the RAG chunks and stores
+it next to them (entities.npz), keyed by book title and chunk_index. At
+startup the keys are resolved to the vector store's docstore ids; if the
+chunk files changed since (or the alias table did), the index is rebuilt
+in memory from the vector store instead.
+
+Usage:
+    from entity_index import load_entity_index
+
+    entity_index = load_entity_index("output/rag_chunks", "faiss_index", vector_store)
+    entity_index.match("What did the Imp do at the Blackwater?")
+    results = entity_index.search("Who killed Joffrey?", k=20)
+
+    # Rebuild the index of existing chunk files:
+    $ python backend/entity_index.py output/rag_chunks
+"""
+
+import os
+import re
+import sys
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import Counter, deque
+from langchain.vectorstores import FAISS
+from langchain.docstore.document import Document
+from typing import AbstractSet, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from chunk_store import chunk_key, iter_chunk_file, list_chunk_files
+from index_store import fingerprint_sources, hash_file, read_index_meta, source_name
+
+ENTITY_FILE = "entities.npz"
+
+# (canonical name, kind, aliases); the canonical name is matched too.
+# Aliases are matched as whole words, ignoring case and a possessive 's,
+# so words common in plain English ("cat", "snow") are left out.
+ENTITIES = (
+    ("Eddard Stark", "character", ("Ned Stark", "Ned", "Eddard", "Lord Eddard", "Lord Stark")),
+    ("Catelyn Stark", "character", ("Catelyn", "Catelyn Tully", "Lady Catelyn")),
+    ("Robb Stark", "character", ("Robb", "the Young Wolf", "King in the North")),
+    ("Sansa Stark", "character", ("Sansa",)),
+    ("Arya Stark", "character", ("Arya", "Arry", "Arya Underfoot")),
+    ("Bran Stark", "character", ("Bran", "Brandon Stark")),
+    ("Rickon Stark", "character", ("Rickon",)),
+    ("Jon Snow", "character", ("Lord Snow",)),
+    ("Benjen Stark", "character", ("Benjen",)),
+    ("Lyanna Stark", "character", ("Lyanna",)),
+    ("Tyrion Lannister", "character", ("Tyrion", "the Imp", "Halfman")),
+    ("Jaime Lannister", "character", ("Jaime", "Kingslayer", "the Kingslayer", "Ser Jaime")),
+    ("Cersei Lannister", "character", ("Cersei", "Queen Cersei")),
+    ("Tywin Lannister", "character", ("Tywin", "Lord Tywin")),
+    ("Joffrey Baratheon", "character", ("Joffrey", "King Joffrey", "Joff")),
+    ("Tommen Baratheon", "character", ("Tommen", "King Tommen")),
+    ("Myrcella Baratheon", "character", ("Myrcella",)),
+    ("Robert Baratheon", "character", ("Robert", "King Robert")),
+    ("Stannis Baratheon", "character", ("Stannis", "King Stannis")),
+    ("Renly Baratheon", "character", ("Renly", "Lord Renly", "King Renly")),
+    ("Gendry", "character", ()),
+    ("Daenerys Targaryen", "character", ("Daenerys", "Dany", "Khaleesi", "Mother of Dragons", "Daenerys Stormborn")),
+    ("Viserys Targaryen", "character", ("Viserys",)),
+    ("Rhaegar Targaryen", "character", ("Rhaegar", "Prince Rhaegar")),
+    ("Aerys Targaryen", "character", ("Aerys", "the Mad King", "King Aerys")),
+    ("Aemon", "character", ("Maester Aemon", "Aemon Targaryen")),
+    ("Khal Drogo", "character", ("Drogo",)),
+    ("Jorah Mormont", "character", ("Jorah", "Ser Jorah")),
+    ("Jeor Mormont", "character", ("Lord Commander Mormont", "the Old Bear")),
+    ("Barristan Selmy", "character", ("Barristan", "Ser Barristan", "Barristan the Bold", "Arstan Whitebeard")),
+    ("Theon Greyjoy", "character", ("Theon", "Prince Theon")),
+    ("Asha Greyjoy", "character", ("Asha",)),
+    ("Balon Greyjoy", "character", ("Balon", "Lord Balon", "King Balon")),
+    ("Euron Greyjoy", "character", ("Euron", "Crow's Eye")),
+    ("Petyr Baelish", "character", ("Petyr", "Littlefinger", "Lord Baelish")),
+    ("Varys", "character", ("Lord Varys", "the Spider", "the eunuch")),
+    ("Sandor Clegane", "character", ("Sandor", "the Hound")),
+    ("Gregor Clegane", "character", ("Gregor", "the Mountain", "Ser Gregor", "the Mountain That Rides")),
+    ("Brienne of Tarth", "character", ("Brienne", "Brienne the Beauty")),
+    ("Davos Seaworth", "character", ("Davos", "Ser Davos", "the Onion Knight")),
+    ("Melisandre", "character", ("the red woman", "Lady Melisandre")),
+    ("Samwell Tarly", "character", ("Samwell", "Sam", "Sam Tarly")),
+    ("Gilly", "character", ()),
+    ("Mance Rayder", "character", ("Mance", "King-beyond-the-Wall", "the King-Beyond-the-Wall")),
+    ("Ygritte", "character", ()),
+    ("Tormund Giantsbane", "character", ("Tormund",)),
+    ("Bronn", "character", ("Ser Bronn",)),
+    ("Shae", "character", ()),
+    ("Podrick Payne", "character", ("Podrick", "Pod")),
+    ("Hodor", "character", ()),
+    ("Osha", "character", ()),
+    ("Jojen Reed", "character", ("Jojen",)),
+    ("Meera Reed", "character", ("Meera",)),
+    ("Roose Bolton", "character", ("Roose", "Lord Bolton")),
+    ("Ramsay Bolton", "character", ("Ramsay", "Ramsay Snow", "the Bastard of Bolton")),
+    ("Walder Frey", "character", ("Lord Walder", "Lord Frey")),
+    ("Jon Arryn", "character", ("Lord Arryn",)),
+    ("Lysa Arryn", "character", ("Lysa", "Lady Lysa", "Lysa Tully")),
+    ("Robert Arryn", "character", ("Sweetrobin", "Robin Arryn")),
+    ("Edmure Tully", "character", ("Edmure", "Ser Edmure")),
+    ("Brynden Tully", "character", ("Brynden", "the Blackfish")),
+    ("Hoster Tully", "character", ("Hoster", "Lord Hoster")),
+    ("Oberyn Martell", "character", ("Oberyn", "the Red Viper", "Prince Oberyn")),
+    ("Doran Martell", "character", ("Doran", "Prince Doran")),
+    ("Margaery Tyrell", "character", ("Margaery", "Queen Margaery")),
+    ("Olenna Tyrell", "character", ("Olenna", "the Queen of Thorns", "Lady Olenna")),
+    ("Loras Tyrell", "character", ("Loras", "Ser Loras", "the Knight of Flowers")),
+    ("Mace Tyrell", "character", ("Lord Mace",)),
+    ("Qyburn", "character", ()),
+    ("Pycelle", "character", ("Grand Maester Pycelle",)),
+    ("Ilyn Payne", "character", ("Ser Ilyn",)),
+    ("Beric Dondarrion", "character", ("Beric", "Lord Beric", "the lightning lord")),
+    ("Thoros of Myr", "character", ("Thoros",)),
+    ("Jaqen H'ghar", "character", ("Jaqen",)),
+    ("Syrio Forel", "character", ("Syrio",)),
+    ("Missandei", "character", ()),
+    ("Daario Naharis", "character", ("Daario",)),
+    ("Hizdahr zo Loraq", "character", ("Hizdahr",)),
+    ("Grey Worm", "character", ()),
+    ("Craster", "character", ()),
+    ("High Sparrow", "character", ("the High Sparrow",)),
+    ("House Stark", "house", ("Stark", "Starks", "the Starks")),
+    ("House Lannister", "house", ("Lannister", "Lannisters", "the Lannisters")),
+    ("House Targaryen", "house", ("Targaryen", "Targaryens", "the Targaryens")),
+    ("House Baratheon", "house", ("Baratheon", "Baratheons")),
+    ("House Greyjoy", "house", ("Greyjoy", "Greyjoys", "ironborn")),
+    ("House Tyrell", "house", ("Tyrell", "Tyrells")),
+    ("House Martell", "house", ("Martell", "Martells")),
+    ("House Arryn", "house", ("Arryn", "Arryns")),
+    ("House Tully", "house", ("Tully", "Tullys")),
+    ("House Frey", "house", ("Frey", "Freys")),
+    ("House Bolton", "house", ("Bolton", "Boltons")),
+    ("House Tarly", "house", ("Tarly", "Tarlys")),
+    ("House Mormont", "house", ("Mormont", "Mormonts")),
+    ("House Clegane", "house", ("Clegane", "Cleganes")),
+    ("Night's Watch", "house", ("the Night's Watch", "black brothers")),
+    ("Kingsguard", "house", ("the Kingsguard",)),
+    ("Winterfell", "place", ()),
+    ("King's Landing", "place", ()),
+    ("The Wall", "place", ()),
+    ("Castle Black", "place", ()),
+    ("Casterly Rock", "place", ()),
+    ("The Eyrie", "place", ("Eyrie",)),
+    ("Riverrun", "place", ()),
+    ("The Twins", "place", ()),
+    ("Harrenhal", "place", ()),
+    ("Dragonstone", "place", ()),
+    ("Storm's End", "place", ()),
+    ("Highgarden", "place", ()),
+    ("Sunspear", "place", ()),
+    ("Dorne", "place", ()),
+    ("Pyke", "place", ()),
+    ("Iron Islands", "place", ("the Iron Islands",)),
+    ("The Red Keep", "place", ("Red Keep",)),
+    ("The Dreadfort", "place", ("Dreadfort",)),
+    ("The Vale", "place", ("the Vale of Arryn",)),
+    ("The North", "place", ()),
+    ("The Riverlands", "place", ("Riverlands",)),
+    ("Oldtown", "place", ()),
+    ("The Citadel", "place", ()),
+    ("The Trident", "place", ()),
+    ("Moat Cailin", "place", ()),
+    ("Hardhome", "place", ()),
+    ("Fist of the First Men", "place", ("the Fist",)),
+    ("Blackwater", "place", ("the Blackwater", "Blackwater Rush", "Blackwater Bay")),
+    ("Westeros", "place", ()),
+    ("Essos", "place", ()),
+    ("Meereen", "place", ()),
+    ("Astapor", "place", ()),
+    ("Yunkai", "place", ()),
+    ("Qarth", "place", ()),
+    ("Braavos", "place", ()),
+    ("Pentos", "place", ()),
+    ("Valyria", "place", ()),
+    ("Vaes Dothrak", "place", ()),
+)
+
+def normalize_words(text: str) -> List[str]:
+    """
+    Split a text into the lowercase words aliases are matched on.
+
+    Args:
+        text: Text to split
+
+    Returns:
+        The words of the text, in order, without a possessive 's
+    """
+    words = re.findall(r"[a-z0-9]+(?:['\-][a-z0-9]+)*", text.lower().replace("’", "'"))
+    return [word[:-2] if word.endswith("'s") else word for word in words]
+
+def alias_version(entities: Sequence[Tuple[str, str, Sequence[str]]] = ENTITIES) -> str:
+    """Hash of an alias table, so indexes built with another table are rebuilt."""
+    return hashlib.sha256(repr(tuple(entities)).encode('utf-8')).hexdigest()[:16]
+
+class AliasMatcher:
+    """
+    Aho-Corasick automaton over words, finding many aliases in one pass.
+    """
+
+    def __init__(self, aliases: Dict[Tuple[str, ...], int]):
+        """
+        Build the automaton.
+
+        Args:
+            aliases: Entity id of each alias, given as its normalized words
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        # Longest alias ending at each state, as (number of words, entity id)
+        self._output: List[Optional[Tuple[int, int]]] = [None]
+        for words, entity in aliases.items():
+            state = 0
+            for word in words:
+                if word not in self._goto[state]:
+                    self._goto.append({})
+                    self._output.append(None)
+                    self._goto[state][word] = len(self._goto) - 1
+                state = self._goto[state][word]
+            if words:
+                self._output[state] = (len(words), entity)
+
+        # Failure links, breadth first from the root's children (which fail
+        # to the root); a state's own alias is longer than any alias ending
+        # at its failure state
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(word, 0)
+                if self._output[child] is None:
+                    self._output[child] = self._output[self._fail[child]]
+
+    def find(self, words: Sequence[str]) -> List[Tuple[int, int, int]]:
+        """
+        Find the aliases in a sequence of words.
+
+        Args:
+            words: Normalized words (see normalize_words)
+
+        Returns:
+            (start, end, entity id) of each match, in order; overlapping
+            matches keep the leftmost, then the longest
+        """
+        matches = []
+        state = 0
+        for position, word in enumerate(words):
+            while state and word not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word, 0)
+            output = self._output[state]
+            if output is not None:
+                length, entity = output
+                matches.append((position + 1 - length, position + 1, entity))
+
+        matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+        kept = []
+        end = 0
+        for match in matches:
+            if match[0] >= end:
+                kept.append(match)
+                end = match[1]
+        return kept
+
+    def counts(self, text: str) -> Counter:
+        """Count the mentions of each entity id in a text."""
+        return Counter(entity for _, _, entity in self.find(normalize_words(text)))
+
+def _matcher(names: Sequence[str], entities: Sequence[Tuple[str, str, Sequence[str]]]) -> AliasMatcher:
+    """Build the matcher of the entities of an index, numbered as in names."""
+    ids = {name: i for i, name in enumerate(names)}
+    aliases = {}
+    for name, _, entity_aliases in entities:
+        if name in ids:
+            for alias in (name,) + tuple(entity_aliases):
+                aliases[tuple(normalize_words(alias))] = ids[name]
+    return AliasMatcher(aliases)
+
+class EntityIndex:
+    """
+    Chunks mentioning each entity, in compressed sparse row form.
+
+    Attributes:
+        names: Canonical name of each entity
+        kinds: Kind of each entity ('character', 'house' or 'place')
+        keys: Key of each row: its chunk_key, or its docstore id for an
+            index built from a vector store
+        doc_ids: Docstore id of each row ('' for chunks not in the vector
+            store); the keys until bind() is called
+    """
+
+    def __init__(
+        self,
+        names: np.ndarray,
+        kinds: np.ndarray,
+        indptr: np.ndarray,
+        rows: np.ndarray,
+        counts: np.ndarray,
+        keys: np.ndarray,
+        entities: Sequence[Tuple[str, str, Sequence[str]]] = ENTITIES,
+    ):
+        """
+        Wrap prebuilt index arrays; use build() or load() to create an index.
+
+        Args:
+            names: Canonical name of each entity
+            kinds: Kind of each entity
+            indptr: Start of each entity's postings in rows/counts, plus the end
+            rows: Row of each posting
+            counts: Mentions of the entity in each posting's row
+            keys: Key of each row
+            entities: Alias table the questions are matched with
+        """
+        self.names = names
+        self.kinds = kinds
+        self._indptr = indptr
+        self._rows = rows
+        self._counts = counts.astype(np.float32)
+        self.keys = keys
+        self.doc_ids = keys
+        self._bound = np.ones(len(keys), dtype=bool)
+        self._matcher = _matcher(names.tolist(), entities)
+        self._masks: Dict[AbstractSet[str], np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._matched = 0
+        self._candidates = 0
+
+    @classmethod
+    def build(
+        cls,
+        documents: Iterable[Tuple[str, str]],
+        entities: Sequence[Tuple[str, str, Sequence[str]]] = ENTITIES,
+    ) -> "EntityIndex":
+        """
+        Build an index from documents.
+
+        Args:
+            documents: (key, text) pairs
+            entities: Alias table
+
+        Returns:
+            The index
+        """
+        names = np.array([name for name, _, _ in entities], dtype=str)
+        matcher = _matcher(names.tolist(), entities)
+        keys = []
+        posting_entities = []
+        posting_rows = []
+        posting_counts = []
+        for row, (key, text) in enumerate(documents):
+            keys.append(key)
+            for entity, count in matcher.counts(text).items():
+                posting_entities.append(entity)
+                posting_rows.append(row)
+                posting_counts.append(count)
+
+        # Group the postings by entity
+        posting_entities = np.asarray(posting_entities, dtype=np.int64)
+        order = np.argsort(posting_entities, kind='stable')
+        indptr = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_entities, minlength=len(names)), out=indptr[1:])
+        return cls(
+            names,
+            np.array([kind for _, kind, _ in entities], dtype=str),
+            indptr,
+            np.asarray(posting_rows, dtype=np.int32)[order],
+            np.minimum(np.asarray(posting_counts, dtype=np.int64)[order], 65535).astype(np.uint16),
+            np.array(keys, dtype=str),
+            entities,
+        )
+
+    @classmethod
+    def from_chunk_files(cls, paths: Iterable[str]) -> "EntityIndex":
+        """
+        Build an index over RAG chunk files, keyed by chunk_key.
+
+        Args:
+            paths: Binary or JSON chunk files
+
+        Returns:
+            The index
+        """
+        def documents():
+            for path in paths:
+                for doc in iter_chunk_file(path):
+                    yield chunk_key(doc.metadata), doc.page_content
+        return cls.build(documents())
+
+    @classmethod
+    def from_vector_store(cls, vector_store: FAISS) -> "EntityIndex":
+        """
+        Build an index over the documents of a vector store.
+
+        Args:
+            vector_store: The FAISS vector store
+
+        Returns:
+            The index, with docstore ids as keys
+        """
+        def documents():
+            for doc_id in vector_store.index_to_docstore_id.values():
+                doc = vector_store.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    yield doc_id, doc.page_content
+        return cls.build(documents())
+
+    def bind(self, vector_store: FAISS) -> int:
+        """
+        Resolve the chunk keys of the rows to a vector store's docstore ids.
+
+        Args:
+            vector_store: The FAISS vector store built from the same chunks
+
+        Returns:
+            Number of rows found in the vector store
+        """
+        doc_ids = {}
+        for doc_id in vector_store.index_to_docstore_id.values():
+            doc = vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                doc_ids[chunk_key(doc.metadata)] = doc_id
+        self.doc_ids = np.array([doc_ids.get(key, '') for key in self.keys.tolist()], dtype=str)
+        self._bound = self.doc_ids != ''
+        self._masks = {}
+        return int(np.count_nonzero(self._bound))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def match(self, text: str) -> List[str]:
+        """
+        Find the entities a text mentions.
+
+        Args:
+            text: Text such as a question
+
+        Returns:
+            Canonical names of the entities, in order of first mention
+        """
+        entities = self._matcher.counts(text)
+        return [str(self.names[entity]) for entity in entities]
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Score every row for a query: the number of the query's entities the
+        row mentions, plus a fraction growing with its mentions of them.
+
+        Args:
+            query: The query text
+
+        Returns:
+            float32 array of scores, one per row; 0 for rows mentioning none
+        """
+        matched = np.zeros(len(self.keys), dtype=np.float32)
+        mentions = np.zeros(len(self.keys), dtype=np.float32)
+        for entity in self._matcher.counts(query):
+            start, end = self._indptr[entity], self._indptr[entity + 1]
+            rows = self._rows[start:end]
+            # Rows are unique within an entity's postings, so += is safe
+            matched[rows] += 1
+            mentions[rows] += self._counts[start:end]
+        return matched + mentions / (mentions + 1)
+
+    def row_mask(self, doc_ids: AbstractSet[str]) -> np.ndarray:
+        """
+        Get the boolean mask of the rows of some documents, cached per set.
+
+        Args:
+            doc_ids: Set of docstore ids (e.g. of a partitions.PartitionIndex
+                scope)
+
+        Returns:
+            Boolean array, True for rows whose docstore id is in doc_ids
+        """
+        mask = self._masks.get(doc_ids)
+        if mask is None:
+            mask = np.fromiter((doc_id in doc_ids for doc_id in self.doc_ids.tolist()),
+                               dtype=bool, count=len(self.doc_ids))
+            self._masks[doc_ids] = mask
+        return mask
+
+    def search(self, query: str, k: int = 4, mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        Find the k chunks best matching the entities of a query.
+
+        Args:
+            query: The query text
+            k: Number of results
+            mask: Boolean array restricting the search to some rows
+                (see row_mask), or None to search every chunk
+
+        Returns:
+            (docstore id, score) pairs, best first; empty when the query
+            names no entity
+        """
+        scores = self.scores(query)
+        scores[~self._bound] = 0
+        if mask is not None:
+            scores[~mask] = 0
+        candidates = np.flatnonzero(scores)
+        with self._lock:
+            self._searches += 1
+            self._matched += bool(len(candidates))
+            self._candidates += len(candidates)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(str(self.doc_ids[row]), float(scores[row])) for row in candidates]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the index size and how often questions named entities.
+
+        Returns:
+            Dictionary with 'entities' and 'chunks' indexed, 'searches',
+            'matched' (searches naming at least one entity) and
+            'average_candidates' (chunks per matched search)
+        """
+        return {
+            "entities": int(np.count_nonzero(np.diff(self._indptr))),
+            "chunks": len(self.keys),
+            "searches": self._searches,
+            "matched": self._matched,
+            "average_candidates": self._candidates / self._matched if self._matched else 0.0,
+        }
+
+    def top_entities(self, n: int = 10) -> List[Tuple[str, int]]:
+        """The n entities mentioned in the most chunks, with their chunk counts."""
+        chunks = np.diff(self._indptr)
+        return [(str(self.names[i]), int(chunks[i])) for i in np.argsort(-chunks, kind='stable')[:n]]
+
+    def save(self, path: str, version: Optional[str] = None) -> None:
+        """
+        Write the index to a compressed .npz file, atomically.
+
+        Args:
+            path: Target file
+            version: Version of the chunks it was built from
+        """
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez_compressed(
+            tmp_path,
+            names=self.names,
+            kinds=self.kinds,
+            indptr=self._indptr,
+            rows=self._rows,
+            counts=self._counts.astype(np.uint16),
+            keys=self.keys,
+            version=np.array(version or "", dtype=str),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["EntityIndex", str]:
+        """
+        Read an index written by save().
+
+        Args:
+            path: The .npz file
+
+        Returns:
+            Tuple of (index, version it was saved with)
+        """
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(
+                data['names'], data['kinds'], data['indptr'], data['rows'], data['counts'], data['keys']
+            )
+            return index, str(data['version'])
+
+def entity_index_version(source_hashes: Dict[str, str]) -> str:
+    """
+    Version an entity index by the chunk files and the alias table it was built from.
+
+    Args:
+        source_hashes: Content hash of each chunk file, keyed by
+            index_store.source_name
+
+    Returns:
+        The version
+    """
+    return fingerprint_sources(source_hashes, alias_version())
+
+def write_entity_index(rag_dir: str) -> EntityIndex:
+    """
+    Build the entity index of the chunk files in a directory and store it there.
+
+    Args:
+        rag_dir: Directory of the RAG chunk files
+
+    Returns:
+        The index
+    """
+    paths = list_chunk_files(rag_dir)
+    index = EntityIndex.from_chunk_files(paths)
+    index.save(
+        os.path.join(rag_dir, ENTITY_FILE),
+        entity_index_version({source_name(path): hash_file(path) for path in paths})
+    )
+    return index
+
+def load_entity_index(rag_dir: str, index_dir: str, vector_store: FAISS) -> EntityIndex:
+    """
+    Load the entity index stored with the RAG chunks, or build it.
+
+    The stored index is used when it was built from the chunk files the
+    persisted vector index was built from (as recorded in its manifest) with
+    the current alias table. Otherwise the index is built from the vector
+    store and kept in memory.
+
+    Args:
+        rag_dir: Directory of the RAG chunk files
+        index_dir: Directory of the persisted vector index
+        vector_store: The vector store loaded from index_dir (or the
+            unpersisted fallback store)
+
+    Returns:
+        An entity index resolved to the vector store's docstore ids
+    """
+    path = os.path.join(rag_dir, ENTITY_FILE)
+    manifest = read_index_meta(index_dir)
+    if manifest and os.path.exists(path):
+        version = entity_index_version(
+            {name: entry['hash'] for name, entry in manifest.get('sources', {}).items()}
+        )
+        try:
+            index, saved_version = EntityIndex.load(path)
+            if saved_version == version:
+                index.bind(vector_store)
+                return index
+            print(f"Entity index {path} does not match the vector index; rebuilding it in memory")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading entity index from {path}: {str(e)}")
+
+    start = time.time()
+    index = EntityIndex.from_vector_store(vector_store)
+    print(f"Built entity index over {len(index)} chunks in {time.time() - start:.2f}s")
+    return index
+
+if __name__ == "__main__":
+    rag_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join("output", "rag_chunks")
+    start = time.time()
+    index = write_entity_index(rag_dir)
+    print(f"Indexed {index.stats()['entities']} entities over {len(index)} chunks in {time.time() - start:.2f}s")
+    for name, chunks in index.top_entities():
+        print(f"  {name}: {chunks} chunks")
@@ -0,0 +1,16 @@
+"""
+Gunicorn settings for serving api.py (see Procfile).
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '7860')}"
+# Workers memory-map the same index files, so each extra worker costs the
+# models' memory but not another copy of the index. The first worker to
+# start builds or updates the index; the others wait for it on the index lock.
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Workers boot without loading models (see lazy_components.py), but the
+# first requests may wait while the vector index is built
+timeout = 600
+graceful_timeout = 30
@@ -0,0 +1,666 @@
+"""
+Game of Thrones Vector Index Store
+
+This module persists the FAISS vector index built from the RAG chunks so that
+server processes can reuse it instead of re-embedding the whole saga on every
+start. It is shared by the Gradio app and GameOfThronesBot.
+
+An index directory contains:
+- index.faiss: The raw FAISS index, an ID-mapped flat L2 index
+- index.pkl: The LangChain docstore and index-to-docstore-id mapping
+- index_meta.json: The manifest describing what the index was built from
+- index.ann.faiss: Optionally, an approximate index (HNSW, IVF, ...) built
+  from the flat one and searched instead of it (see ann_index.py)
+
+The manifest records a fingerprint of all sources (a content hash of the
+source files combined with the embedding model name) and, per source file, a
+hash of the file plus one entry per chunk (chunk_index, content hash, vector
+id). When the fingerprint matches, the index is loaded with FAISS
+memory-mapping so that several workers can share the same pages. When it does
+not, the index is updated in place: unchanged files are skipped, chunks whose
+content is already indexed keep their vectors, and only new or changed chunks
+are embedded. Chunks and files that disappeared are removed by vector id.
+The flat index stays the source of truth; an approximate index is rebuilt
+from it whenever it changes.
+
+Usage:
+    from chunk_store import list_chunk_files, load_chunk_file
+    from index_store import load_or_update_index
+
+    vector_store = load_or_update_index(
+        "faiss_index", list_chunk_files(rag_dir), embeddings, model_name, load_chunk_file
+    )
+
+    # Or, after re-running convert_books.py:
+    $ python backend/index_store.py
+"""
+
+import os
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import argparse
+import contextlib
+import faiss
+import numpy as np
+from langchain.vectorstores import FAISS
+from langchain.docstore.document import Document
+from langchain.docstore.in_memory import InMemoryDocstore
+from typing import Callable, Iterator, List, Dict, Optional, Any
+from chunk_store import BINARY_SUFFIX, JSON_SUFFIX, list_chunk_files, load_chunk_file
+from ann_index import BUILD_SETTINGS, INDEX_TYPES, build_ann_index, configure_search, flat_vectors
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl; msvcrt provides an equivalent byte-range lock
+    fcntl = None
+    import msvcrt
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+META_FILE = "index_meta.json"
+ANN_FILE = "index.ann.faiss"
+LOCK_SUFFIX = ".index.lock"
+MANIFEST_VERSION = 2
+
+def list_source_files(directory: str, suffixes: tuple) -> List[str]:
+    """
+    List the files in a directory that an index is built from.
+
+    Args:
+        directory: Directory to scan
+        suffixes: File name suffixes to include (e.g. ('.json',))
+
+    Returns:
+        Sorted list of file paths, empty if the directory does not exist
+    """
+    if not os.path.exists(directory):
+        return []
+    return sorted(
+        os.path.join(directory, filename)
+        for filename in os.listdir(directory)
+        if filename.endswith(suffixes)
+    )
+
+def hash_file(path: str) -> str:
+    """
+    Compute the SHA-256 digest of a file's bytes.
+
+    Args:
+        path: Path of the file to hash
+
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_text(text: str) -> str:
+    """
+    Compute the SHA-256 digest of a chunk's text.
+
+    Args:
+        text: The chunk content
+
+    Returns:
+        Hex digest of the UTF-8 encoded text
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def fingerprint_sources(source_hashes: Dict[str, str], model_name: str) -> str:
+    """
+    Compute a content hash identifying the inputs of a vector index.
+
+    The hash covers the embedding model name and the name and content hash
+    of every source file, so renaming, editing, adding or removing a chunk
+    file or switching embedding model all produce a new fingerprint.
+
+    Args:
+        source_hashes: Mapping of source name to its content hash
+        model_name: Name of the embedding model
+
+    Returns:
+        Hex digest of the fingerprint
+    """
+    digest = hashlib.sha256()
+    digest.update(model_name.encode('utf-8'))
+    for name in sorted(source_hashes):
+        digest.update(f"\0{name}\0{source_hashes[name]}".encode('utf-8'))
+    return digest.hexdigest()
+
+def source_name(path: str) -> str:
+    """
+    Name a source file in the manifest.
+
+    Chunk files are named after their book without the format suffix, so
+    converting a book between the JSON and binary chunk formats reuses its
+    vectors instead of re-embedding it.
+
+    Args:
+        path: Path of the source file
+
+    Returns:
+        The manifest key of the source
+    """
+    name = os.path.basename(path)
+    for suffix in (BINARY_SUFFIX, JSON_SUFFIX):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def read_index_meta(index_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the manifest stored next to a persisted index.
+
+    Args:
+        index_dir: Directory containing the persisted index
+
+    Returns:
+        The manifest dictionary, or None if missing, unreadable or written
+        by an incompatible version of this module
+    """
+    try:
+        with open(os.path.join(index_dir, META_FILE), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != MANIFEST_VERSION:
+        return None
+    return meta
+
+def index_version(index_dir: str) -> Optional[str]:
+    """
+    Identify the version of a persisted index, for invalidating caches.
+
+    Args:
+        index_dir: Directory containing the persisted index
+
+    Returns:
+        The fingerprint of the index, or None if there is no index
+    """
+    manifest = read_index_meta(index_dir)
+    return manifest.get('fingerprint') if manifest else None
+
+@contextlib.contextmanager
+def index_lock(index_dir: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock while building or updating an index.
+
+    Several server workers start at the same time; the lock makes all but
+    one of them wait and then load the index the first one wrote. The lock
+    file sits next to the index directory as <index_dir>.index.lock.
+
+    Args:
+        index_dir: Directory of the index being guarded
+    """
+    lock_path = os.path.abspath(index_dir).rstrip(os.sep) + LOCK_SUFFIX
+    with open(lock_path, 'a+') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            while True:
+                try:
+                    # LK_LOCK itself only retries for about ten seconds
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+def save_index(vector_store: FAISS, index_dir: str, meta: Dict[str, Any]) -> None:
+    """
+    Persist a vector store and its manifest.
+
+    The index is written to a temporary sibling directory and swapped into
+    place, so a concurrently starting worker never sees a half-written index.
+
+    Args:
+        vector_store: The FAISS vector store to save
+        index_dir: Target directory for the persisted index
+        meta: Manifest to store alongside the index
+    """
+    tmp_dir = f"{index_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    faiss.write_index(vector_store.index, os.path.join(tmp_dir, INDEX_FILE))
+    with open(os.path.join(tmp_dir, DOCSTORE_FILE), 'wb') as f:
+        pickle.dump((vector_store.docstore, vector_store.index_to_docstore_id), f)
+    with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.rename(tmp_dir, index_dir)
+
+def load_index(index_dir: str, embeddings: Any, mmap: bool = True) -> FAISS:
+    """
+    Load a persisted vector store.
+
+    Args:
+        index_dir: Directory containing the persisted index
+        embeddings: Embedding model used to embed queries
+        mmap: Memory-map the index file instead of reading it into memory.
+            A memory-mapped index is read-only.
+
+    Returns:
+        The loaded FAISS vector store
+    """
+    index = _read_index(os.path.join(index_dir, INDEX_FILE), mmap)
+    with open(os.path.join(index_dir, DOCSTORE_FILE), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+def _read_index(index_path: str, mmap: bool = True) -> Any:
+    """Read a FAISS index file, memory-mapped if requested and supported."""
+    if mmap:
+        try:
+            return faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            # Not every index type supports memory-mapping
+            print(f"Memory-mapping {index_path} failed, reading it instead: {str(e)}")
+    return faiss.read_index(index_path)
+
+def _write_json_atomic(path: str, data: Dict[str, Any]) -> None:
+    """Replace a JSON file without ever leaving a partial one."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _attach_ann_index(
+    vector_store: FAISS,
+    index_dir: str,
+    manifest: Dict[str, Any],
+    ann: Dict[str, Any],
+) -> FAISS:
+    """
+    Make a persisted vector store search an approximate index.
+
+    The approximate index is loaded from index_dir if it was built from the
+    current flat index with the same settings, otherwise built from the flat
+    index and saved. Called while holding the index lock.
+
+    Args:
+        vector_store: The vector store loaded from index_dir
+        index_dir: Directory holding the persisted index
+        manifest: The index manifest; records the approximate index settings
+        ann: Settings of ann_index.build_ann_index plus optional 'nprobe'
+            and 'ef_search'
+
+    Returns:
+        The vector store, now searching the approximate index
+    """
+    build = {key: ann[key] for key in BUILD_SETTINGS if ann.get(key) is not None}
+    if build.get('index_type', 'flat') not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {build['index_type']}")
+    if build.get('index_type', 'flat') == 'flat' and build.get('vector_dtype', 'float32') == 'float32':
+        # The persisted index already is exact float32
+        return vector_store
+
+    ann_path = os.path.join(index_dir, ANN_FILE)
+    index = None
+    if manifest.get('ann') == build and os.path.exists(ann_path):
+        try:
+            index = _read_index(ann_path)
+        except Exception as e:
+            print(f"Error loading approximate index from {ann_path}: {str(e)}")
+    if index is None:
+        vectors, ids = flat_vectors(vector_store.index)
+        index = build_ann_index(vectors, ids, **build)
+        try:
+            tmp_path = f"{ann_path}.tmp-{os.getpid()}"
+            faiss.write_index(index, tmp_path)
+            os.replace(tmp_path, ann_path)
+            manifest['ann'] = build
+            _write_json_atomic(os.path.join(index_dir, META_FILE), manifest)
+        except OSError as e:
+            print(f"Could not save approximate index to {ann_path}: {str(e)}")
+
+    configure_search(index, ann.get('nprobe'), ann.get('ef_search'))
+    vector_store.index = index
+    return vector_store
+
+def _empty_store(embeddings: Any, dimension: int) -> FAISS:
+    """Create an empty vector store backed by an ID-mapped flat L2 index."""
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    return FAISS(embeddings, index, InMemoryDocstore({}), {})
+
+def _assign_vector_ids(
+    previous: List[Dict[str, Any]],
+    documents: List[Document],
+    next_id: int,
+) -> tuple:
+    """
+    Match the chunks of a reloaded source against its previously indexed chunks.
+
+    A chunk keeps the vector of the previous chunk with the same chunk_index
+    and content hash. Chunks that moved (e.g. after a paragraph was inserted
+    earlier in the book) then take the remaining vectors with the same
+    content hash in their original order, so identical chunks map to ids
+    deterministically. Everything else gets a fresh id.
+
+    Args:
+        previous: Manifest entries of the source's previously indexed chunks
+        documents: The source's current documents
+        next_id: First unused vector id
+
+    Returns:
+        Tuple of (manifest entries, ids needing embedding, stale ids, next_id)
+    """
+    exact = {(chunk['chunk_index'], chunk['hash']): chunk['id'] for chunk in previous}
+    by_hash: Dict[str, List[int]] = {}
+    for chunk in previous:
+        by_hash.setdefault(chunk['hash'], []).append(chunk['id'])
+
+    chunks = [
+        {
+            "chunk_index": doc.metadata.get('chunk_index', position),
+            "hash": hash_text(doc.page_content),
+            "id": None,
+        }
+        for position, doc in enumerate(documents)
+    ]
+    used = set()
+    for chunk in chunks:
+        vector_id = exact.get((chunk['chunk_index'], chunk['hash']))
+        if vector_id is not None and vector_id not in used:
+            chunk['id'] = vector_id
+            used.add(vector_id)
+
+    new_ids = []
+    for chunk in chunks:
+        if chunk['id'] is not None:
+            continue
+        candidates = [i for i in by_hash.get(chunk['hash'], []) if i not in used]
+        if candidates:
+            chunk['id'] = candidates[0]
+        else:
+            chunk['id'] = next_id
+            next_id += 1
+            new_ids.append(chunk['id'])
+        used.add(chunk['id'])
+
+    stale = [chunk['id'] for chunk in previous if chunk['id'] not in used]
+    return chunks, new_ids, stale, next_id
+
+def update_index(
+    vector_store: Optional[FAISS],
+    manifest: Dict[str, Any],
+    source_files: List[str],
+    source_hashes: Dict[str, str],
+    embeddings: Any,
+    load_source: Callable[[str], List[Document]],
+    embed_texts: Optional[Callable[[List[str]], Any]] = None,
+) -> Optional[FAISS]:
+    """
+    Bring a vector store in line with its source files, embedding only what changed.
+
+    Every source whose hash differs from the manifest is reloaded and its
+    chunks are matched against the previously indexed chunks of the same
+    source (see _assign_vector_ids). Matching chunks keep their vector and
+    get their metadata refreshed, new or edited chunks are embedded and added
+    under fresh ids, and leftover vectors are removed. Sources no longer
+    present are removed entirely. A source that fails to load is skipped and
+    keeps whatever was indexed for it before. The manifest is updated in place.
+
+    Args:
+        vector_store: The existing vector store, or None to start empty
+        manifest: The manifest describing vector_store
+        source_files: Current source file paths
+        source_hashes: Mapping of source file name to its content hash
+        embeddings: Embedding model for new chunks
+        load_source: Callable loading the documents of one source file
+        embed_texts: Callable embedding a list of texts into a matrix (e.g.
+            EmbeddingPipeline.embed); defaults to embeddings.embed_documents
+
+    Returns:
+        The updated vector store, or None if there was nothing to index
+    """
+    sources = manifest.setdefault('sources', {})
+    next_id = manifest.get('next_id', 0)
+    to_remove: List[int] = []
+    to_store: Dict[int, Document] = {}
+    to_embed_ids: List[int] = []
+
+    current = {source_name(path): path for path in source_files}
+    for name in list(sources):
+        if name not in current:
+            print(f"Removing {name} from the vector index")
+            to_remove.extend(chunk['id'] for chunk in sources.pop(name)['chunks'])
+
+    for name, path in current.items():
+        entry = sources.get(name)
+        if entry and entry['hash'] == source_hashes[name]:
+            continue
+
+        try:
+            documents = load_source(path)
+        except Exception as e:
+            print(f"Error loading file {path}: {str(e)}")
+            continue
+
+        chunks, new_ids, stale, next_id = _assign_vector_ids(
+            entry['chunks'] if entry else [], documents, next_id
+        )
+        to_store.update((chunk['id'], doc) for chunk, doc in zip(chunks, documents))
+        to_embed_ids.extend(new_ids)
+        to_remove.extend(stale)
+        sources[name] = {"hash": source_hashes[name], "chunks": chunks}
+        print(f"Updating {name}: {len(new_ids)} chunks to embed, "
+              f"{len(stale)} to remove, {len(chunks)} total")
+
+    if to_embed_ids:
+        start = time.time()
+        vectors = np.asarray(
+            (embed_texts or embeddings.embed_documents)([to_store[i].page_content for i in to_embed_ids]),
+            dtype=np.float32
+        )
+        print(f"Embedded {len(to_embed_ids)} chunks in {time.time() - start:.2f}s")
+        if vector_store is None:
+            vector_store = _empty_store(embeddings, vectors.shape[1])
+        vector_store.index.add_with_ids(vectors, np.asarray(to_embed_ids, dtype=np.int64))
+
+    if vector_store is None:
+        return None
+
+    if to_remove:
+        vector_store.index.remove_ids(np.asarray(to_remove, dtype=np.int64))
+
+    # Reused chunks are re-added so their metadata is current
+    docstore = vector_store.docstore
+    replaced = [
+        str(vector_id) for vector_id in set(to_remove) | set(to_store)
+        if isinstance(docstore.search(str(vector_id)), Document)
+    ]
+    if replaced:
+        docstore.delete(replaced)
+    if to_store:
+        docstore.add({str(vector_id): doc for vector_id, doc in to_store.items()})
+
+    vector_store.index_to_docstore_id = {
+        chunk['id']: str(chunk['id'])
+        for entry in sources.values()
+        for chunk in entry['chunks']
+    }
+    manifest['next_id'] = next_id
+    return vector_store
+
+def load_or_update_index(
+    index_dir: str,
+    source_files: List[str],
+    embeddings: Any,
+    model_name: str,
+    load_source: Callable[[str], List[Document]],
+    load_fallback: Optional[Callable[[], List[Document]]] = None,
+    embed_texts: Optional[Callable[[List[str]], Any]] = None,
+    ann: Optional[Dict[str, Any]] = None,
+) -> FAISS:
+    """
+    Load the persisted vector store if it is current, otherwise update it.
+
+    Args:
+        index_dir: Directory holding the persisted index
+        source_files: Files the index is built from
+        embeddings: Embedding model for documents and queries
+        model_name: Name of the embedding model, part of the fingerprint
+        load_source: Callable returning the documents of one source file
+        load_fallback: Callable returning documents to index when the
+            sources yield no documents at all
+        embed_texts: Callable embedding the texts of new chunks into a
+            matrix; defaults to embeddings.embed_documents
+        ann: Approximate index to search instead of the flat one, as
+            ann_index.build_ann_index settings plus optional 'nprobe' and
+            'ef_search' (e.g. {"index_type": "hnsw", "ef_search": 64}),
+            or None for exact search
+
+    Returns:
+        A FAISS vector store matching the current sources
+
+    Raises:
+        ValueError: If the sources yield no documents and there is no fallback
+    """
+    source_hashes = {source_name(path): hash_file(path) for path in source_files}
+    fingerprint = fingerprint_sources(source_hashes, model_name)
+    vector_store = None
+
+    if source_files:
+        with index_lock(index_dir):
+            vector_store = _load_or_update_locked(
+                index_dir, source_files, source_hashes, fingerprint,
+                embeddings, model_name, load_source, embed_texts
+            )
+            if vector_store is not None and vector_store.index.ntotal and ann:
+                vector_store = _attach_ann_index(vector_store, index_dir, read_index_meta(index_dir) or {}, ann)
+
+    if vector_store is None or vector_store.index.ntotal == 0:
+        if load_fallback is None:
+            raise ValueError("No documents found to create vector store")
+        # Not persisted; the fallback set is tiny
+        vector_store = FAISS.from_documents(load_fallback(), embeddings)
+    return vector_store
+
+def _load_or_update_locked(
+    index_dir: str,
+    source_files: List[str],
+    source_hashes: Dict[str, str],
+    fingerprint: str,
+    embeddings: Any,
+    model_name: str,
+    load_source: Callable[[str], List[Document]],
+    embed_texts: Optional[Callable[[List[str]], Any]],
+) -> Optional[FAISS]:
+    """Body of load_or_update_index, run while holding the index lock."""
+    manifest = read_index_meta(index_dir)
+    if manifest and manifest.get('fingerprint') == fingerprint:
+        try:
+            start = time.time()
+            vector_store = load_index(index_dir, embeddings)
+            print(f"Loaded vector index from {index_dir} in {time.time() - start:.2f}s")
+            return vector_store
+        except Exception as e:
+            print(f"Error loading vector index from {index_dir}: {str(e)}")
+            manifest = None
+
+    vector_store = None
+    if manifest and manifest.get('model_name') == model_name:
+        try:
+            vector_store = load_index(index_dir, embeddings, mmap=False)
+            print(f"Vector index in {index_dir} is stale, updating it")
+        except Exception as e:
+            print(f"Error loading vector index from {index_dir}: {str(e)}")
+    if vector_store is None:
+        print(f"Building vector index in {index_dir}")
+        manifest = {"version": MANIFEST_VERSION, "model_name": model_name, "sources": {}, "next_id": 0}
+
+    start = time.time()
+    vector_store = update_index(
+        vector_store, manifest, source_files, source_hashes, embeddings, load_source, embed_texts
+    )
+    if vector_store is None or vector_store.index.ntotal == 0:
+        print(f"No documents to index in {index_dir}")
+        return None
+    print(f"Vector index updated in {time.time() - start:.2f}s "
+          f"({vector_store.index.ntotal} vectors)")
+
+    manifest['fingerprint'] = fingerprint
+    manifest['updated_at'] = time.time()
+    try:
+        save_index(vector_store, index_dir, manifest)
+        print(f"Saved vector index to {index_dir}")
+    except OSError as e:
+        print(f"Could not save vector index to {index_dir}: {str(e)}")
+
+    return vector_store
+
+if __name__ == "__main__":
+    """
+    Update the persisted index after re-running convert_books.py, so that
+    server workers find a current index and start without embedding anything.
+    """
+    from langchain.embeddings import HuggingFaceEmbeddings
+    from embedding_pipeline import EmbeddingPipeline
+
+    parser = argparse.ArgumentParser(description="Build or update the FAISS index from RAG chunks")
+    parser.add_argument("--rag-dir", default="output/rag_chunks", help="Directory of chunk files")
+    parser.add_argument("--index-dir", default="faiss_index", help="Directory of the persisted index")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2", help="Embedding model name")
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts encoded per batch")
+    parser.add_argument("--workers", type=int, default=1, help="Embedding worker processes")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads per worker")
+    parser.add_argument("--float16", action="store_true", help="Store the embedding checkpoint as float16")
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES, help="Approximate index to build")
+    parser.add_argument("--vector-dtype", default="float32", help="Vector storage of the approximate index")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default: about 4 * sqrt(chunks))")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="Neighbors per HNSW node")
+    parser.add_argument("--onnx-dir", default=None,
+                        help="Embed with the int8 ONNX model of this directory (see onnx_embeddings.py)")
+    parser.add_argument("--no-sentences", action="store_true",
+                        help="Skip the sentence index of context compression (see context_compression.py)")
+    args = parser.parse_args()
+
+    if args.onnx_dir:
+        from onnx_embeddings import OnnxEmbeddings
+        embeddings = OnnxEmbeddings(args.onnx_dir, args.model, threads=args.threads)
+        embedding_version = embeddings.version
+    else:
+        embeddings = HuggingFaceEmbeddings(model_name=args.model)
+        embedding_version = args.model
+    def pipeline(checkpoint_path):
+        return EmbeddingPipeline(
+            embedding_version,
+            batch_size=args.batch_size,
+            workers=1 if args.onnx_dir else args.workers,
+            threads=args.threads,
+            dtype='float16' if args.float16 else 'float32',
+            checkpoint_path=checkpoint_path,
+            model=embeddings.client
+        )
+    vector_store = load_or_update_index(
+        args.index_dir,
+        list_chunk_files(args.rag_dir),
+        embeddings,
+        embedding_version,
+        load_chunk_file,
+        embed_texts=pipeline(f"{args.index_dir}.vectors").embed,
+        ann={"index_type": args.index_type, "vector_dtype": args.vector_dtype,
+             "nlist": args.nlist, "hnsw_m": args.hnsw_m}
+    )
+    if vector_store is not None and not args.no_sentences:
+        # Embedded here rather than on the server's first request
+        from context_compression import load_or_build_sentence_index
+        load_or_build_sentence_index(
+            args.index_dir, vector_store, pipeline(f"{args.index_dir}.sentences.vectors").embed
+        )
@@ -0,0 +1,165 @@
+"""
+Game of Thrones Lazy Components
+
+This module defers loading the bot's heavy components (embedding model,
+vector index, language model) until they are first needed, so the server
+binds its port and answers health checks right away instead of after every
+model is in memory. It provides:
+1. LazyComponent: A value loaded once, on first use, with its load time
+2. warm_up: Load components in a background thread after startup
+3. readiness: Report which components are loaded and how long each took
+
+Components that are never used (e.g. the language model of a server that
+only lists passages) are never loaded and cost no memory.
+
+Usage:
+    from lazy_components import LazyComponent, readiness, warm_up
+
+    vector_store = LazyComponent("vector_store", load_vector_store)
+    warm_up([vector_store])
+    docs = vector_store.get().similarity_search("Who is Jon Snow?")
+    print(readiness([vector_store]))
+"""
+
+import time
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+from metrics import record
+
+class LazyComponent:
+    """
+    A component loaded on first use.
+
+    Concurrent first uses wait for a single load. A failed load is recorded
+    and retried by the next use.
+
+    Attributes:
+        name: Name reported by readiness()
+        seconds: How long loading took, or None if not loaded
+        error: Message of the last failed load, or None
+    """
+
+    def __init__(self, name: str, load: Callable[[], Any]):
+        """
+        Define a component without loading it.
+
+        Args:
+            name: Name reported by readiness()
+            load: Function building the component; it may get() other
+                components it depends on
+        """
+        self.name = name
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._load = load
+        self._value: Any = None
+        self._loaded = False
+        self._loading = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the component is ready to use without waiting."""
+        return self._loaded
+
+    def get(self) -> Any:
+        """
+        Get the component, loading it first if needed.
+
+        Returns:
+            The loaded component
+
+        Raises:
+            Whatever the load function raised
+        """
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                print(f"Loading {self.name}...")
+                self._loading = True
+                start = time.time()
+                try:
+                    self._value = self._load()
+                except Exception as e:
+                    self.error = str(e)
+                    print(f"Error loading {self.name}: {str(e)}")
+                    raise
+                finally:
+                    self._loading = False
+                self.seconds = time.time() - start
+                record(f"load:{self.name}", self.seconds)
+                self.error = None
+                self._loaded = True
+                print(f"Loaded {self.name} in {self.seconds:.2f}s")
+        return self._value
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Report the component's state.
+
+        Returns:
+            Dictionary with 'state' ('loaded', 'loading', 'failed' or
+            'not loaded'), 'seconds' and 'error'
+        """
+        if self._loaded:
+            state = "loaded"
+        elif self._loading:
+            state = "loading"
+        elif self.error is not None:
+            state = "failed"
+        else:
+            state = "not loaded"
+        return {"state": state, "seconds": self.seconds, "error": self.error}
+
+def warm_up(components: Iterable[LazyComponent]) -> threading.Thread:
+    """
+    Load components one after another in a background thread.
+
+    Requests arriving meanwhile load what they need themselves (or wait for
+    the load in progress). Failures are recorded on the component, not
+    raised.
+
+    Args:
+        components: Components to load, in order
+
+    Returns:
+        The started thread
+    """
+    components = list(components)
+
+    def load_all():
+        start = time.time()
+        for component in components:
+            try:
+                component.get()
+            except Exception:
+                # Recorded in component.error and retried on first use
+                pass
+        print(f"Warm-up finished in {time.time() - start:.2f}s")
+
+    thread = threading.Thread(target=load_all, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def readiness(
+    components: Iterable[LazyComponent],
+    required: Optional[Iterable[LazyComponent]] = None,
+) -> Dict[str, Any]:
+    """
+    Report whether the server is ready to answer and what is loaded.
+
+    Args:
+        components: Every component, to report on
+        required: Components that must be loaded to be ready (default: all)
+
+    Returns:
+        Dictionary with 'ready' and, under 'components', the status() of
+        each component by name
+    """
+    components = list(components)
+    required = components if required is None else list(required)
+    return {
+        "ready": all(component.loaded for component in required),
+        "components": {component.name: component.status() for component in components},
+    }
@@ -0,0 +1,313 @@
+"""
+Game of Thrones Lexical Index
+
+This module provides a BM25 inverted index over the chunk corpus, used next
+to FAISS so that name-heavy questions ("Who is Ser Barristan Selmy?", "Where
+is Harrenhal?") find the chunks that actually mention those names. Embedding
+similarity alone tends to blur rare proper nouns.
+
+The index is stored in compressed sparse row form: for each term, the rows
+of the chunks containing it and the term's frequency in each. A query scores
+only the postings of its own terms with vectorized NumPy operations. The
+index is built from the vector store's docstore, so its document ids are the
+docstore ids, and is persisted next to the FAISS index, rebuilt whenever the
+index fingerprint changes.
+
+Usage:
+    from lexical_index import load_or_build_lexical_index
+
+    lexical_index = load_or_build_lexical_index("faiss_index", vector_store)
+    results = lexical_index.search("Where is Harrenhal?", k=8)
+"""
+
+import os
+import re
+import time
+import numpy as np
+from collections import Counter
+from langchain.vectorstores import FAISS
+from langchain.docstore.document import Document
+from typing import AbstractSet, Dict, Iterable, List, Optional, Tuple
+from index_store import index_lock, read_index_meta
+
+LEXICAL_FILE = "bm25.npz"
+
+# Common English words that match nearly every chunk
+STOPWORDS = frozenset("""
+a an and are as at be but by did do does for from had has have he her his how i
+in is it its of on or she so that the their them they this to was were what when
+where which who whom why will with you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase index terms.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        The terms of the text, without stopwords, in order
+    """
+    return [
+        token for token in re.findall(r"[a-z0-9]+(?:'[a-z]+)?", text.lower())
+        if token not in STOPWORDS
+    ]
+
+class BM25Index:
+    """
+    BM25-scored inverted index in compressed sparse row form.
+
+    Attributes:
+        doc_ids: Document id of each row
+        k1: BM25 term frequency saturation
+        b: BM25 document length normalization
+    """
+
+    def __init__(
+        self,
+        vocabulary: np.ndarray,
+        indptr: np.ndarray,
+        rows: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        doc_ids: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        """
+        Wrap prebuilt index arrays; use build() or load() to create an index.
+
+        Args:
+            vocabulary: Sorted array of terms
+            indptr: Start of each term's postings in rows/term_freqs, plus the end
+            rows: Row of each posting
+            term_freqs: Frequency of the term in each posting's row
+            doc_lengths: Number of terms of each row
+            doc_ids: Document id of each row
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+        """
+        self._vocabulary = vocabulary
+        self._term_ids: Dict[str, int] = {term: i for i, term in enumerate(vocabulary.tolist())}
+        self._indptr = indptr
+        self._rows = rows
+        self._term_freqs = term_freqs.astype(np.float32)
+        self._doc_lengths = doc_lengths
+        self.doc_ids = doc_ids
+        self.k1 = k1
+        self.b = b
+        self._masks: Dict[AbstractSet[str], np.ndarray] = {}
+
+        n = len(doc_ids)
+        doc_freqs = np.diff(indptr).astype(np.float32)
+        self._idf = np.log1p((n - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        average_length = float(doc_lengths.mean()) if n else 0.0
+        self._length_norm = (
+            k1 * (1 - b + b * doc_lengths / max(average_length, 1e-9))
+        ).astype(np.float32)
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]]) -> "BM25Index":
+        """
+        Build an index from documents.
+
+        Args:
+            documents: (document id, text) pairs
+
+        Returns:
+            The index
+        """
+        doc_ids = []
+        doc_lengths = []
+        term_ids: Dict[str, int] = {}
+        posting_terms = []
+        posting_rows = []
+        posting_freqs = []
+        for row, (doc_id, text) in enumerate(documents):
+            terms = tokenize(text)
+            doc_ids.append(doc_id)
+            doc_lengths.append(len(terms))
+            for term, freq in Counter(terms).items():
+                posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+                posting_rows.append(row)
+                posting_freqs.append(freq)
+
+        # Renumber terms in sorted order and group the postings by term
+        vocabulary = np.array(sorted(term_ids), dtype=str)
+        renumber = np.empty(len(term_ids), dtype=np.int64)
+        renumber[[term_ids[term] for term in vocabulary.tolist()]] = np.arange(len(term_ids))
+        terms = renumber[np.asarray(posting_terms, dtype=np.int64)]
+        order = np.argsort(terms, kind='stable')
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=indptr[1:])
+
+        return cls(
+            vocabulary,
+            indptr,
+            np.asarray(posting_rows, dtype=np.int32)[order],
+            np.minimum(np.asarray(posting_freqs, dtype=np.int64)[order], 65535).astype(np.uint16),
+            np.asarray(doc_lengths, dtype=np.int32),
+            np.array(doc_ids, dtype=str),
+        )
+
+    @classmethod
+    def from_vector_store(cls, vector_store: FAISS) -> "BM25Index":
+        """
+        Build an index over the documents of a vector store.
+
+        Args:
+            vector_store: The FAISS vector store
+
+        Returns:
+            The index, with docstore ids as document ids
+        """
+        def documents():
+            for doc_id in vector_store.index_to_docstore_id.values():
+                doc = vector_store.docstore.search(doc_id)
+                if isinstance(doc, Document):
+                    yield doc_id, doc.page_content
+        return cls.build(documents())
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Score every document for a query.
+
+        Args:
+            query: The query text
+
+        Returns:
+            float32 array of BM25 scores, one per row
+        """
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self._indptr[term_id], self._indptr[term_id + 1]
+            rows = self._rows[start:end]
+            freqs = self._term_freqs[start:end]
+            # Rows are unique within a term's postings, so += is safe
+            scores[rows] += self._idf[term_id] * freqs * (self.k1 + 1) / (freqs + self._length_norm[rows])
+        return scores
+
+    def row_mask(self, doc_ids: AbstractSet[str]) -> np.ndarray:
+        """
+        Get the boolean mask of the rows of some documents, cached per set.
+
+        Args:
+            doc_ids: Set of document ids (e.g. the docstore ids of a
+                partitions.PartitionIndex scope)
+
+        Returns:
+            Boolean array, True for rows whose document id is in doc_ids
+        """
+        mask = self._masks.get(doc_ids)
+        if mask is None:
+            mask = np.fromiter((doc_id in doc_ids for doc_id in self.doc_ids.tolist()),
+                               dtype=bool, count=len(self.doc_ids))
+            self._masks[doc_ids] = mask
+        return mask
+
+    def search(self, query: str, k: int = 4, mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """
+        Find the k best-scoring documents for a query.
+
+        Args:
+            query: The query text
+            k: Number of results
+            mask: Boolean array restricting the search to some rows
+                (see row_mask), or None to search every document
+
+        Returns:
+            (document id, score) pairs, best first; documents sharing no
+            term with the query are left out
+        """
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(str(self.doc_ids[row]), float(scores[row])) for row in candidates]
+
+    def save(self, path: str, version: Optional[str] = None) -> None:
+        """
+        Write the index to a compressed .npz file, atomically.
+
+        Args:
+            path: Target file
+            version: Version of the vector index it was built from
+        """
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez_compressed(
+            tmp_path,
+            vocabulary=self._vocabulary,
+            indptr=self._indptr,
+            rows=self._rows,
+            term_freqs=self._term_freqs.astype(np.uint16),
+            doc_lengths=self._doc_lengths,
+            doc_ids=self.doc_ids,
+            version=np.array(version or "", dtype=str),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["BM25Index", str]:
+        """
+        Read an index written by save().
+
+        Args:
+            path: The .npz file
+
+        Returns:
+            Tuple of (index, version it was saved with)
+        """
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(
+                data['vocabulary'], data['indptr'], data['rows'], data['term_freqs'],
+                data['doc_lengths'], data['doc_ids']
+            )
+            return index, str(data['version'])
+
+def load_or_build_lexical_index(index_dir: str, vector_store: FAISS) -> BM25Index:
+    """
+    Load the persisted lexical index matching a vector store, or build it.
+
+    Args:
+        index_dir: Directory of the persisted vector index
+        vector_store: The vector store loaded from index_dir (or the
+            unpersisted fallback store)
+
+    Returns:
+        A lexical index over the vector store's documents
+    """
+    path = os.path.join(index_dir, LEXICAL_FILE)
+    manifest = read_index_meta(index_dir)
+    persisted_chunks = (
+        sum(len(entry['chunks']) for entry in manifest.get('sources', {}).values())
+        if manifest else None
+    )
+    if persisted_chunks != vector_store.index.ntotal:
+        # Not the persisted index (e.g. the fallback store); keep it in memory
+        return BM25Index.from_vector_store(vector_store)
+    version = manifest.get('fingerprint')
+
+    with index_lock(index_dir):
+        if os.path.exists(path):
+            try:
+                index, saved_version = BM25Index.load(path)
+                if saved_version == version:
+                    return index
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error loading lexical index from {path}: {str(e)}")
+
+        start = time.time()
+        index = BM25Index.from_vector_store(vector_store)
+        index.save(path, version)
+        print(f"Built lexical index over {len(index)} chunks in {time.time() - start:.2f}s")
+        return index
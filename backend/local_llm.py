@@ -0,0 +1,317 @@
+"""
+Game of Thrones Local Language Model
+
+This module runs the language model locally on CPU, without any network
+access, and makes each generation cheaper than a plain transformers
+pipeline in three ways:
+
+1. Dynamic int8 quantization: the weights of every linear layer are stored
+   as int8 and activations are quantized on the fly, which roughly halves
+   the time of each forward pass on CPU. GPT-2 style models implement their
+   linear layers as Conv1D, which are converted to nn.Linear first so that
+   they are quantized too.
+2. Prompt-prefix KV cache: every prompt starts with one of a few fixed
+   instructions (the app's PROMPT_TEMPLATE, and LangChain's question
+   answering and question condensing prompts). The attention keys and
+   values of those prefixes are computed once at load time, and each
+   generation only encodes the rest of its prompt.
+3. A hard token cap: the prompt is cut from the left (oldest passages first,
+   keeping the question) so that prompt plus generated tokens never exceed
+   max_total_tokens, the model's context by default.
+
+LocalGenerator generates or streams text for a prompt; LocalLLM wraps it as
+a LangChain LLM for chains.
+
+Usage:
+    from local_llm import LocalGenerator, LocalLLM, default_prefixes
+
+    generator = LocalGenerator("distilgpt2", prefixes=default_prefixes())
+    answer = generator.generate(prompt)
+    for text in generator.stream(prompt):
+        print(text, end="")
+    chain = ConversationalRetrievalChain.from_llm(llm=LocalLLM(generator=generator), retriever=retriever)
+"""
+
+import time
+import threading
+from langchain.llms.base import LLM
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LLM_MODEL = "distilgpt2"
+MAX_NEW_TOKENS = 512
+
+def template_prefix(template: str) -> str:
+    """
+    Get the fixed text a prompt template starts with.
+
+    Args:
+        template: A str.format prompt template
+
+    Returns:
+        The template up to its first field
+    """
+    return template.split('{', 1)[0]
+
+def default_prefixes() -> List[str]:
+    """
+    Get the fixed prefixes of the prompts the bot sends: the app's prompt
+    and the prompts of LangChain's ConversationalRetrievalChain.
+
+    Returns:
+        The prefixes
+    """
+    from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
+    from langchain.chains.question_answering.stuff_prompt import PROMPT
+    from retrieval import PROMPT_TEMPLATE
+    return [template_prefix(template) for template in (PROMPT_TEMPLATE, PROMPT.template, CONDENSE_QUESTION_PROMPT.template)]
+
+def plan_tokens(prefix_tokens: int, prompt_tokens: int, max_new_tokens: int, max_total_tokens: int) -> Tuple[int, int]:
+    """
+    Fit a prompt and its answer into the token cap.
+
+    New tokens are reserved first, as long as at least one prompt token
+    remains, and the prompt is cut to the rest.
+
+    Args:
+        prefix_tokens: Tokens of the cached prefix
+        prompt_tokens: Tokens of the prompt after the prefix
+        max_new_tokens: Tokens wanted for the answer
+        max_total_tokens: Cap on prefix, prompt and answer tokens
+
+    Returns:
+        Tuple of (prompt tokens to keep, from the end; tokens to generate)
+
+    Raises:
+        ValueError: If the prefix leaves no room for the prompt
+    """
+    available = max_total_tokens - prefix_tokens
+    if available < 1:
+        raise ValueError("The prompt prefix is longer than max_total_tokens")
+    new_tokens = max(0, min(max_new_tokens, available - 1))
+    return min(prompt_tokens, available - new_tokens), new_tokens
+
+def cut_at_stop(text: str, stop: Optional[List[str]]) -> str:
+    """Cut text before the first occurrence of any stop sequence."""
+    for sequence in stop or ():
+        position = text.find(sequence)
+        if position >= 0:
+            text = text[:position]
+    return text
+
+def quantize_model(model: Any) -> Any:
+    """
+    Quantize the linear layers of a model to int8, dynamically.
+
+    Args:
+        model: A PyTorch transformers model in eval mode
+
+    Returns:
+        The quantized model
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    # Conv1D computes x @ W + b with W of shape (in, out): nn.Linear with W.T
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1])
+                linear.weight = torch.nn.Parameter(child.weight.detach().t().contiguous())
+                linear.bias = torch.nn.Parameter(child.bias.detach())
+                setattr(parent, name, linear)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+class LocalGenerator:
+    """
+    Local causal language model with cached prompt prefixes.
+
+    Attributes:
+        model_name: The Hugging Face model
+        tokenizer: The model's tokenizer
+        max_new_tokens: Default maximum tokens generated per prompt
+        max_total_tokens: Cap on prompt plus generated tokens
+        temperature: Sampling temperature; 0 for greedy decoding
+    """
+
+    def __init__(
+        self,
+        model_name: str = LLM_MODEL,
+        tokenizer: Any = None,
+        quantize: bool = True,
+        max_new_tokens: int = MAX_NEW_TOKENS,
+        max_total_tokens: Optional[int] = None,
+        prefixes: Sequence[str] = (),
+        threads: Optional[int] = None,
+        temperature: float = 0.0,
+    ):
+        """
+        Load the model and precompute the prefix caches.
+
+        Args:
+            model_name: The Hugging Face causal language model
+            tokenizer: Its already loaded tokenizer, or None to load it
+            quantize: Quantize the linear layers to int8
+            max_new_tokens: Default maximum tokens generated per prompt
+            max_total_tokens: Cap on prompt plus generated tokens (default:
+                the model's context length)
+            prefixes: Fixed prompt beginnings whose keys and values are
+                cached (see default_prefixes)
+            threads: PyTorch intra-op threads (default: PyTorch's choice)
+            temperature: Sampling temperature; 0 for greedy decoding
+        """
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32).eval()
+        self.model = quantize_model(model) if quantize else model
+        self.max_new_tokens = max_new_tokens
+        self.max_total_tokens = max_total_tokens or model.config.max_position_embeddings
+        self.temperature = temperature
+
+        # Longest first, so a prompt uses the longest prefix it starts with
+        self._prefixes: List[Tuple[str, List[int], Any]] = []
+        for prefix in sorted(set(prefixes), key=len, reverse=True):
+            if not prefix:
+                continue
+            ids = self.tokenizer(prefix, add_special_tokens=False)["input_ids"]
+            with torch.inference_mode():
+                past = self.model(input_ids=torch.tensor([ids]), use_cache=True).past_key_values
+            self._prefixes.append((prefix, ids, past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past))
+
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._prompt_tokens = 0
+        self._cached_tokens = 0
+        self._new_tokens = 0
+        self._seconds = 0.0
+
+    def _prefix_for(self, prompt: str) -> Tuple[str, List[int], Any]:
+        """Find the longest cached prefix of a prompt, leaving at least one character to encode."""
+        for prefix, ids, past in self._prefixes:
+            if len(prompt) > len(prefix) and prompt.startswith(prefix):
+                return prefix, ids, past
+        return "", [], None
+
+    @staticmethod
+    def _cache(past: Any) -> Any:
+        """Make a per-generation cache from a prefix cache, leaving the prefix cache unchanged."""
+        try:
+            from transformers import DynamicCache
+        except ImportError:
+            return past
+        return DynamicCache.from_legacy_cache(past)
+
+    def _next_token(self, logits: Any) -> int:
+        """Pick the next token: the most likely one, or sampled from the top 50."""
+        import torch
+        if self.temperature <= 0:
+            return int(torch.argmax(logits))
+        top = torch.topk(logits / self.temperature, 50)
+        return int(top.indices[torch.multinomial(torch.softmax(top.values, dim=-1), 1)])
+
+    def _generate_ids(self, prompt: str, max_new_tokens: Optional[int] = None) -> Iterator[int]:
+        """Generate token ids for a prompt, one at a time."""
+        import torch
+        start = time.perf_counter()
+        prefix, prefix_ids, prefix_past = self._prefix_for(prompt)
+        ids = self.tokenizer(prompt[len(prefix):], add_special_tokens=False)["input_ids"]
+        keep, new_tokens = plan_tokens(
+            len(prefix_ids), len(ids), max_new_tokens or self.max_new_tokens, self.max_total_tokens
+        )
+        ids = ids[len(ids) - keep:]
+        past = self._cache(prefix_past) if prefix_past is not None else None
+        generated = 0
+        try:
+            input_ids = torch.tensor([ids])
+            with torch.inference_mode():
+                for _ in range(new_tokens):
+                    output = self.model(input_ids=input_ids, past_key_values=past, use_cache=True)
+                    past = output.past_key_values
+                    token = self._next_token(output.logits[0, -1])
+                    if token == self.tokenizer.eos_token_id:
+                        break
+                    generated += 1
+                    yield token
+                    input_ids = torch.tensor([[token]])
+        finally:
+            with self._lock:
+                self._calls += 1
+                self._prompt_tokens += len(prefix_ids) + len(ids)
+                self._cached_tokens += len(prefix_ids)
+                self._new_tokens += generated
+                self._seconds += time.perf_counter() - start
+
+    def stream(self, prompt: str, max_new_tokens: Optional[int] = None) -> Iterator[str]:
+        """
+        Generate the continuation of a prompt, piece by piece.
+
+        Args:
+            prompt: The prompt
+            max_new_tokens: Maximum tokens to generate (default:
+                self.max_new_tokens), further limited by max_total_tokens
+
+        Yields:
+            Successive pieces of the generated text
+        """
+        ids: List[int] = []
+        text = ""
+        for token in self._generate_ids(prompt, max_new_tokens):
+            ids.append(token)
+            decoded = self.tokenizer.decode(ids, skip_special_tokens=True)
+            # Wait for the rest of a character split across tokens
+            if decoded.endswith("�"):
+                continue
+            if len(decoded) > len(text):
+                yield decoded[len(text):]
+                text = decoded
+
+    def generate(self, prompt: str, max_new_tokens: Optional[int] = None) -> str:
+        """
+        Generate the continuation of a prompt.
+
+        Args:
+            prompt: The prompt
+            max_new_tokens: Maximum tokens to generate
+
+        Returns:
+            The generated text
+        """
+        return "".join(self.stream(prompt, max_new_tokens))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the generator's counters.
+
+        Returns:
+            Dictionary with the number of generations, the average prompt
+            tokens, the share of prompt tokens served from prefix caches and
+            the generated tokens per second
+        """
+        calls = self._calls
+        return {
+            "generations": calls,
+            "average_prompt_tokens": self._prompt_tokens / calls if calls else 0.0,
+            "cached_prompt_share": self._cached_tokens / self._prompt_tokens if self._prompt_tokens else 0.0,
+            "tokens_per_second": self._new_tokens / self._seconds if self._seconds else 0.0,
+        }
+
+class LocalLLM(LLM):
+    """LangChain LLM generating with a LocalGenerator."""
+
+    generator: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "local"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        text = ""
+        for piece in self.generator.stream(prompt):
+            text += piece
+            if stop and any(sequence in text for sequence in stop):
+                break
+        return cut_at_stop(text, stop)
@@ -0,0 +1,174 @@
+"""
+Game of Thrones Pipeline Metrics
+
+This module records how long each stage of answering a question takes, in
+process, cheaply enough to stay on in production:
+
+- embed: Embedding the questions (retrieval.embed_questions)
+- search: The FAISS search
+- lexical_search: The BM25 search of hybrid retrieval
+- entity_search: The entity index search of hybrid retrieval
+- rerank: Cross-encoder reranking (reranker.Reranker)
+- expand: Expanding passages to neighboring chunks (neighbors.NeighborIndex)
+- compress: Context compression (context_compression.ContextCompressor)
+- prompt: Assembling the generation prompt (retrieval.build_prompt)
+- generation: Each LLM call (see retrieval.GenerationTimer)
+- answer_question, ask: Whole requests of the app and of GameOfThronesBot
+- load:<component>: Loading a lazily loaded model or index
+
+Each stage keeps cumulative histogram bucket counts and its most recent
+durations, from which the p50/p95/p99 are computed when a snapshot is taken.
+The api's /api/metrics endpoint serves the snapshot; benchmark.py reads it
+after replaying a question set. Counters are per process.
+
+Usage:
+    from metrics import metrics, timed
+
+    with timed("search"):
+        results = index.search(vectors, k)
+
+    print(metrics.snapshot()["search"]["p95_ms"])
+"""
+
+import time
+import threading
+import contextlib
+import numpy as np
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Most recent durations kept per stage for percentiles
+SAMPLE_SIZE = 2048
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    """
+    Summarize durations in milliseconds.
+
+    Args:
+        seconds: Durations in seconds
+
+    Returns:
+        Dictionary with 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms' and 'max_ms'
+        (all 0.0 without durations)
+    """
+    if not len(seconds):
+        return {"mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    ms = 1000 * np.asarray(seconds, dtype=np.float64)
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(ms.max()),
+    }
+
+class StageMetrics:
+    """
+    Latency histograms of named pipeline stages.
+
+    Attributes:
+        buckets: Upper bounds of the histogram buckets, in seconds
+        sample_size: Most recent durations kept per stage
+    """
+
+    def __init__(self, buckets: Sequence[float] = BUCKETS, sample_size: int = SAMPLE_SIZE):
+        """
+        Create empty histograms.
+
+        Args:
+            buckets: Increasing upper bounds of the histogram buckets, in
+                seconds; durations above the last go to an overflow bucket
+            sample_size: Most recent durations kept per stage
+        """
+        self.buckets = tuple(buckets)
+        self.sample_size = sample_size
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float) -> None:
+        """
+        Record one duration of a stage.
+
+        Args:
+            stage: Stage name
+            seconds: How long it took
+        """
+        bucket = int(np.searchsorted(self.buckets, seconds))
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {
+                    "count": 0,
+                    "total": 0.0,
+                    "bucket_counts": [0] * (len(self.buckets) + 1),
+                    "samples": deque(maxlen=self.sample_size),
+                }
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["bucket_counts"][bucket] += 1
+            entry["samples"].append(seconds)
+
+    @contextlib.contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """
+        Time the enclosed block as one duration of a stage, even if it raises.
+
+        Args:
+            stage: Stage name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def snapshot(self, stages: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Report the histograms.
+
+        Args:
+            stages: Stages to report (default: all recorded stages)
+
+        Returns:
+            Dictionary per stage with 'count', 'total_s', the latency_summary
+            of the recent durations and 'buckets', the cumulative count of
+            durations up to each bound ("+Inf" for all)
+        """
+        with self._lock:
+            entries = {
+                stage: (entry["count"], entry["total"], list(entry["bucket_counts"]), list(entry["samples"]))
+                for stage, entry in self._stages.items()
+                if stages is None or stage in stages
+            }
+        report = {}
+        for stage, (count, total, bucket_counts, samples) in sorted(entries.items()):
+            cumulative = np.cumsum(bucket_counts).tolist()
+            report[stage] = {
+                "count": count,
+                "total_s": total,
+                **latency_summary(samples),
+                "buckets": {
+                    **{str(bound): cumulative[i] for i, bound in enumerate(self.buckets)},
+                    "+Inf": cumulative[-1],
+                },
+            }
+        return report
+
+    def reset(self) -> None:
+        """Forget every recorded duration."""
+        with self._lock:
+            self._stages.clear()
+
+# Stage durations of this process
+metrics = StageMetrics()
+
+def timed(stage: str) -> contextlib.AbstractContextManager:
+    """Time the enclosed block as one duration of a stage of the process metrics."""
+    return metrics.time(stage)
+
+def record(stage: str, seconds: float) -> None:
+    """Record one duration of a stage in the process metrics."""
+    metrics.record(stage, seconds)
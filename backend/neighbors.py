@@ -0,0 +1,203 @@
+"""
+Game of Thrones Neighbor Windows
+
+Chunks are small (MAX_TOKENS embedding tokens), so a retrieved chunk often
+cuts a scene in the middle. Rather than retrieving more chunks to make up
+for it, each hit is expanded to the chunks around it: the window of up to
+N chunks before and after it in the same chapter.
+
+NeighborIndex orders the chunks of each book by chunk_index once, at load,
+and precomputes for every position the bounds of its run: the consecutive
+chunks of the same book and chapter, without gaps in chunk_index. A window
+is then two array lookups. Windows of several hits that overlap or touch
+are merged into one passage, hits already inside a passage are dropped,
+and consecutive chunks are joined without the sentences they share (see
+chunker.join_sentence_runs).
+
+Each expanded passage keeps the metadata of its best hit, plus
+'chunk_range' (its first and last chunk_index) and 'chunks' (the content
+key of each of its chunks, with which the context compressor finds their
+stored sentence embeddings).
+
+Usage:
+    from neighbors import NeighborIndex
+
+    neighbors = NeighborIndex.from_vector_store(vector_store)
+    passages = neighbors.expand(vector_store.similarity_search(question, k=2), window=1)
+"""
+
+import threading
+import numpy as np
+from langchain.vectorstores import FAISS
+from langchain.docstore.document import Document
+from typing import Any, Dict, List, Tuple
+from chunk_store import chunk_key, content_key
+from chunker import join_sentence_runs, split_sentences
+from metrics import timed
+
+# Chunks taken on each side of a hit
+NEIGHBOR_WINDOW = 1
+
+class NeighborIndex:
+    """
+    Chunks in book order, with the bounds of each chunk's chapter run.
+
+    Attributes:
+        docs: Every chunk, ordered by book and chunk_index
+        run_start: First position of the run of each position
+        run_end: Position after the last of the run of each position
+    """
+
+    def __init__(self, docs: List[Document]):
+        """
+        Order chunks and find their runs; use from_vector_store() to build
+        the index of a vector store.
+
+        Args:
+            docs: Chunks with a 'chunk_index' in their metadata; others
+                are left out
+        """
+        def book(doc):
+            return doc.metadata.get('book_title') or doc.metadata.get('source', '')
+
+        docs = [doc for doc in docs if isinstance(doc.metadata.get('chunk_index'), int)]
+        self.docs = sorted(docs, key=lambda doc: (book(doc), doc.metadata['chunk_index']))
+        self._positions: Dict[str, int] = {chunk_key(doc.metadata): i for i, doc in enumerate(self.docs)}
+
+        # A run breaks where the book or the chapter changes, or a chunk is missing
+        breaks = np.ones(len(self.docs), dtype=bool)
+        for i in range(1, len(self.docs)):
+            previous, doc = self.docs[i - 1], self.docs[i]
+            breaks[i] = (
+                book(doc) != book(previous)
+                or doc.metadata.get('chapter') != previous.metadata.get('chapter')
+                or doc.metadata['chunk_index'] != previous.metadata['chunk_index'] + 1
+            )
+        starts = np.flatnonzero(breaks)
+        ends = np.append(starts[1:], len(self.docs))
+        runs = np.cumsum(breaks) - 1
+        self.run_start = starts[runs].astype(np.int32)
+        self.run_end = ends[runs].astype(np.int32)
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hits = 0
+        self._passages = 0
+        self._chunks = 0
+
+    @classmethod
+    def from_vector_store(cls, vector_store: FAISS) -> "NeighborIndex":
+        """
+        Build the index of a vector store's chunks.
+
+        Args:
+            vector_store: The FAISS vector store
+
+        Returns:
+            The neighbor index
+        """
+        docs = []
+        for doc_id in vector_store.index_to_docstore_id.values():
+            doc = vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                docs.append(doc)
+        return cls(docs)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def window(self, doc: Document, size: int = NEIGHBOR_WINDOW) -> Tuple[int, int]:
+        """
+        Find the window around a chunk.
+
+        Args:
+            doc: The chunk
+            size: Chunks taken on each side
+
+        Returns:
+            (start, end) positions in docs, or (-1, -1) for a chunk not in
+            the index
+        """
+        position = self._positions.get(chunk_key(doc.metadata)) if 'chunk_index' in doc.metadata else None
+        if position is None:
+            return -1, -1
+        return (
+            max(position - size, int(self.run_start[position])),
+            min(position + size + 1, int(self.run_end[position])),
+        )
+
+    def _passage(self, hit: Document, start: int, end: int) -> Document:
+        """Join the chunks of a window into one passage with the metadata of its best hit."""
+        chunks = self.docs[start:end]
+        if len(chunks) == 1:
+            return hit
+        pairs, _ = join_sentence_runs([split_sentences(chunk.page_content) for chunk in chunks])
+        return Document(
+            page_content=''.join(separator + sentence for separator, sentence in pairs),
+            metadata={
+                **hit.metadata,
+                'chunk_range': [chunks[0].metadata['chunk_index'], chunks[-1].metadata['chunk_index']],
+                'chunks': [content_key(chunk.page_content) for chunk in chunks],
+            },
+        )
+
+    def expand(self, docs: List[Document], window: int = NEIGHBOR_WINDOW) -> List[Document]:
+        """
+        Expand hits to their windows, merging windows that overlap or touch.
+
+        Args:
+            docs: Retrieved chunks, best first
+            window: Chunks taken on each side of each hit
+
+        Returns:
+            One passage per merged window, in the order of its best hit;
+            chunks not in the index are kept as they are
+        """
+        with timed("expand"):
+            # [start, end, best hit], or a Document kept as it is
+            items: List[Any] = []
+            for doc in docs:
+                start, end = self.window(doc, window)
+                if start < 0:
+                    items.append(doc)
+                    continue
+                merged = None
+                for item in list(items):
+                    if isinstance(item, Document) or self.run_start[item[0]] != self.run_start[start]:
+                        continue
+                    if start > item[1] or end < item[0]:
+                        continue
+                    if merged is None:
+                        merged = item
+                    else:
+                        # The window bridges two earlier ones
+                        start, end = min(start, item[0]), max(end, item[1])
+                        items.remove(item)
+                    merged[0], merged[1] = min(merged[0], start), max(merged[1], end)
+                if merged is None:
+                    items.append([start, end, doc])
+
+            passages = [item if isinstance(item, Document) else self._passage(item[2], item[0], item[1])
+                        for item in items]
+        with self._lock:
+            self._requests += 1
+            self._hits += len(docs)
+            self._passages += len(passages)
+            self._chunks += sum(item[1] - item[0] if isinstance(item, list) else 1 for item in items)
+        return passages
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the expansion counters.
+
+        Returns:
+            Dictionary with the number of expanded requests and the average
+            hits, passages and chunks per request
+        """
+        requests = self._requests
+        return {
+            "requests": requests,
+            "average_hits": self._hits / requests if requests else 0.0,
+            "average_passages": self._passages / requests if requests else 0.0,
+            "average_chunks": self._chunks / requests if requests else 0.0,
+        }
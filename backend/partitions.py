@@ -0,0 +1,218 @@
+"""
+Game of Thrones Search Partitions
+
+This module lets a search be scoped to part of the saga: one book, one POV
+chapter name (e.g. every "Arya" chapter), or every book up to a given one so
+that readers part-way through the series are not shown spoilers. It provides:
+1. book_number: The position of a book in the series, from its title
+2. search_scope: Build the hashable scope of a filtered search
+3. PartitionIndex: Precomputed vector ids per book and per chapter, and the
+   FAISS ID selectors of the scopes searched so far
+
+A scoped search only visits the vectors of its partition through a FAISS ID
+selector, rather than over-fetching from the whole index and filtering the
+results afterwards, which both wastes work and can leave fewer than k hits.
+
+Usage:
+    from partitions import PartitionIndex, search_scope
+
+    partitions = PartitionIndex.from_vector_store(vector_store)
+    params = partitions.search_params(search_scope(up_to_book=3))
+    distances, ids = vector_store.index.search(vectors, k, params=params)
+"""
+
+import re
+import threading
+import faiss
+import numpy as np
+from langchain.vectorstores import FAISS
+from langchain.docstore.document import Document
+from typing import Any, Dict, List, Optional, Tuple, Union
+from ann_index import search_parameters
+
+# Title fragments of the books in series order
+BOOK_ORDER = [
+    "game of thrones",
+    "clash of kings",
+    "storm of swords",
+    "feast for crows",
+    "dance with dragons",
+]
+
+def _normalize(text: str) -> str:
+    """Lowercase a title and collapse whitespace for matching."""
+    return re.sub(r'\s+', ' ', text.strip().lower())
+
+def book_number(title: str) -> Optional[int]:
+    """
+    Find the position of a book in the series from its title.
+
+    Titles differ between editions ("A Game Of Thrones", "A Dance with
+    Dragons: A Song of Ice and Fire: Book Five"), so books are matched on
+    the distinctive part of their title.
+
+    Args:
+        title: The book title
+
+    Returns:
+        1 for A Game of Thrones through 5 for A Dance with Dragons, or None
+        for an unknown title
+    """
+    title = _normalize(title)
+    for number, fragment in enumerate(BOOK_ORDER, 1):
+        if fragment in title:
+            return number
+    return None
+
+def search_scope(
+    book: Optional[Union[str, int]] = None,
+    chapter: Optional[str] = None,
+    up_to_book: Optional[Union[str, int]] = None,
+) -> Optional[Tuple]:
+    """
+    Build the scope of a filtered search.
+
+    Args:
+        book: Only search this book (title or number)
+        chapter: Only search chapters with this name (e.g. "Arya")
+        up_to_book: Only search this book and the ones before it (title or
+            number), for spoiler-safe answers
+
+    Returns:
+        A hashable scope, or None for an unfiltered search
+    """
+    def key(value):
+        if value is None or isinstance(value, int):
+            return value
+        return book_number(value) or _normalize(value)
+
+    if book is None and chapter is None and up_to_book is None:
+        return None
+    return (key(book), _normalize(chapter) if chapter else None, key(up_to_book))
+
+class PartitionIndex:
+    """
+    Vector ids grouped by book and chapter, for scoped searches.
+
+    Attributes:
+        books: Sorted vector ids of each book, keyed by book number (or
+            normalized title for books not in BOOK_ORDER)
+        chapters: Sorted vector ids of each chapter name in each book, keyed
+            by (book key, normalized chapter name)
+    """
+
+    def __init__(self, entries: List[Tuple[int, str, Dict[str, Any]]], index: Optional[Any] = None):
+        """
+        Group vectors into partitions; use from_vector_store() to build one
+        for a vector store.
+
+        Args:
+            entries: (vector id, docstore id, metadata) of every vector
+            index: The FAISS index to be searched, whose type decides the
+                kind of search parameters (None for a flat index)
+        """
+        books: Dict[Any, List[int]] = {}
+        chapters: Dict[Tuple[Any, str], List[int]] = {}
+        self._docstore_ids: Dict[int, str] = {}
+        for vector_id, docstore_id, metadata in entries:
+            title = metadata.get('book_title', '')
+            book = book_number(title) or _normalize(title)
+            books.setdefault(book, []).append(vector_id)
+            chapter = _normalize(str(metadata.get('chapter', '')))
+            chapters.setdefault((book, chapter), []).append(vector_id)
+            self._docstore_ids[vector_id] = docstore_id
+
+        self.books = {book: np.array(sorted(ids), dtype=np.int64) for book, ids in books.items()}
+        self.chapters = {key: np.array(sorted(ids), dtype=np.int64) for key, ids in chapters.items()}
+        self._index = index
+        self._cache: Dict[Tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_vector_store(cls, vector_store: FAISS) -> "PartitionIndex":
+        """
+        Build the partitions of a vector store.
+
+        Args:
+            vector_store: The FAISS vector store
+
+        Returns:
+            The partition index
+        """
+        entries = []
+        for vector_id, docstore_id in vector_store.index_to_docstore_id.items():
+            doc = vector_store.docstore.search(docstore_id)
+            if isinstance(doc, Document):
+                entries.append((int(vector_id), docstore_id, doc.metadata))
+        return cls(entries, vector_store.index)
+
+    def vector_ids(self, scope: Tuple) -> np.ndarray:
+        """
+        Find the vectors inside a scope.
+
+        Args:
+            scope: A scope from search_scope()
+
+        Returns:
+            Sorted vector ids in the scope
+        """
+        book, chapter, up_to_book = scope
+        parts = []
+        for (part_book, part_chapter), ids in self.chapters.items():
+            if book is not None and part_book != book:
+                continue
+            if chapter is not None and part_chapter != chapter:
+                continue
+            if up_to_book is not None:
+                if isinstance(up_to_book, int):
+                    # Books outside the known series order are never spoiler-safe
+                    if not isinstance(part_book, int) or part_book > up_to_book:
+                        continue
+                elif part_book != up_to_book:
+                    continue
+            parts.append(ids)
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def _scope_entry(self, scope: Tuple) -> tuple:
+        """Get (vector ids, selector parameters, docstore ids) of a scope, cached."""
+        with self._lock:
+            entry = self._cache.get(scope)
+            if entry is None:
+                ids = self.vector_ids(scope)
+                selector = faiss.IDSelectorBatch(ids)
+                params = (faiss.SearchParameters(sel=selector) if self._index is None
+                          else search_parameters(self._index, selector))
+                # The selector is kept with the parameters that point to it
+                entry = (ids, params, frozenset(self._docstore_ids[int(i)] for i in ids), selector)
+                self._cache[scope] = entry
+            return entry
+
+    def search_params(self, scope: Optional[Tuple]) -> Optional[Any]:
+        """
+        Get the FAISS search parameters restricting a search to a scope.
+
+        Args:
+            scope: A scope from search_scope(), or None
+
+        Returns:
+            faiss.SearchParameters with an ID selector, or None for no scope
+        """
+        return None if scope is None else self._scope_entry(scope)[1]
+
+    def docstore_ids(self, scope: Tuple) -> frozenset:
+        """
+        Get the docstore ids of the documents in a scope.
+
+        Args:
+            scope: A scope from search_scope()
+
+        Returns:
+            Set of docstore ids
+        """
+        return self._scope_entry(scope)[2]
+
+    def size(self, scope: Optional[Tuple]) -> Optional[int]:
+        """Number of vectors in a scope, or None for no scope."""
+        return None if scope is None else len(self._scope_entry(scope)[0])
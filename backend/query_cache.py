@@ -0,0 +1,274 @@
+"""
+Game of Thrones Query Cache
+
+This module caches per-question work so that repeated questions ("Who is Jon
+Snow?") skip query embedding, vector search and, where the call is stateless,
+answer generation. It provides:
+1. normalize_question: The cache key for a question
+2. QueryCache: A bounded LRU cache with TTL expiry, hit/miss counters,
+   version-based invalidation and an optional SQLite backing store
+3. CachedQueryEmbeddings: An Embeddings wrapper caching query embeddings
+
+Caches are tagged with a version (the index fingerprint for retrieval and
+answers, the model name for embeddings). Setting a different version clears
+the cache, so a rebuilt index never serves results from the previous one.
+
+Usage:
+    from query_cache import QueryCache, normalize_question
+
+    cache = QueryCache(max_size=1024, ttl=3600, version=index_version)
+    docs = cache.get(normalize_question(question))
+"""
+
+import re
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from langchain.embeddings.base import Embeddings
+from typing import Any, Dict, List, Optional
+
+_MISSING = object()
+
+def normalize_question(question: str) -> str:
+    """
+    Reduce a question to its cache key.
+
+    Case, surrounding and repeated whitespace, and trailing punctuation are
+    ignored, so "Who is Jon Snow?" and "who is jon snow" share an entry.
+
+    Args:
+        question: The user's question
+
+    Returns:
+        The normalized question
+    """
+    question = re.sub(r'\s+', ' ', question.strip().lower())
+    return question.rstrip('?!. ')
+
+class QueryCache:
+    """
+    Thread-safe LRU cache with TTL expiry and version invalidation.
+
+    Attributes:
+        name: Name used in log messages and stats
+        max_size: Maximum number of entries kept in memory
+        ttl: Seconds an entry stays valid, or None for no expiry
+        version: Version the cached entries belong to
+        hits: Number of lookups answered from the cache
+        misses: Number of lookups not in the cache
+        evictions: Number of entries dropped for size or age
+    """
+
+    def __init__(
+        self,
+        name: str = "cache",
+        max_size: int = 1024,
+        ttl: Optional[float] = 3600,
+        version: Optional[str] = None,
+        db_path: Optional[str] = None,
+    ):
+        """
+        Create a cache.
+
+        Args:
+            name: Name used in log messages and stats
+            max_size: Maximum number of entries kept in memory
+            ttl: Seconds an entry stays valid, or None for no expiry
+            version: Version the cached entries belong to
+            db_path: SQLite file backing the cache so entries survive
+                restarts, or None for a memory-only cache
+        """
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path is not None:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "name TEXT, key BLOB, value BLOB, expires_at REAL, version TEXT, "
+                "PRIMARY KEY (name, key))"
+            )
+            self._db.commit()
+            self._purge_db()
+
+    def _purge_db(self) -> None:
+        """Drop persisted entries that are expired or from another version."""
+        self._db.execute(
+            "DELETE FROM cache WHERE name = ? AND (version IS NOT ? OR expires_at < ?)",
+            (self.name, self.version, time.time())
+        )
+        self._db.commit()
+
+    def set_version(self, version: Optional[str]) -> None:
+        """
+        Tag the cache with a new version, clearing it if the version changed.
+
+        Args:
+            version: The new version (e.g. the index fingerprint)
+        """
+        with self._lock:
+            if version == self.version:
+                return
+            print(f"{self.name}: version changed, clearing {len(self._entries)} entries")
+            self.version = version
+            self._entries.clear()
+            if self._db is not None:
+                self._purge_db()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """
+        Look up an entry, refreshing its LRU position.
+
+        Args:
+            key: The cache key
+            default: Value returned on a miss
+
+        Returns:
+            The cached value, or default
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING and self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM cache WHERE name = ? AND key = ? AND version IS ?",
+                    (self.name, pickle.dumps(key), self.version)
+                ).fetchone()
+                if row is not None:
+                    entry = (pickle.loads(row[0]), row[1])
+                    self._store(key, entry)
+
+            if entry is not _MISSING and entry[1] is not None and entry[1] < now:
+                self._entries.pop(key, None)
+                self.evictions += 1
+                entry = _MISSING
+
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Any, value: Any) -> None:
+        """
+        Store an entry, evicting the least recently used ones beyond max_size.
+
+        Args:
+            key: The cache key
+            value: The value to cache
+        """
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._store(key, (value, expires_at))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                    (self.name, pickle.dumps(key), pickle.dumps(value),
+                     expires_at if expires_at is not None else float('inf'), self.version)
+                )
+                self._db.commit()
+
+    def _store(self, key: Any, entry: tuple) -> None:
+        """Insert an entry in memory; the caller holds the lock."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove every entry, in memory and on disk."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache WHERE name = ?", (self.name,))
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the cache's counters.
+
+        Returns:
+            Dictionary with size, hits, misses, evictions and hit_rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches query embeddings by normalized question.
+
+    Document embeddings are passed straight through. Pass this to the vector
+    store in place of the wrapped embeddings so every similarity search
+    benefits.
+
+    Attributes:
+        embeddings: The wrapped embedding model
+        cache: Cache of query vectors
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: QueryCache):
+        """
+        Wrap an embedding model.
+
+        Args:
+            embeddings: The embedding model to wrap
+            cache: Cache of query vectors, versioned by model name
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_question(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries, encoding all cache misses in one call.
+
+        Args:
+            texts: Queries to embed
+
+        Returns:
+            One vector per query, in input order
+        """
+        keys = [normalize_question(text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                vector = list(vector)
+                self.cache.set(keys[i], vector)
+                vectors[i] = vector
+        return vectors
+
+    def __getattr__(self, name: str) -> Any:
+        # Expose attributes of the wrapped model (model_name, client, ...)
+        if name in ('embeddings', 'cache'):
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
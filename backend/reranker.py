@@ -0,0 +1,167 @@
+"""
+Game of Thrones Passage Reranker
+
+This module adds a second retrieval stage: the first stage (FAISS, or FAISS
+fused with BM25) over-fetches candidates cheaply, and a cross-encoder, which
+reads the question and each passage together, picks the few best. The
+cross-encoder is far more accurate than comparing embeddings, so fewer
+passages need to go into the LLM prompt, which shortens generation.
+
+Pair scores are cached per (normalized question, passage), and candidates
+are scored in batches in first-stage order. If a request's time budget runs
+out before every candidate is scored, the first-stage order is used as is,
+so reranking never delays an answer by more than about one batch.
+
+Usage:
+    from reranker import Reranker, cross_encoder_scorer
+
+    reranker = Reranker(cross_encoder_scorer(), budget=0.25)
+    candidates = search_scheduler.search(question, 50)
+    docs = reranker.rerank(question, candidates, k=3)
+"""
+
+import time
+import hashlib
+import threading
+from langchain.docstore.document import Document
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from metrics import record
+from query_cache import QueryCache, normalize_question
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+def cross_encoder_scorer(
+    model_name: str = RERANK_MODEL,
+    max_length: int = 256,
+) -> Callable[[List[Tuple[str, str]]], List[float]]:
+    """
+    Load a sentence-transformers cross-encoder for CPU inference.
+
+    Args:
+        model_name: The cross-encoder model
+        max_length: Tokens of each (question, passage) pair read by the model
+
+    Returns:
+        Function returning the relevance score of each of a list of
+        (question, passage) pairs
+    """
+    from sentence_transformers import CrossEncoder
+    model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+    def score_pairs(pairs: List[Tuple[str, str]]) -> List[float]:
+        return [float(score) for score in model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)]
+    return score_pairs
+
+def _passage_key(doc: Document) -> str:
+    """Identify a passage by its content."""
+    return hashlib.sha1(doc.page_content.encode('utf-8')).hexdigest()
+
+class Reranker:
+    """
+    Reorders candidate passages by cross-encoder score within a time budget.
+
+    Attributes:
+        batch_size: Pairs scored per model call
+        budget: Seconds a rerank may take, or None for no limit
+        cache: Cache of pair scores
+        reranked: Number of reranked requests
+        fallbacks: Number of requests that kept the first-stage order
+    """
+
+    def __init__(
+        self,
+        score_pairs: Callable[[List[Tuple[str, str]]], List[float]],
+        batch_size: int = 16,
+        budget: Optional[float] = 0.25,
+        cache_size: int = 10000,
+        version: str = RERANK_MODEL,
+    ):
+        """
+        Create a reranker.
+
+        Args:
+            score_pairs: Function scoring (question, passage) pairs, higher
+                meaning more relevant (see cross_encoder_scorer)
+            batch_size: Pairs scored per model call
+            budget: Seconds a rerank may take, or None for no limit
+            cache_size: Maximum pair scores kept
+            version: Version of the cached scores (the model name)
+        """
+        self.batch_size = batch_size
+        self.budget = budget
+        self.cache = QueryCache("rerank_scores", max_size=cache_size, ttl=None, version=version)
+        self.reranked = 0
+        self.fallbacks = 0
+        self._seconds = 0.0
+        self._score_pairs = score_pairs
+        self._lock = threading.Lock()
+
+    def rerank(
+        self,
+        question: str,
+        candidates: List[Document],
+        k: int,
+        budget: Optional[float] = None,
+    ) -> List[Document]:
+        """
+        Pick the k most relevant candidates for a question.
+
+        Args:
+            question: The question
+            candidates: First-stage results, best first
+            k: Number of passages to return
+            budget: Seconds this rerank may take (default: self.budget)
+
+        Returns:
+            The k best candidates by cross-encoder score, or the first k
+            candidates if the budget ran out
+        """
+        if len(candidates) <= 1:
+            return candidates[:k]
+        budget = self.budget if budget is None else budget
+        start = time.perf_counter()
+        question_key = normalize_question(question)
+        keys = [(question_key, _passage_key(doc)) for doc in candidates]
+        scores = [self.cache.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        for batch_start in range(0, len(missing), self.batch_size):
+            if budget is not None and time.perf_counter() - start > budget:
+                elapsed = time.perf_counter() - start
+                record("rerank", elapsed)
+                with self._lock:
+                    self.fallbacks += 1
+                    self._seconds += elapsed
+                print(f"Rerank budget of {budget:.3f}s exceeded after {batch_start} of "
+                      f"{len(missing)} passages, keeping the search order")
+                return candidates[:k]
+            batch = missing[batch_start:batch_start + self.batch_size]
+            batch_scores = self._score_pairs([(question, candidates[i].page_content) for i in batch])
+            for i, score in zip(batch, batch_scores):
+                scores[i] = score
+                self.cache.set(keys[i], score)
+
+        # Stable sort, so ties keep the first-stage order
+        order = sorted(range(len(candidates)), key=lambda i: -scores[i])
+        elapsed = time.perf_counter() - start
+        record("rerank", elapsed)
+        with self._lock:
+            self.reranked += 1
+            self._seconds += elapsed
+        return [candidates[i] for i in order[:k]]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the reranker's counters.
+
+        Returns:
+            Dictionary with reranked and fallback requests, the average
+            milliseconds per request and the score cache stats
+        """
+        requests = self.reranked + self.fallbacks
+        return {
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "average_ms": 1000 * self._seconds / requests if requests else 0.0,
+            "cache": self.cache.stats(),
+        }
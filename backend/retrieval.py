@@ -0,0 +1,255 @@
+"""
+Game of Thrones Retrieval Helpers
+
+This module holds the retrieval steps shared by the Gradio app and
+GameOfThronesBot that go beyond a single LangChain similarity_search call.
+
+Functions:
+    embed_questions: Embed many questions in one encoder call
+    batch_similarity_search: Search the FAISS index for many questions at once
+    reciprocal_rank_fusion: Merge several rankings of the same documents
+    hybrid_batch_search: Fuse FAISS and BM25 results for many questions
+    build_prompt: Assemble the generation prompt from retrieved passages
+
+Classes:
+    SearchFunctionRetriever: LangChain retriever over a search function (e.g.
+        a batch_scheduler.BatchScheduler's search)
+    GenerationTimer: LangChain callback timing each LLM call
+
+Each step is timed as a stage of the process metrics (see metrics.py).
+
+Usage:
+    from retrieval import batch_similarity_search
+
+    results = batch_similarity_search(vector_store, embeddings, questions, k=4)
+"""
+
+import time
+import numpy as np
+from langchain.vectorstores import FAISS
+from langchain.docstore.document import Document
+from langchain.schema import BaseRetriever
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from typing import Any, Callable, Dict, Hashable, List, Sequence
+from metrics import record, timed
+
+PROMPT_TEMPLATE = (
+    "Use the following passages from the Game of Thrones books to answer the question.\n\n"
+    "{context}\n\n"
+    "Question: {question}\n"
+    "Answer:"
+)
+
+def embed_questions(embeddings: Any, questions: List[str]) -> np.ndarray:
+    """
+    Embed many questions in one encoder call.
+
+    Args:
+        embeddings: Embedding model; its embed_queries method is used when
+            available (see query_cache.CachedQueryEmbeddings), otherwise
+            embed_documents
+        questions: Questions to embed
+
+    Returns:
+        float32 array of shape (len(questions), dimension)
+    """
+    embed = getattr(embeddings, 'embed_queries', None) or embeddings.embed_documents
+    with timed("embed"):
+        return np.asarray(embed(questions), dtype=np.float32)
+
+def batch_similarity_search(
+    vector_store: FAISS,
+    embeddings: Any,
+    questions: List[str],
+    k: int = 4,
+    search_params: Any = None,
+) -> List[List[Document]]:
+    """
+    Retrieve the k most similar chunks for each of many questions.
+
+    All questions are embedded together and searched with a single FAISS
+    call over the whole query matrix.
+
+    Args:
+        vector_store: The FAISS vector store to search
+        embeddings: Embedding model for the questions
+        questions: Questions to search for
+        k: Number of chunks per question
+        search_params: faiss.SearchParameters for the search, e.g. an ID
+            selector from partitions.PartitionIndex.search_params
+
+    Returns:
+        One list of Documents per question, in input order
+    """
+    return [
+        _documents(vector_store, doc_ids)
+        for doc_ids in _batch_search_ids(vector_store, embeddings, questions, k, search_params)
+    ]
+
+def _batch_search_ids(
+    vector_store: FAISS,
+    embeddings: Any,
+    questions: List[str],
+    k: int,
+    search_params: Any = None,
+) -> List[List[str]]:
+    """Search the FAISS index for many questions, returning docstore ids."""
+    if not questions:
+        return []
+    vectors = embed_questions(embeddings, questions)
+    with timed("search"):
+        if search_params is None:
+            _, ids = vector_store.index.search(vectors, k)
+        else:
+            _, ids = vector_store.index.search(vectors, k, params=search_params)
+    return [
+        [vector_store.index_to_docstore_id[int(vector_id)] for vector_id in row if vector_id >= 0]
+        for row in ids
+    ]
+
+def _documents(vector_store: FAISS, doc_ids: List[str]) -> List[Document]:
+    """Look up docstore ids, skipping any that are missing."""
+    docs = []
+    for doc_id in doc_ids:
+        doc = vector_store.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            docs.append(doc)
+    return docs
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = 60) -> List[Hashable]:
+    """
+    Merge rankings with reciprocal rank fusion.
+
+    Each item scores the sum of 1 / (k + rank) over the rankings it appears
+    in, so items ranked well by several retrievers rise to the top without
+    having to compare their incompatible raw scores.
+
+    Args:
+        rankings: Lists of items, best first
+        k: Damping constant; larger values flatten the rank differences
+
+    Returns:
+        All items, best fused score first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def hybrid_batch_search(
+    vector_store: FAISS,
+    embeddings: Any,
+    lexical_index: Any,
+    questions: List[str],
+    k: int = 4,
+    fetch_k: int = 20,
+    search_params: Any = None,
+    lexical_mask: Any = None,
+    entity_index: Any = None,
+    entity_mask: Any = None,
+) -> List[List[Document]]:
+    """
+    Retrieve the k best chunks for many questions from FAISS, BM25 and the
+    entity index.
+
+    The fetch_k best results of each retriever are merged with reciprocal
+    rank fusion, so chunks naming the characters or places asked about are
+    found even when embedding similarity ranks them low.
+
+    Args:
+        vector_store: The FAISS vector store to search
+        embeddings: Embedding model for the questions
+        lexical_index: lexical_index.BM25Index over the same docstore ids,
+            or None
+        questions: Questions to search for
+        k: Number of chunks per question
+        fetch_k: Number of candidates taken from each retriever
+        search_params: faiss.SearchParameters restricting the vector search
+        lexical_mask: Row mask restricting the BM25 search (see
+            BM25Index.row_mask); give both or neither
+        entity_index: entity_index.EntityIndex resolved to the same
+            docstore ids, or None
+        entity_mask: Row mask restricting the entity search (see
+            EntityIndex.row_mask), given with search_params
+
+    Returns:
+        One list of Documents per question, in input order
+    """
+    fetch_k = max(fetch_k, k)
+    vector_ids = _batch_search_ids(vector_store, embeddings, questions, fetch_k, search_params)
+    results = []
+    for question, doc_ids in zip(questions, vector_ids):
+        rankings = [doc_ids]
+        if lexical_index is not None:
+            with timed("lexical_search"):
+                rankings.append([doc_id for doc_id, _ in lexical_index.search(question, fetch_k, lexical_mask)])
+        if entity_index is not None:
+            with timed("entity_search"):
+                rankings.append([doc_id for doc_id, _ in entity_index.search(question, fetch_k, entity_mask)])
+        fused = reciprocal_rank_fusion(rankings)
+        results.append(_documents(vector_store, fused[:k]))
+    return results
+
+def build_prompt(question: str, docs: List[Document]) -> str:
+    """
+    Assemble the generation prompt for a question and its retrieved passages.
+
+    Args:
+        question: The user's question
+        docs: Retrieved passages
+
+    Returns:
+        The prompt text
+    """
+    with timed("prompt"):
+        context = "\n\n".join(doc.page_content for doc in docs)
+        return PROMPT_TEMPLATE.format(context=context, question=question)
+
+class SearchFunctionRetriever(BaseRetriever):
+    """
+    Retriever that delegates to a search function, so that chains such as
+    ConversationalRetrievalChain share the app's search path (batching,
+    caching) instead of calling the vector store directly.
+
+    Attributes:
+        search: Function returning the k most relevant Documents for a
+            query within a scope
+        k: Number of Documents to retrieve
+        scope: Scope passed to the search function (see
+            partitions.search_scope), or None to search everything
+    """
+
+    search: Callable[[str, int, Any], List[Document]]
+    k: int = 4
+    scope: Any = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.search(query, self.k, self.scope)
+
+class GenerationTimer(BaseCallbackHandler):
+    """
+    LangChain callback recording each LLM call, including those made inside
+    chains, as a 'generation' stage duration.
+    """
+
+    def __init__(self, stage: str = "generation"):
+        self.stage = stage
+        self._starts: Dict[Any, float] = {}
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: Any, **kwargs: Any) -> None:
+        self._starts[run_id] = time.perf_counter()
+
+    def _finish(self, run_id: Any) -> None:
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            record(self.stage, time.perf_counter() - start)
+
+    def on_llm_end(self, response: Any, *, run_id: Any, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: Any, **kwargs: Any) -> None:
+        self._finish(run_id)
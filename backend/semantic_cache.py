@@ -0,0 +1,205 @@
+"""
+Game of Thrones Semantic Cache
+
+This module reuses answers for questions that are paraphrases of questions
+already answered ("who's Jon's father" / "who is Jon Snow's dad"). Answered
+questions are embedded into a small FAISS inner-product index over
+normalized vectors; an incoming question whose cosine similarity to a cached
+question reaches the threshold gets that question's answer and sources back
+without calling the LLM.
+
+Questions about different characters can still embed closely ("Who is
+Robb's mother?" / "Who is Jon's mother?"), so a key function can be given,
+typically the entities a question names (entity_index.EntityIndex.match):
+a cached question is then only reused when its key is the same.
+
+Usage:
+    from semantic_cache import SemanticCache
+
+    cache = SemanticCache(embeddings, threshold=0.95, capacity=1000, key=entity_index.match)
+    hit = cache.lookup(question)
+    if hit is None:
+        answer, sources = run_llm(question)
+        cache.add(question, answer, sources)
+"""
+
+import time
+import threading
+import faiss
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional
+
+EVICTION_POLICIES = ("lru", "lfu", "fifo")
+# Most similar cached questions compared with a question's key
+KEY_CANDIDATES = 8
+
+class SemanticCache:
+    """
+    Similarity-based answer cache backed by a FAISS inner-product index.
+
+    Attributes:
+        embeddings: Embedding model used to embed questions
+        threshold: Minimum cosine similarity for a cache hit
+        capacity: Maximum number of cached questions
+        eviction: Policy choosing the entry to drop when full: 'lru' (least
+            recently used), 'lfu' (least frequently used) or 'fifo' (oldest)
+        key: Function of a question that must be equal for a cache hit, or
+            None
+        hits: Number of lookups answered from the cache
+        misses: Number of lookups not answered from the cache
+    """
+
+    def __init__(
+        self,
+        embeddings: Any,
+        threshold: float = 0.95,
+        capacity: int = 1000,
+        eviction: str = "lru",
+        key: Optional[Callable[[str], Any]] = None,
+    ):
+        """
+        Create an empty semantic cache.
+
+        Args:
+            embeddings: Embedding model used to embed questions
+            threshold: Minimum cosine similarity for a cache hit
+            capacity: Maximum number of cached questions
+            eviction: 'lru', 'lfu' or 'fifo'
+            key: Function of a question, such as the entities it names,
+                that must be equal for a cached answer to be reused
+        """
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.capacity = capacity
+        self.eviction = eviction
+        self.key = key
+        self.hits = 0
+        self.misses = 0
+        self._index = None
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _key(self, question: str) -> Any:
+        """Compute the key of a question, comparable with ==."""
+        if self.key is None:
+            return None
+        key = self.key(question)
+        return tuple(sorted(key)) if isinstance(key, (list, set, frozenset)) else key
+
+    def _embed(self, question: str) -> np.ndarray:
+        """Embed a question as a normalized row vector."""
+        vector = np.asarray([self.embeddings.embed_query(question)], dtype=np.float32)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the cached answer of the most similar previous question.
+
+        Args:
+            question: The incoming question
+
+        Returns:
+            Dictionary with 'question', 'answer', 'sources' and 'similarity'
+            of the matching entry, or None below the threshold or when no
+            similar enough entry has the question's key
+        """
+        vector = self._embed(question)
+        key = self._key(question)
+        with self._lock:
+            entry = None
+            if self._index is not None and self._index.ntotal:
+                k = 1 if self.key is None else min(KEY_CANDIDATES, self._index.ntotal)
+                similarities, ids = self._index.search(vector, k)
+                for similarity, entry_id in zip(similarities[0], ids[0]):
+                    if entry_id < 0 or similarity < self.threshold:
+                        break
+                    if self._entries[int(entry_id)]['key'] == key:
+                        entry = self._entries[int(entry_id)]
+                        entry['last_used'] = time.time()
+                        entry['uses'] += 1
+                        similarity = float(similarity)
+                        break
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            print(f"Semantic cache hit ({similarity:.3f}) for '{question}' ~ '{entry['question']}', "
+                  f"hit rate {self.hit_rate():.1%}")
+            return {
+                "question": entry['question'],
+                "answer": entry['answer'],
+                "sources": entry['sources'],
+                "similarity": similarity,
+            }
+
+    def add(self, question: str, answer: str, sources: Optional[List[Any]] = None) -> None:
+        """
+        Cache the answer to a question, evicting an entry if the cache is full.
+
+        Args:
+            question: The question that was answered
+            answer: The generated answer
+            sources: Source documents the answer was based on
+        """
+        vector = self._embed(question)
+        key = self._key(question)
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            while len(self._entries) >= self.capacity > 0:
+                self._evict()
+            if self.capacity <= 0:
+                return
+
+            entry_id = self._next_id
+            self._next_id += 1
+            now = time.time()
+            self._entries[entry_id] = {
+                "question": question,
+                "answer": answer,
+                "sources": sources or [],
+                "key": key,
+                "created": now,
+                "last_used": now,
+                "uses": 0,
+            }
+            self._index.add_with_ids(vector, np.asarray([entry_id], dtype=np.int64))
+
+    def _evict(self) -> None:
+        """Drop one entry according to the eviction policy; the caller holds the lock."""
+        key = {"lru": "last_used", "lfu": "uses", "fifo": "created"}[self.eviction]
+        entry_id = min(self._entries, key=lambda i: (self._entries[i][key], self._entries[i]['created']))
+        del self._entries[entry_id]
+        self._index.remove_ids(np.asarray([entry_id], dtype=np.int64))
+
+    def clear(self) -> None:
+        """Remove every cached entry."""
+        with self._lock:
+            self._entries.clear()
+            if self._index is not None:
+                self._index.reset()
+
+    def hit_rate(self) -> float:
+        """Fraction of lookups answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the cache's counters.
+
+        Returns:
+            Dictionary with size, hits, misses and hit_rate
+        """
+        return {
+            "name": "semantic",
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+        }
@@ -0,0 +1,143 @@
+"""
+Game of Thrones Request Runner
+
+This module runs the blocking work of API requests (embedding, search,
+generation) from an asyncio server without a thread per request. It provides:
+1. Overloaded: Raised when a request is rejected for backpressure
+2. RequestRunner: Runs blocking calls on a bounded thread pool, coalesces
+   identical in-flight requests onto one computation and rejects requests
+   beyond a queue limit
+
+Rejecting early (the server answers 429) keeps the latency of admitted
+requests predictable under bursts, instead of letting an unbounded queue
+build up behind the model.
+
+Usage:
+    from serving import Overloaded, RequestRunner
+
+    runner = RequestRunner(max_workers=4, max_pending=32)
+    answer = await runner.run(("ask", normalize_question(q)), answer_question, q)
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+class Overloaded(Exception):
+    """Raised when the runner has too many pending requests."""
+
+class RequestRunner:
+    """
+    Bounded executor with request coalescing and a queue limit.
+
+    Attributes:
+        max_workers: Number of threads running blocking calls
+        max_pending: Maximum number of requests admitted at once (running or
+            waiting for a thread); further requests raise Overloaded
+        pending: Number of requests currently admitted
+        coalesced: Number of requests served by another request's computation
+        rejected: Number of requests rejected with Overloaded
+        completed: Number of computations finished
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 32):
+        """
+        Create a runner.
+
+        Args:
+            max_workers: Number of threads running blocking calls
+            max_pending: Maximum number of requests admitted at once
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.completed = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gotbot")
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Take a place in the queue, for work not run through run() (e.g. a
+        streamed response). Every successful call must be matched by release().
+
+        Raises:
+            Overloaded: If the queue limit is reached
+        """
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded(f"{self.pending} requests pending")
+            self.pending += 1
+
+    def release(self) -> None:
+        """Give back a place taken with acquire()."""
+        with self._lock:
+            self.pending -= 1
+
+    async def run(self, key: Optional[Hashable], func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a blocking call on the thread pool.
+
+        A request with the same key as one still in flight waits for that
+        request's result instead of computing it again, and is not counted
+        against the queue limit.
+
+        Args:
+            key: Identifies the computation, or None to never coalesce
+            func: The blocking function to call
+            *args: Arguments for func
+
+        Returns:
+            The function's result
+
+        Raises:
+            Overloaded: If the queue limit is reached
+        """
+        if key is not None and key in self._inflight:
+            self.coalesced += 1
+            # Shielded, so a disconnecting client does not cancel the others
+            return await asyncio.shield(self._inflight[key])
+
+        self.acquire()
+        future = asyncio.wrap_future(self._executor.submit(func, *args))
+        if key is not None:
+            self._inflight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if key is not None and self._inflight.get(key) is future:
+                del self._inflight[key]
+            if future.done():
+                self._finish(future)
+            else:
+                # Cancelled while running: keep the slot until the thread is done
+                future.add_done_callback(self._finish)
+
+    def _finish(self, future: asyncio.Future) -> None:
+        """Release the slot of a finished computation."""
+        self.completed += 1
+        self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the runner's counters.
+
+        Returns:
+            Dictionary with pending, in-flight, coalesced, rejected and
+            completed counts
+        """
+        return {
+            "pending": self.pending,
+            "inflight": len(self._inflight),
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+            "completed": self.completed,
+        }
+
+    def shutdown(self) -> None:
+        """Stop the thread pool once running calls are done."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,243 @@
+"""
+Game of Thrones Session Store
+
+This module keeps the conversation history of each chat session separately,
+so concurrent users neither see nor corrupt each other's history. It provides:
+1. Session: The bounded history of one conversation
+2. SessionStore: Sessions keyed by session id, with idle-session expiry and
+   a cap on the number of sessions kept
+
+A session keeps only its last few turns, and drops older ones further while
+the history exceeds a token budget, so the condense-question prompt stays
+the same size however long a conversation runs. The newest turn is always
+kept: if it alone exceeds the budget, its answer is cut to fit. Histories are lists of
+(question, answer) tuples, the chat_history format ConversationalRetrievalChain
+accepts as input.
+
+Usage:
+    from session_store import SessionStore
+
+    sessions = SessionStore(max_turns=5, max_history_tokens=1000)
+    session = sessions.get(session_id)
+    with session.lock:
+        result = qa_chain({"question": question, "chat_history": session.history()})
+        session.add_turn(question, result["answer"])
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+def count_words(text: str) -> int:
+    """Approximate the token count of a text by its word count."""
+    return len(text.split())
+
+class Session:
+    """
+    Bounded conversation history of one session.
+
+    Attributes:
+        session_id: The session's id
+        max_turns: Maximum number of (question, answer) turns kept
+        max_history_tokens: Maximum tokens of history kept, or None
+        last_active: Time the session was last used
+        lock: Held by callers for a whole exchange so that the turns of one
+            session are recorded in order
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        max_turns: int = 5,
+        max_history_tokens: Optional[int] = 1000,
+        count_tokens: Callable[[str], int] = count_words,
+    ):
+        """
+        Create an empty session.
+
+        Args:
+            session_id: The session's id
+            max_turns: Maximum number of turns kept
+            max_history_tokens: Maximum tokens of history kept, or None
+            count_tokens: Function counting the tokens of a text
+        """
+        self.session_id = session_id
+        self.max_turns = max_turns
+        self.max_history_tokens = max_history_tokens
+        self.last_active = time.time()
+        self.lock = threading.RLock()
+        self._count_tokens = count_tokens
+        self._turns: List[Tuple[str, str]] = []
+        self._tokens: List[int] = []
+
+    def history(self) -> List[Tuple[str, str]]:
+        """
+        Get the session's history.
+
+        Returns:
+            Copy of the (question, answer) turns, oldest first
+        """
+        with self.lock:
+            return list(self._turns)
+
+    def _fit_answer(self, question: str, answer: str) -> Tuple[str, int]:
+        """Cut an answer at a word boundary so that the turn fits the token budget."""
+        question_tokens = self._count_tokens(question)
+        tokens = question_tokens + self._count_tokens(answer)
+        if self.max_history_tokens is None or tokens <= self.max_history_tokens:
+            return answer, tokens
+        # Longest prefix of whole words that fits, by binary search
+        word_ends = [match.end() for match in re.finditer(r'\S+', answer)]
+        low, high = 0, len(word_ends)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if question_tokens + self._count_tokens(answer[:word_ends[middle - 1]]) <= self.max_history_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        answer = answer[:word_ends[low - 1]] if low else ""
+        return answer, question_tokens + self._count_tokens(answer)
+
+    def add_turn(self, question: str, answer: str) -> None:
+        """
+        Record a turn, dropping the oldest turns beyond the limits.
+
+        The new turn itself is never dropped; when it alone exceeds the
+        token budget, its answer is cut to fit.
+
+        Args:
+            question: The user's question
+            answer: The answer given
+        """
+        with self.lock:
+            answer, tokens = self._fit_answer(question, answer)
+            self._turns.append((question, answer))
+            self._tokens.append(tokens)
+            while len(self._turns) > self.max_turns or (
+                self.max_history_tokens is not None
+                and len(self._turns) > 1 and sum(self._tokens) > self.max_history_tokens
+            ):
+                self._turns.pop(0)
+                self._tokens.pop(0)
+
+    def clear(self) -> None:
+        """Forget the session's history."""
+        with self.lock:
+            self._turns.clear()
+            self._tokens.clear()
+
+class SessionStore:
+    """
+    Thread-safe store of sessions keyed by session id.
+
+    Sessions idle for longer than idle_timeout are dropped, and when more than
+    max_sessions are kept the least recently used one is dropped.
+
+    Attributes:
+        max_turns: Maximum turns kept per session
+        max_history_tokens: Maximum tokens of history kept per session
+        idle_timeout: Seconds before an unused session is dropped, or None
+        max_sessions: Maximum number of sessions kept
+        evictions: Number of sessions dropped for idleness or size
+    """
+
+    def __init__(
+        self,
+        max_turns: int = 5,
+        max_history_tokens: Optional[int] = 1000,
+        idle_timeout: Optional[float] = 1800,
+        max_sessions: int = 1000,
+        count_tokens: Callable[[str], int] = count_words,
+    ):
+        """
+        Create an empty store.
+
+        Args:
+            max_turns: Maximum turns kept per session
+            max_history_tokens: Maximum tokens of history kept per session,
+                or None for no token limit
+            idle_timeout: Seconds before an unused session is dropped, or None
+            max_sessions: Maximum number of sessions kept
+            count_tokens: Function counting the tokens of a text (e.g. the
+                length of a tokenizer's encoding); defaults to word count
+        """
+        self.max_turns = max_turns
+        self.max_history_tokens = max_history_tokens
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.evictions = 0
+        self._count_tokens = count_tokens
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Session:
+        """
+        Get a session, creating it if needed.
+
+        Args:
+            session_id: The session's id
+
+        Returns:
+            The session
+        """
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, self.max_turns, self.max_history_tokens, self._count_tokens)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            self._sessions.move_to_end(session_id)
+            session.last_active = now
+            return session
+
+    def history(self, session_id: str) -> List[Tuple[str, str]]:
+        """
+        Get the history of a session.
+
+        Args:
+            session_id: The session's id
+
+        Returns:
+            The (question, answer) turns, oldest first
+        """
+        return self.get(session_id).history()
+
+    def reset(self, session_id: str) -> None:
+        """
+        Drop a session and its history.
+
+        Args:
+            session_id: The session's id
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict_idle(self, now: float) -> None:
+        """Drop sessions idle for longer than idle_timeout; the caller holds the lock."""
+        if self.idle_timeout is None:
+            return
+        # Sessions are ordered by last use, so idle ones are at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_active <= self.idle_timeout:
+                break
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the store's counters.
+
+        Returns:
+            Dictionary with the number of sessions and evictions
+        """
+        return {"sessions": len(self._sessions), "evictions": self.evictions}
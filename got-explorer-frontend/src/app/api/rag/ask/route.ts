@@ -1,5 +1,8 @@
 import { NextRequest, NextResponse } from 'next/server';
 
+// Streaming endpoint served by backend/api.py
+const STREAM_URL = process.env.GOTBOT_STREAM_URL || 'https://willhcurry-gotbot.hf.space/api/ask/stream';
+
 export async function POST(request: NextRequest) {
   try {
     const body = await request.json();
@@ -15,6 +18,29 @@ export async function POST(request: NextRequest) {
       });
     }
     
+    // Streaming mode: forward the newline-delimited JSON events as they arrive
+    if (body.stream) {
+      const upstream = await fetch(STREAM_URL, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json'
+        },
+        // Forward the whole body, so options such as book and up_to_book reach the backend
+        body: JSON.stringify({ ...body, text: question })
+      });
+      
+      if (!upstream.ok || !upstream.body) {
+        throw new Error(`Streaming API returned status ${upstream.status}`);
+      }
+      
+      return new Response(upstream.body, {
+        headers: {
+          'Content-Type': 'application/x-ndjson',
+          'Cache-Control': 'no-cache'
+        }
+      });
+    }
+    
     // Make the request to Hugging Face - IMPORTANT: Using the correct format
     const response = await fetch('https://willhcurry-gotbot.hf.space/api/predict', {
       method: 'POST',
@@ -0,0 +1,71 @@
+import os
+import sys
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from ann_index import benchmark, build_ann_index, configure_search, factory_string, flat_vectors, search_parameters
+from chunk_store import list_chunk_files, load_chunk_file
+from index_store import ANN_FILE, load_or_update_index, read_index_meta
+from test_index_store import CountingEmbeddings, setup_books
+
+def clustered_vectors(n=2000, dimension=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dimension))
+    vectors = centers[rng.integers(0, 20, size=n)] + rng.normal(scale=0.1, size=(n, dimension))
+    return vectors.astype(np.float32), np.arange(100, 100 + n, dtype=np.int64)
+
+def test_factory_strings():
+    assert factory_string("flat", 1000, 384) == "IDMap2,Flat"
+    assert factory_string("hnsw", 1000, 384, "int8", hnsw_m=16) == "IDMap2,HNSW16_SQ8"
+    assert factory_string("ivf_flat", 10000, 384, "float16") == "IVF256,SQfp16"
+    # Few vectors: fewer lists and smaller PQ codebooks so training succeeds
+    assert factory_string("ivf_pq", 800, 384) == "IVF20,PQ48x4"
+
+def test_approximate_indexes_keep_ids_and_recall():
+    vectors, ids = clustered_vectors()
+    results = benchmark(vectors, ids, [
+        {"index_type": "hnsw", "ef_search": 64},
+        {"index_type": "ivf_flat", "nprobe": 8},
+        {"index_type": "flat", "vector_dtype": "int8"},
+    ], k=5, n_queries=50)
+    for result in results:
+        assert result["recall"] > 0.9, result
+        assert result["p50_ms"] <= result["p99_ms"]
+
+    index = build_ann_index(vectors, ids, "ivf_flat")
+    _, found = index.search(vectors[:1], 1)
+    assert found[0][0] == ids[0]
+    restored, restored_ids = flat_vectors(build_ann_index(vectors, ids, "flat"))
+    assert np.array_equal(restored_ids, ids) and np.allclose(restored, vectors)
+
+def test_selector_parameters_match_index_type():
+    vectors, ids = clustered_vectors()
+    allowed = ids[::7]
+    for index_type in ("flat", "hnsw", "ivf_flat"):
+        index = build_ann_index(vectors, ids, index_type)
+        configure_search(index, nprobe=20, ef_search=128)
+        selector = faiss.IDSelectorBatch(allowed)
+        _, found = index.search(vectors[:5], 3, params=search_parameters(index, selector))
+        assert set(found.ravel().tolist()) <= set(allowed.tolist()), index_type
+
+def test_index_store_builds_and_reuses_ann_index(tmp_path):
+    setup_books(tmp_path)
+    index_dir = str(tmp_path / "faiss_index")
+
+    def load():
+        return load_or_update_index(
+            index_dir, list_chunk_files(str(tmp_path / "rag_chunks")), CountingEmbeddings(),
+            "fake-model", load_chunk_file, ann={"index_type": "hnsw", "hnsw_m": 8}
+        )
+
+    vector_store = load()
+    assert vector_store.index.ntotal == 5
+    assert isinstance(faiss.downcast_index(faiss.downcast_index(vector_store.index).index), faiss.IndexHNSW)
+    assert os.path.exists(os.path.join(index_dir, ANN_FILE))
+    assert read_index_meta(index_dir)["ann"] == {"index_type": "hnsw", "hnsw_m": 8}
+
+    mtime = os.path.getmtime(os.path.join(index_dir, ANN_FILE))
+    docs = load().similarity_search("a", k=5)
+    assert os.path.getmtime(os.path.join(index_dir, ANN_FILE)) == mtime
+    assert sorted(doc.page_content for doc in docs) == ["a", "b", "c", "x", "y"]
@@ -0,0 +1,66 @@
+import os
+import sys
+import threading
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from batch_scheduler import BatchScheduler
+
+def test_concurrent_searches_share_batches():
+    calls = []
+
+    def search_batch(questions, k, scope):
+        calls.append((list(questions), k))
+        return [[f"{q}-{i}" for i in range(k)] for q in questions]
+
+    scheduler = BatchScheduler(search_batch, max_batch_size=8, max_wait=0.2)
+    results = {}
+    questions = [f"q{i % 6}" for i in range(8)]
+
+    def ask(i):
+        results[i] = scheduler.search(questions[i], k=1 + i % 3)
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+
+    assert len(calls) < 8
+    assert all(len(set(batch)) == len(batch) for batch, _ in calls)
+    for i, question in enumerate(questions):
+        assert results[i] == [f"{question}-{j}" for j in range(1 + i % 3)]
+    assert scheduler.stats()["questions"] == 8
+
+def test_search_errors_reach_the_caller():
+    def search_batch(questions, k, scope):
+        raise RuntimeError("index unavailable")
+
+    scheduler = BatchScheduler(search_batch, max_wait=0)
+    with pytest.raises(RuntimeError, match="index unavailable"):
+        scheduler.search("q")
+    scheduler.close()
+
+def test_scopes_are_searched_separately():
+    calls = []
+
+    def search_batch(questions, k, scope):
+        calls.append(scope)
+        return [[(question, scope)] for question in questions]
+
+    scheduler = BatchScheduler(search_batch, max_wait=0.2)
+    results = {}
+
+    def ask(i, scope):
+        results[i] = scheduler.search("q", k=1, scope=scope)
+
+    threads = [threading.Thread(target=ask, args=(i, (i % 2, None, None))) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+
+    assert all(results[i] == [("q", (i % 2, None, None))] for i in range(4))
+    assert sorted(calls) == sorted(set(calls))
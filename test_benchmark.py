@@ -0,0 +1,31 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from benchmark import format_report, run_benchmark
+from metrics import record
+
+def fake_ask(i, question):
+    record("search", 0.002)
+    time.sleep(0.001)
+    if question == "fail":
+        raise RuntimeError("search failed")
+    return question
+
+def test_run_benchmark_reports_throughput_and_stages():
+    resets = []
+    results = run_benchmark(
+        fake_ask, ["Who is Jon Snow?", "fail", "Where is Winterfell?"], [1, 2],
+        rounds=2, reset=lambda: resets.append(1)
+    )
+    assert len(resets) == 2
+    assert [r["concurrency"] for r in results] == [1, 2]
+    for result in results:
+        assert result["requests"] == 6 and result["errors"] == 2
+        assert result["throughput_qps"] > 0 and result["p50_ms"] >= 1
+        # Stage metrics are reset for each level
+        assert result["stages"]["search"]["count"] == 6
+        assert result["stages"]["search"]["p50_ms"] == 2.0
+    report = format_report(results, {"embeddings": 1.5}, 512.0)
+    assert "Concurrency 2: 6 requests, 2 errors" in report and "search" in report
@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from chunk_filter import ChunkFilter, boilerplate_reason, filter_chunk_files, simhash
+from chunk_store import list_chunk_files, load_chunk_file
+
+PASSAGE = (
+    "The morning had dawned clear and cold, with a crispness that hinted at the end of summer. "
+    "They set forth at daybreak to see a man beheaded, twenty in all, and Bran rode among them, "
+    "nervous with excitement. This was the first time he had been deemed old enough to go with "
+    "his lord father and his brothers to see the king's justice done."
+)
+OTHER_PASSAGE = (
+    "Catelyn had never liked this godswood. She had been born a Tully, at Riverrun far to the south, "
+    "on the Red Fork of the Trident. The godswood there was a garden, bright and airy, where tall "
+    "redwoods spread dappled shadows across tinkling streams and birds sang from hidden nests."
+)
+
+def write_book(rag_dir, name, contents):
+    chunks = [
+        {"content": content, "metadata": {"book_title": name, "chapter": chapter, "chunk_index": i}}
+        for i, (chapter, content) in enumerate(contents)
+    ]
+    with open(os.path.join(rag_dir, f"{name}_rag.json"), "w") as f:
+        json.dump({"book_title": name, "chunks": chunks, "total_chunks": len(chunks)}, f)
+
+def test_boilerplate_rules():
+    assert boilerplate_reason("this one is for Melinda", "A Game of Thrones", "A Game Of Thrones") == "front/back matter"
+    assert boilerplate_reason("Map of the North\nPrologue\nBran", "Contents") == "front/back matter"
+    assert boilerplate_reason("GEORGE R. R. MARTIN sold his first story in 1971.", "Epilogue") == "front/back matter"
+    assert boilerplate_reason("Appendix", "Appendix") == "too short"
+    assert boilerplate_reason("Prologue\nBran\nCatelyn\nDaenerys\nEddard\nJon\nArya " + "x " * 10, "Maps") == "list"
+    assert boilerplate_reason(PASSAGE, "Bran") is None
+    # Appendix entries are short lines too, but with commas
+    entry = "\n".join(["COTTER PYKE, Commander, Eastwatch,"] * 6)
+    assert boilerplate_reason(entry, "Appendix") is None
+    # So are lines of terse dialogue, but with quotes and sentence punctuation
+    dialogue = ('"Ser?"\n\n"Go now."\n\n"As you command."\n\nShe left him there.\n\n'
+                '"Where is my brother?"\n\n"Dead."\n\n"I do not believe you."')
+    assert boilerplate_reason(dialogue, "Arya", "A Game of Thrones") is None
+    assert boilerplate_reason("ISBN 0-553-10354-7 " + PASSAGE, "Bran") == "front/back matter"
+    assert boilerplate_reason(PASSAGE.replace("beheaded", "Lisbnor's"), "Bran") is None
+
+def test_exact_and_near_duplicates():
+    assert bin(simhash(PASSAGE) ^ simhash(PASSAGE.replace("twenty", "nineteen"))).count("1") <= 6
+    assert bin(simhash(PASSAGE) ^ simhash(OTHER_PASSAGE)).count("1") > 6
+
+    chunk_filter = ChunkFilter()
+    assert chunk_filter.check(PASSAGE, {}, "a#0") is None
+    assert chunk_filter.check(OTHER_PASSAGE, {}, "a#1") is None
+    assert chunk_filter.check("  " + PASSAGE.upper(), {}, "b#0") == "duplicate of a#0"
+    assert chunk_filter.check(PASSAGE.replace("twenty", "nineteen"), {}, "b#1") == "near-duplicate of a#0"
+    assert chunk_filter.stats["filtered duplicate"] == 1
+    assert chunk_filter.stats["filtered near-duplicate"] == 1
+
+def test_entries_differing_in_a_name_are_kept():
+    joffrey = ("King Joffrey's banner shows the crowned stag of Baratheon, black on gold, "
+               "and the lion of Lannister, gold on crimson, combatant.")
+    stannis = ("Stannis has taken for his banner the fiery heart of the Lord of Light; a red heart "
+               "surrounded by orange flames upon a yellow field. Within the heart is the crowned stag "
+               "of House Baratheon, in black.")
+    chunk_filter = ChunkFilter()
+    assert chunk_filter.check(joffrey, {}, "a#0") is None
+    assert chunk_filter.check(stannis, {}, "a#1") is None
+    assert chunk_filter.check(joffrey.replace("Joffrey", "Tommen"), {}, "b#0") is None
+    assert chunk_filter.check("King " + stannis.replace(";", ":"), {}, "b#1") is None
+    assert chunk_filter.check(stannis.replace(";", ":"), {}, "b#2") == "near-duplicate of a#1"
+
+def test_filter_chunk_files_across_books(tmp_path):
+    write_book(str(tmp_path), "Book One", [
+        ("Book One", "for Phyllis, who made me put the dragons in"),
+        ("Bran", PASSAGE),
+        ("Catelyn", OTHER_PASSAGE),
+    ])
+    write_book(str(tmp_path), "Book Two", [
+        ("Bran", PASSAGE),
+        ("Catelyn", OTHER_PASSAGE + " The end."),
+    ])
+    paths = list_chunk_files(str(tmp_path))
+
+    report = filter_chunk_files(paths, mark=True)
+    assert report["kept_chunks"] == 5 and report["saved_bytes"] == 0
+    marked = [doc.metadata.get("filtered") for doc in load_chunk_file(paths[1])]
+    assert marked == ["duplicate of Book One#1", "near-duplicate of Book One#2"]
+
+    report = filter_chunk_files(paths, mark=False)
+    assert report["chunks"] == 5 and report["kept_chunks"] == 2
+    assert report["reasons"]["front/back matter"]["chunks"] == 1
+    assert report["saved_bytes"] == report["bytes"] - len(PASSAGE) - len(OTHER_PASSAGE)
+    docs = load_chunk_file(paths[0])
+    assert [doc.metadata["chunk_index"] for doc in docs] == [0, 1]
+    assert load_chunk_file(paths[1]) == []
@@ -0,0 +1,51 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from chunk_store import ChunkStore, chunk_writer, convert_json_to_binary, iter_chunk_file, list_chunk_files, load_chunk_file
+
+CHUNKS = [
+    ("Winter is coming.", {"book_title": "A Game Of Thrones", "chapter": "Bran", "chunk_index": 0}),
+    ("The Lannisters send their regards. — ser", {"book_title": "A Game Of Thrones", "chapter": "Catelyn", "chunk_index": 1}),
+    ("", {"book_title": "A Game Of Thrones", "chunk_index": 2, "tags": ["empty"]}),
+]
+
+def write(tmp_path, chunk_format):
+    writer = chunk_writer(str(tmp_path / "book"), "A Game Of Thrones", chunk_format)
+    for content, metadata in CHUNKS:
+        writer.add(content, metadata)
+    return writer.close()
+
+def test_binary_round_trip(tmp_path):
+    store = ChunkStore(write(tmp_path, "binary"))
+    assert len(store) == 3
+    assert store.book_title == "A Game Of Thrones"
+    assert [(doc.page_content, doc.metadata) for doc in store] == CHUNKS
+    # Interned metadata values are shared between chunks
+    assert store.metadata(0)["book_title"] is store.metadata(1)["book_title"]
+
+def test_json_and_binary_load_the_same(tmp_path):
+    json_path = write(tmp_path, "json")
+    with open(json_path) as f:
+        assert json.load(f)["total_chunks"] == 3
+    binary_path = convert_json_to_binary(json_path)
+    as_pairs = lambda docs: [(doc.page_content, doc.metadata) for doc in docs]
+    assert as_pairs(load_chunk_file(json_path)) == as_pairs(load_chunk_file(binary_path)) == CHUNKS
+
+def test_list_prefers_binary_store(tmp_path):
+    write(tmp_path, "json")
+    assert list_chunk_files(str(tmp_path)) == [str(tmp_path / "book_rag.json")]
+    write(tmp_path, "binary")
+    assert list_chunk_files(str(tmp_path)) == [str(tmp_path / "book_rag.chunks")]
+
+def test_chunks_are_read_lazily_and_the_store_is_unmapped(tmp_path):
+    path = write(tmp_path, "binary")
+    with ChunkStore(path) as store:
+        docs = store.documents()
+    assert store._mmap.closed
+    assert [(doc.page_content, doc.metadata) for doc in docs] == CHUNKS
+
+    chunks = iter_chunk_file(path)
+    assert next(chunks).page_content == "Winter is coming."
+    assert [doc.metadata["chunk_index"] for doc in chunks] == [1, 2]
@@ -0,0 +1,67 @@
+import os
+import sys
+from langchain.docstore.document import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from chunker import Chunker, split_sentences
+
+class WordCounter:
+    """Counts one token per word and records every text it counted"""
+
+    def __init__(self):
+        self.counted = []
+
+    def __call__(self, texts):
+        self.counted.extend(texts)
+        return [len(text.split()) for text in texts]
+
+TEXT = (
+    "Bran rode with his father. The man was a deserter.\n"
+    "“Do you understand why I did it?” Ned asked. Bran nodded!\n\n"
+    "They found the direwolf in the snow. She was dead. Her pups were alive."
+)
+
+def test_sentences_keep_paragraph_breaks():
+    assert split_sentences(TEXT) == [
+        ("", "Bran rode with his father."),
+        (" ", "The man was a deserter."),
+        ("\n", "“Do you understand why I did it?”"),
+        (" ", "Ned asked."),
+        (" ", "Bran nodded!"),
+        ("\n\n", "They found the direwolf in the snow."),
+        (" ", "She was dead."),
+        (" ", "Her pups were alive."),
+    ]
+
+def test_chunks_fit_budget_and_overlap_by_sentences():
+    chunker = Chunker(WordCounter(), max_tokens=14, overlap_tokens=4, special_tokens=2)
+    chunks = chunker.split(TEXT)
+    assert all(len(chunk.split()) <= 12 for chunk in chunks)
+    assert chunks[0] == "Bran rode with his father. The man was a deserter."
+    # Each chunk after the first starts with the previous chunk's last short sentence
+    assert chunks[1].startswith("“Do you understand why I did it?” Ned asked.")
+    assert chunks[2].startswith("Ned asked. Bran nodded!\n\nThey found")
+    assert chunks[-1].endswith("Her pups were alive.")
+    assert "\n\n".join(chunks).count("deserter") == 1
+
+    no_overlap = Chunker(WordCounter(), max_tokens=14, overlap_tokens=0, special_tokens=2).split(TEXT)
+    assert " ".join(" ".join(no_overlap).split()) == " ".join(TEXT.split())
+
+def test_long_sentences_are_split_on_words():
+    sentence = " ".join(f"word{i}" for i in range(25)) + "."
+    chunks = Chunker(WordCounter(), max_tokens=12, overlap_tokens=0, special_tokens=2).split(sentence)
+    assert [len(chunk.split()) for chunk in chunks] == [10, 10, 5]
+    assert " ".join(chunks) == sentence
+
+def test_token_counts_are_cached():
+    counter = WordCounter()
+    chunker = Chunker(counter, max_tokens=14, overlap_tokens=4, special_tokens=2)
+    chunker.split(TEXT + " " + TEXT)
+    assert len(counter.counted) == len(set(counter.counted)) == 8
+    chunker.split(TEXT)
+    assert len(counter.counted) == 8
+
+def test_split_documents_numbers_chunks():
+    chunker = Chunker(WordCounter(), max_tokens=14, overlap_tokens=0, special_tokens=2)
+    docs = chunker.split_documents([Document(page_content=TEXT, metadata={"source": "book.txt"})])
+    assert [doc.metadata for doc in docs] == [{"source": "book.txt", "chunk_index": i} for i in range(len(docs))]
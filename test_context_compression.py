@@ -0,0 +1,78 @@
+import os
+import sys
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from context_compression import GAP_SEPARATOR, ContextCompressor, SentenceIndex
+
+VOCABULARY = ["winterfell", "lord", "stark", "wall", "snow", "dragons", "daenerys", "lannister"]
+
+class KeywordEmbeddings:
+    """Embeds a text as counts of a few keywords, counting embedded texts"""
+
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [[text.lower().count(word) for word in VOCABULARY] for text in texts]
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+DOCS = [
+    Document(page_content="Ned Stark was lord of Winterfell. He had five children.\nHis wife was Catelyn.",
+             metadata={"chapter": "Bran"}),
+    Document(page_content="Daenerys had three dragons. They were born in fire.", metadata={"chapter": "Daenerys"}),
+    Document(page_content="Jon went to the Wall. It was cold.", metadata={"chapter": "Jon"}),
+]
+
+def test_passages_within_budget_are_kept():
+    compressor = ContextCompressor(KeywordEmbeddings(), count_words, max_tokens=100)
+    assert compressor.compress("Who was lord of Winterfell?", DOCS) == DOCS
+
+def test_keeps_most_relevant_sentences_in_order():
+    compressor = ContextCompressor(KeywordEmbeddings(), count_words, max_tokens=12)
+    docs = compressor.compress("Who was the Stark lord of Winterfell and did he have dragons?", DOCS)
+    assert [doc.page_content for doc in docs] == [
+        "Ned Stark was lord of Winterfell.",
+        "Daenerys had three dragons.",
+    ]
+    assert docs[0].metadata == {"chapter": "Bran"}
+    stats = compressor.stats()
+    assert stats["average_tokens_after"] <= 12 < stats["average_tokens_before"]
+
+    docs = ContextCompressor(KeywordEmbeddings(), count_words, max_tokens=7).compress(
+        "Snow at Winterfell", [Document(page_content="Snow fell. Bran slept. Robb ate. Winterfell was cold.")]
+    )
+    assert docs[0].page_content == "Snow fell." + GAP_SEPARATOR + "Winterfell was cold."
+
+def test_indexed_passages_are_not_embedded_again(tmp_path):
+    embeddings = KeywordEmbeddings()
+    index = SentenceIndex.build([doc.page_content for doc in DOCS], embeddings.embed_documents)
+    path = str(tmp_path / "sentences.npz")
+    index.save(path, "v1")
+    index, version = SentenceIndex.load(path)
+    assert version == "v1" and len(index) == 3
+    assert np.isclose(np.linalg.norm(index.vectors[0]), 1)
+    # Texts in one UTF-8 buffer, separators as one-byte codes
+    assert index.text.dtype == np.uint8 and index.separators.dtype == np.uint8
+    assert index.sentence_count == 7
+    assert index.lookup(DOCS[0].page_content)[0] == [
+        ("", "Ned Stark was lord of Winterfell."), (" ", "He had five children."), ("\n", "His wife was Catelyn.")
+    ]
+
+    embeddings.embedded = 0
+    compressor = ContextCompressor(embeddings, count_words, max_tokens=6, sentence_index=index)
+    docs = compressor.compress("Where is the Wall?", DOCS)
+    assert [doc.page_content for doc in docs] == ["Jon went to the Wall."]
+    # Only the question was embedded
+    assert embeddings.embedded == 1
+
+def test_other_layouts_are_rejected(tmp_path):
+    path = str(tmp_path / "sentences.npz")
+    np.savez(path, keys=np.array(["a"]), sentences=np.array(["Winter is coming."]), version=np.array("v1"))
+    with pytest.raises(ValueError):
+        SentenceIndex.load(path)
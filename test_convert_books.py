@@ -0,0 +1,85 @@
+import os
+import sys
+import multiprocessing
+import pytest
+from ebooklib import epub
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import chunker
+from chunker import MAX_TOKENS, OVERLAP_TOKENS, EMBEDDING_MODEL, Chunker
+from convert_books import convert_folder, split_into_chunks
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+def write_epub(path, title, chapters):
+    book = epub.EpubBook()
+    book.set_identifier(title)
+    book.set_title(title)
+    book.set_language("en")
+    items = []
+    for i, (heading, paragraphs) in enumerate(chapters):
+        item = epub.EpubHtml(title=heading, file_name=f"chapter{i}.xhtml", lang="en")
+        item.content = f"<h1>{heading}</h1>" + "".join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+        book.add_item(item)
+        items.append(item)
+    book.toc = items
+    book.spine = items
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(path, book)
+
+def read_outputs(output_dir):
+    outputs = {}
+    for root, _, filenames in os.walk(output_dir):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            with open(path, "rb") as f:
+                outputs[os.path.relpath(path, output_dir)] = f.read()
+    return outputs
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="workers inherit the word-counting chunker by forking")
+def test_workers_produce_identical_outputs(tmp_path, monkeypatch):
+    # Count words instead of loading the embedding model's tokenizer
+    monkeypatch.setitem(
+        chunker._default_chunkers,
+        (MAX_TOKENS, OVERLAP_TOKENS, EMBEDDING_MODEL),
+        Chunker(count_words, MAX_TOKENS, OVERLAP_TOKENS)
+    )
+    input_dir = tmp_path / "input"
+    os.makedirs(input_dir)
+    for n, name in enumerate(["A Game of Thrones", "A Clash of Kings", "A Storm of Swords"]):
+        write_epub(str(input_dir / f"book{n}.epub"), name, [
+            (f"Chapter {c}", [
+                f"Bran climbed the tower in chapter {c} of book {n}. Jon Snow watched from the yard.",
+                f"Tyrion Lannister read by the fire, page {c * 10}. The Imp drank more wine than anyone."
+            ] * 3)
+            for c in range(4)
+        ])
+
+    outputs = []
+    for workers in (1, 2):
+        output_dir = tmp_path / f"output{workers}"
+        converted = convert_folder(
+            str(input_dir),
+            str(output_dir / "book_markdown"),
+            str(output_dir / "lambda_markdown"),
+            str(output_dir / "rag_chunks"),
+            workers=workers
+        )
+        assert len(converted) == 3
+        outputs.append(read_outputs(output_dir))
+
+    assert outputs[0] == outputs[1]
+    assert not [name for name in outputs[0] if name.endswith(".tmp")]
+    assert len([name for name in outputs[0] if name.startswith("rag_chunks")]) == 4
+
+def test_split_into_chunks_keeps_its_size_argument(monkeypatch):
+    monkeypatch.setitem(chunker._default_chunkers, (40, 10, EMBEDDING_MODEL), Chunker(count_words, 40, 10))
+    text = " ".join(f"Sentence number {i} is about Winterfell." for i in range(30))
+
+    chunks = split_into_chunks(text, 40)
+    assert len(chunks) > 1
+    assert all(count_words([chunk])[0] <= 40 - 2 for chunk in chunks)
+    assert split_into_chunks(text, chunker=Chunker(count_words, 40, 10)) == chunks
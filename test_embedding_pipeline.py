@@ -0,0 +1,48 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from embedding_pipeline import EmbeddingPipeline
+
+class FakeModel:
+    """Encodes a text as [len(text), 1, 2]; optionally fails after some batches"""
+
+    def __init__(self, fail_after=None):
+        self.batches = []
+        self.fail_after = fail_after
+
+    def encode(self, texts, **kwargs):
+        if self.fail_after is not None and len(self.batches) == self.fail_after:
+            raise RuntimeError("worker died")
+        self.batches.append(list(texts))
+        return np.array([[len(text), 1.0, 2.0] for text in texts])
+
+TEXTS = ["a" * n for n in (3, 10, 1, 7, 5, 2, 8)]
+
+def test_vectors_in_input_order_and_batches_sorted_by_length():
+    model = FakeModel()
+    vectors = EmbeddingPipeline("fake", batch_size=3, model=model).embed(TEXTS)
+    assert vectors.dtype == np.float32
+    assert vectors[:, 0].tolist() == [len(text) for text in TEXTS]
+    assert [[len(text) for text in batch] for batch in model.batches] == [[10, 8, 7], [5, 3, 2], [1]]
+
+def test_checkpoint_resumes_after_crash(tmp_path):
+    checkpoint = str(tmp_path / "vectors")
+    with pytest.raises(RuntimeError):
+        EmbeddingPipeline("fake", batch_size=3, checkpoint_path=checkpoint,
+                          model=FakeModel(fail_after=2)).embed(TEXTS)
+    assert os.path.exists(checkpoint)
+
+    model = FakeModel()
+    vectors = EmbeddingPipeline("fake", batch_size=3, checkpoint_path=checkpoint, model=model).embed(TEXTS)
+    assert model.batches == [["a"]]
+    assert vectors[:, 0].tolist() == [len(text) for text in TEXTS]
+    assert not os.path.exists(checkpoint)
+
+def test_float16_checkpoint(tmp_path):
+    vectors = EmbeddingPipeline("fake", batch_size=2, dtype="float16",
+                                checkpoint_path=str(tmp_path / "vectors"), model=FakeModel()).embed(TEXTS)
+    assert vectors.dtype == np.float32
+    assert vectors[:, 0].tolist() == [len(text) for text in TEXTS]
@@ -0,0 +1,48 @@
+import os
+import sys
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from entity_index import EntityIndex, chunk_key
+from test_retrieval import HashEmbeddings
+
+DOCS = [
+    ("a", "Ned Stark rode north to Winterfell. Lord Eddard was tired."),
+    ("b", "The Imp drank wine in King's Landing."),
+    ("c", "Tyrion Lannister told Ned that Winterfell was cold."),
+    ("d", "Snow fell on the cat."),
+]
+
+def test_match_aliases_keeps_longest():
+    index = EntityIndex.build(DOCS)
+    assert index.match("Who is Ned Stark?") == ["Eddard Stark"]
+    assert index.match("What did the Imp’s brother do at King's Landing?") == ["Tyrion Lannister", "King's Landing"]
+    assert index.match("the Starks of Winterfell") == ["House Stark", "Winterfell"]
+    assert index.match("Is it snowing?") == []
+
+def test_search_ranks_by_entities_then_mentions():
+    index = EntityIndex.build(DOCS)
+    # c names both entities; a names Eddard twice, b names Tyrion once
+    assert [doc_id for doc_id, _ in index.search("Did Ned meet Tyrion?", k=5)] == ["c", "a", "b"]
+    assert index.search("Where is Dorne?", k=5) == []
+    mask = index.row_mask(frozenset({"a", "b"}))
+    assert [doc_id for doc_id, _ in index.search("Did Ned meet Tyrion?", k=5, mask=mask)] == ["a", "b"]
+    assert index.stats()["matched"] == 2
+
+def test_saved_index_binds_to_vector_store(tmp_path):
+    docs = [
+        Document(page_content=text, metadata={"book_title": "A Game of Thrones", "chunk_index": i})
+        for i, (_, text) in enumerate(DOCS)
+    ]
+    index = EntityIndex.build((chunk_key(doc.metadata), doc.page_content) for doc in docs)
+    path = str(tmp_path / "entities.npz")
+    index.save(path, version="v1")
+    loaded, version = EntityIndex.load(path)
+    assert version == "v1"
+
+    # The vector store holds only some of the chunks, under its own ids
+    store = FAISS.from_documents(docs[1:], HashEmbeddings())
+    assert loaded.bind(store) == 3
+    found = [store.docstore.search(doc_id).page_content for doc_id, _ in loaded.search("Ned and the Imp", k=5)]
+    assert found == [DOCS[2][1], DOCS[1][1]]
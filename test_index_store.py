@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from chunk_store import content_key, list_chunk_files, load_chunk_file
+from index_store import load_or_update_index, read_index_meta
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic fake embeddings that record every text they embed"""
+
+    def __init__(self):
+        self.embedded = []
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        return np.random.default_rng(seed).random(8).tolist()
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+def write_book(rag_dir, name, contents):
+    chunks = [
+        {"content": content, "metadata": {"book_title": name, "chunk_index": i}}
+        for i, content in enumerate(contents)
+    ]
+    with open(os.path.join(rag_dir, f"{name}_rag.json"), "w") as f:
+        json.dump({"book_title": name, "chunks": chunks, "total_chunks": len(chunks)}, f)
+
+def build(tmp_path, embeddings, model_name="fake-model"):
+    rag_dir = str(tmp_path / "rag_chunks")
+    return load_or_update_index(
+        str(tmp_path / "faiss_index"),
+        list_chunk_files(rag_dir),
+        embeddings,
+        model_name,
+        load_chunk_file
+    )
+
+def manifest_ids(tmp_path, name):
+    manifest = read_index_meta(str(tmp_path / "faiss_index"))
+    return [chunk["id"] for chunk in manifest["sources"][name]["chunks"]]
+
+def setup_books(tmp_path):
+    os.makedirs(tmp_path / "rag_chunks")
+    write_book(str(tmp_path / "rag_chunks"), "book1", ["a", "b", "c"])
+    write_book(str(tmp_path / "rag_chunks"), "book2", ["x", "y"])
+
+def test_second_start_embeds_nothing(tmp_path):
+    setup_books(tmp_path)
+    build(tmp_path, CountingEmbeddings())
+
+    embeddings = CountingEmbeddings()
+    vector_store = build(tmp_path, embeddings)
+    assert embeddings.embedded == []
+    assert vector_store.index.ntotal == 5
+
+def test_manifest_hashes_are_content_keys(tmp_path):
+    setup_books(tmp_path)
+    build(tmp_path, CountingEmbeddings())
+    manifest = read_index_meta(str(tmp_path / "faiss_index"))
+    assert [chunk["hash"] for chunk in manifest["sources"]["book1"]["chunks"]] == [
+        content_key(text) for text in ["a", "b", "c"]
+    ]
+
+def test_edit_embeds_only_changed_chunks(tmp_path):
+    setup_books(tmp_path)
+    build(tmp_path, CountingEmbeddings())
+    old_ids = manifest_ids(tmp_path, "book1")
+    book2_ids = manifest_ids(tmp_path, "book2")
+
+    write_book(str(tmp_path / "rag_chunks"), "book1", ["a", "B", "c"])
+    embeddings = CountingEmbeddings()
+    vector_store = build(tmp_path, embeddings)
+
+    assert embeddings.embedded == ["B"]
+    new_ids = manifest_ids(tmp_path, "book1")
+    assert new_ids[0] == old_ids[0] and new_ids[2] == old_ids[2]
+    assert new_ids[1] not in old_ids
+    assert manifest_ids(tmp_path, "book2") == book2_ids
+    assert vector_store.index.ntotal == 5
+    assert str(old_ids[1]) not in vector_store.docstore._dict
+    assert vector_store.similarity_search("B", k=1)[0].page_content == "B"
+
+def test_deleting_file_removes_vectors(tmp_path):
+    setup_books(tmp_path)
+    build(tmp_path, CountingEmbeddings())
+    book2_ids = manifest_ids(tmp_path, "book2")
+
+    os.remove(tmp_path / "rag_chunks" / "book2_rag.json")
+    embeddings = CountingEmbeddings()
+    vector_store = build(tmp_path, embeddings)
+
+    assert embeddings.embedded == []
+    assert vector_store.index.ntotal == 3
+    assert not any(str(i) in vector_store.docstore._dict for i in book2_ids)
+    assert not any(i in vector_store.index_to_docstore_id for i in book2_ids)
+
+def test_model_change_forces_rebuild(tmp_path):
+    setup_books(tmp_path)
+    build(tmp_path, CountingEmbeddings())
+
+    embeddings = CountingEmbeddings()
+    build(tmp_path, embeddings, model_name="other-model")
+    assert sorted(embeddings.embedded) == ["a", "b", "c", "x", "y"]
+
+def test_malformed_and_empty_sources_use_fallback(tmp_path):
+    from langchain.docstore.document import Document
+
+    rag_dir = tmp_path / "rag_chunks"
+    os.makedirs(rag_dir)
+    (rag_dir / "broken_rag.json").write_text("{")
+    write_book(str(rag_dir), "empty", [])
+
+    vector_store = load_or_update_index(
+        str(tmp_path / "faiss_index"),
+        list_chunk_files(str(rag_dir)),
+        CountingEmbeddings(),
+        "fake-model",
+        load_chunk_file,
+        load_fallback=lambda: [Document(page_content="fallback")]
+    )
+    assert vector_store.index.ntotal == 1
+    assert not os.path.exists(tmp_path / "faiss_index")
+
+def test_duplicate_chunks_keep_their_ids(tmp_path):
+    os.makedirs(tmp_path / "rag_chunks")
+    write_book(str(tmp_path / "rag_chunks"), "book1", ["dup", "dup", "z"])
+    build(tmp_path, CountingEmbeddings())
+    old_ids = manifest_ids(tmp_path, "book1")
+
+    write_book(str(tmp_path / "rag_chunks"), "book1", ["new", "dup", "dup", "z"])
+    embeddings = CountingEmbeddings()
+    build(tmp_path, embeddings)
+
+    # The chunk still at (chunk_index, hash) keeps its id first; the moved
+    # duplicate then takes the remaining id with the same hash
+    assert embeddings.embedded == ["new"]
+    assert manifest_ids(tmp_path, "book1")[1:] == [old_ids[1], old_ids[0], old_ids[2]]
+
+def test_switching_to_binary_store_embeds_nothing(tmp_path):
+    from chunk_store import convert_json_to_binary
+
+    setup_books(tmp_path)
+    build(tmp_path, CountingEmbeddings())
+    convert_json_to_binary(str(tmp_path / "rag_chunks" / "book1_rag.json"))
+
+    embeddings = CountingEmbeddings()
+    vector_store = build(tmp_path, embeddings)
+    assert embeddings.embedded == []
+    assert vector_store.index.ntotal == 5
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import threading
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from lazy_components import LazyComponent, readiness, warm_up
+
+def test_concurrent_first_uses_load_once():
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.05)
+        return "model"
+
+    component = LazyComponent("model", load)
+    assert component.status()["state"] == "not loaded"
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(component.get())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["model"] * 4
+    assert len(calls) == 1
+    assert component.status()["state"] == "loaded" and component.seconds >= 0.05
+
+def test_failed_load_is_reported_and_retried():
+    attempts = []
+
+    def load():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("model download failed")
+        return "model"
+
+    component = LazyComponent("model", load)
+    with pytest.raises(OSError):
+        component.get()
+    assert component.status() == {"state": "failed", "seconds": None, "error": "model download failed"}
+    assert component.get() == "model"
+    assert component.error is None
+
+def test_warm_up_and_readiness():
+    index = LazyComponent("index", lambda: "index")
+    search = LazyComponent("search", lambda: index.get() + "+search")
+    llm = LazyComponent("llm", lambda: "llm")
+    components = [index, search, llm]
+
+    status = readiness(components, required=[index, search])
+    assert not status["ready"]
+    warm_up([search]).join()
+    status = readiness(components, required=[index, search])
+    assert status["ready"]
+    assert status["components"]["index"]["state"] == "loaded"
+    assert status["components"]["llm"]["state"] == "not loaded"
+    assert not readiness(components)["ready"]
@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from lexical_index import BM25Index, tokenize
+
+DOCS = [
+    ("a", "Harrenhal is a vast ruined castle on the shore of the God's Eye."),
+    ("b", "Jon Snow rides north to the Wall with his uncle Benjen."),
+    ("c", "Arya serves Roose Bolton as a cupbearer at Harrenhal. Harrenhal burns."),
+    ("d", "The Wall is seven hundred feet of ice."),
+]
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("Where is Harrenhal? God's Eye!") == ["harrenhal", "god's", "eye"]
+
+def test_search_ranks_by_bm25():
+    index = BM25Index.build(DOCS)
+    results = index.search("Where is Harrenhal?", k=5)
+    assert [doc_id for doc_id, _ in results] == ["c", "a"]
+    assert results[0][1] > results[1][1] > 0
+    assert [doc_id for doc_id, _ in index.search("the wall", k=1)] == ["d"]
+    assert index.search("Dorne", k=3) == []
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(DOCS)
+    path = str(tmp_path / "bm25.npz")
+    index.save(path, version="v1")
+    loaded, version = BM25Index.load(path)
+    assert version == "v1" and len(loaded) == 4
+    assert loaded.search("Jon Snow Wall", k=4) == index.search("Jon Snow Wall", k=4)
+
+def test_mask_restricts_search():
+    index = BM25Index.build(DOCS)
+    mask = index.row_mask(frozenset({"a", "b"}))
+    assert [doc_id for doc_id, _ in index.search("Harrenhal", k=5, mask=mask)] == ["a"]
@@ -0,0 +1,32 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from local_llm import cut_at_stop, default_prefixes, plan_tokens, template_prefix
+from retrieval import build_prompt
+from langchain.docstore.document import Document
+
+def test_default_prefixes_start_the_app_prompt():
+    assert template_prefix("Context:\n{context}\nQuestion: {question}") == "Context:\n"
+    prompt = build_prompt("Who is Jon Snow?", [Document(page_content="Jon Snow is Ned Stark's son.")])
+    prefixes = default_prefixes()
+    assert all(prefixes)
+    assert any(prompt.startswith(prefix) and len(prompt) > len(prefix) for prefix in prefixes)
+
+def test_plan_tokens_caps_prompt_and_answer():
+    # Everything fits
+    assert plan_tokens(20, 100, 50, 1024) == (100, 50)
+    # The prompt is cut to leave room for the answer
+    keep, new = plan_tokens(24, 2000, 512, 1024)
+    assert (keep, new) == (488, 512)
+    assert 24 + keep + new == 1024
+    # The answer shrinks so that at least one prompt token remains
+    assert plan_tokens(1000, 300, 512, 1024) == (1, 23)
+    with pytest.raises(ValueError):
+        plan_tokens(1024, 10, 10, 1024)
+
+def test_cut_at_stop():
+    assert cut_at_stop("Jon Snow.\nHuman: who?", ["\nHuman:"]) == "Jon Snow."
+    assert cut_at_stop("Jon Snow.", None) == "Jon Snow."
+    assert cut_at_stop("a|b#c", ["#", "|"]) == "a"
@@ -0,0 +1,37 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from metrics import StageMetrics, latency_summary, metrics
+from retrieval import GenerationTimer
+from benchmark import StubLLM
+
+def test_histograms_and_percentiles():
+    stage_metrics = StageMetrics(buckets=(0.01, 0.1), sample_size=100)
+    for ms in range(1, 101):
+        stage_metrics.record("search", ms / 1000)
+    stage_metrics.record("search", 5.0)
+    report = stage_metrics.snapshot()["search"]
+    assert report["count"] == 101
+    assert report["buckets"] == {"0.01": 10, "0.1": 100, "+Inf": 101}
+    # Percentiles cover the 100 most recent durations
+    assert report["p50_ms"] == pytest.approx(51.5)
+    assert report["max_ms"] == pytest.approx(5000)
+    assert latency_summary([])["p99_ms"] == 0.0
+
+def test_time_records_failed_blocks():
+    stage_metrics = StageMetrics()
+    with pytest.raises(ValueError):
+        with stage_metrics.time("embed"):
+            raise ValueError("model missing")
+    assert stage_metrics.snapshot()["embed"]["count"] == 1
+    stage_metrics.reset()
+    assert stage_metrics.snapshot() == {}
+
+def test_generation_timer_times_llm_calls():
+    metrics.reset()
+    llm = StubLLM(delay=0.01)
+    assert llm("Who is Jon Snow?", callbacks=[GenerationTimer()]) == llm.answer
+    report = metrics.snapshot()["generation"]
+    assert report["count"] == 1 and report["p50_ms"] >= 10
@@ -0,0 +1,60 @@
+import os
+import sys
+from langchain.docstore.document import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from neighbors import NeighborIndex
+from context_compression import ContextCompressor, SentenceIndex
+from test_context_compression import KeywordEmbeddings, count_words
+
+# Consecutive chunks repeat the last sentence of the previous one
+TEXTS = [
+    ("Bran", "Bran climbed the tower. He saw the queen."),
+    ("Bran", "He saw the queen. Jaime pushed him."),
+    ("Bran", "Jaime pushed him. Bran fell."),
+    ("Bran", "Bran fell. The wolf howled."),
+    ("Jon", "Jon rode north. The Wall was cold."),
+    ("Jon", "The Wall was cold. Snow fell."),
+]
+
+def make_docs():
+    return [
+        Document(page_content=text, metadata={"book_title": "A Game of Thrones", "chapter": chapter, "chunk_index": i})
+        for i, (chapter, text) in enumerate(TEXTS)
+    ]
+
+def test_window_stays_in_chapter():
+    docs = make_docs()
+    index = NeighborIndex(list(reversed(docs)))
+    assert index.window(docs[0], 1) == (0, 2)
+    assert index.window(docs[3], 1) == (2, 4)
+    assert index.window(docs[4], 2) == (4, 6)
+    assert index.window(Document(page_content="fallback"), 1) == (-1, -1)
+
+def test_expand_merges_windows_and_drops_overlap():
+    docs = make_docs()
+    fallback = Document(page_content="fallback")
+    passages = NeighborIndex(docs).expand([docs[1], fallback, docs[3], docs[2], docs[5]], window=1)
+
+    # Hits 1 and 3 touch and hit 2 is inside them: one passage, at the rank of hit 1
+    assert [passage.page_content for passage in passages] == [
+        "Bran climbed the tower. He saw the queen. Jaime pushed him. Bran fell. The wolf howled.",
+        "fallback",
+        "Jon rode north. The Wall was cold. Snow fell.",
+    ]
+    assert passages[0].metadata["chunk_index"] == 1
+    assert passages[0].metadata["chunk_range"] == [0, 3]
+    assert passages[2].metadata["chunk_range"] == [4, 5]
+
+def test_compressor_reuses_stored_sentences_of_windows():
+    docs = make_docs()
+    embeddings = KeywordEmbeddings()
+    sentence_index = SentenceIndex.build([doc.page_content for doc in docs], embeddings.embed_documents)
+    embedded = embeddings.embedded
+    passage = NeighborIndex(docs).expand([docs[5]], window=1)[0]
+
+    compressor = ContextCompressor(embeddings, count_words, max_tokens=3, sentence_index=sentence_index)
+    compressed = compressor.compress("Snow at the Wall", [passage])
+    # Only the question is embedded
+    assert embeddings.embedded == embedded + 1
+    assert compressed[0].page_content == "Snow fell."
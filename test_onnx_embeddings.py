@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from onnx_embeddings import EXPORT_FILE, INT8_FILE, OnnxEmbeddings, mean_pool, parity_check
+
+class ProjectionEmbeddings:
+    """Embeds a text as a fixed random projection of its letter counts, plus optional noise"""
+
+    def __init__(self, noise=0.0, seed=0):
+        self.projection = np.random.default_rng(0).normal(size=(26, 16))
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+    def embed_documents(self, texts):
+        counts = np.array([[text.lower().count(chr(97 + i)) for i in range(26)] for text in texts], dtype=float)
+        vectors = counts @ self.projection
+        return (vectors + self.noise * self.rng.normal(size=vectors.shape)).tolist()
+
+TEXTS = [f"Chapter {i}: " + "winter is coming " * (i % 5) + "the north remembers " * (i % 7) for i in range(40)]
+QUERIES = ["Who remembers the north?", "Is winter coming?", "Chapter one"]
+
+def test_mean_pool_ignores_padding():
+    hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]])
+    vectors = mean_pool(hidden, np.array([[1, 1, 0]]))
+    assert np.allclose(vectors, [[1.0, 0.0]])
+
+def test_parity_of_identical_and_noisy_models():
+    report = parity_check(ProjectionEmbeddings(), ProjectionEmbeddings(), TEXTS, QUERIES, k=5)
+    assert report["drift_max"] < 1e-6
+    assert report["overlap_at_k"] == report["overlap_at_k_query_only"] == 1.0
+
+    report = parity_check(ProjectionEmbeddings(), ProjectionEmbeddings(noise=5.0, seed=1), TEXTS, QUERIES, k=5)
+    assert 0 < report["drift_mean"] <= report["drift_max"]
+    assert report["overlap_at_k"] < 1.0
+    assert report["texts"] == 40 and report["k"] == 5
+
+def test_missing_or_other_export_fails_clearly(tmp_path):
+    with pytest.raises(FileNotFoundError, match="onnx_embeddings.py export"):
+        OnnxEmbeddings(str(tmp_path))
+
+    # A model without its export record is a crashed export
+    (tmp_path / INT8_FILE).write_bytes(b"")
+    with pytest.raises(FileNotFoundError):
+        OnnxEmbeddings(str(tmp_path))
+
+    (tmp_path / EXPORT_FILE).write_text(json.dumps({"model_name": "bert-base-uncased"}))
+    with pytest.raises(ValueError, match="bert-base-uncased"):
+        OnnxEmbeddings(str(tmp_path))
@@ -0,0 +1,66 @@
+import os
+import sys
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain.docstore.document import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from langchain.vectorstores import FAISS
+from partitions import PartitionIndex, book_number, search_scope
+from retrieval import batch_similarity_search
+
+class ConstantEmbeddings(Embeddings):
+    """Every text gets the same vector, so only the filter decides the results"""
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+CHUNKS = [
+    ("A Game Of Thrones", "Arya"),
+    ("A Game Of Thrones", "Jon"),
+    ("A Storm of Swords", "Arya"),
+    ("A Dance with Dragons: A Song of Ice and Fire: Book Five", "Jon"),
+    ("The World of Ice and Fire", "Dorne"),
+]
+
+def make_store():
+    docs = [
+        Document(page_content=f"{book}/{chapter}", metadata={"book_title": book, "chapter": chapter})
+        for book, chapter in CHUNKS
+    ]
+    return FAISS.from_documents(docs, ConstantEmbeddings())
+
+def test_book_number_matches_edition_titles():
+    assert book_number("A Game Of Thrones") == 1
+    assert book_number("A Dance with Dragons: A Song of Ice and Fire: Book Five") == 5
+    assert book_number("The World of Ice and Fire") is None
+    assert search_scope() is None
+    assert search_scope(book="A Storm of Swords") == (3, None, None)
+
+def test_scoped_search_only_returns_the_partition():
+    store = make_store()
+    partitions = PartitionIndex.from_vector_store(store)
+
+    def found(**filters):
+        params = partitions.search_params(search_scope(**filters))
+        docs = batch_similarity_search(store, ConstantEmbeddings(), ["q"], k=10, search_params=params)[0]
+        return sorted(doc.page_content for doc in docs)
+
+    assert len(found()) == 5
+    assert found(book=3) == ["A Storm of Swords/Arya"]
+    assert found(chapter="arya") == ["A Game Of Thrones/Arya", "A Storm of Swords/Arya"]
+    assert found(up_to_book="A Storm of Swords") == [
+        "A Game Of Thrones/Arya", "A Game Of Thrones/Jon", "A Storm of Swords/Arya"
+    ]
+    assert found(book=2) == []
+
+def test_docstore_ids_match_vector_ids():
+    store = make_store()
+    partitions = PartitionIndex.from_vector_store(store)
+    scope = search_scope(chapter="Jon")
+    ids = partitions.vector_ids(scope)
+    assert isinstance(ids, np.ndarray) and len(ids) == 2
+    assert partitions.docstore_ids(scope) == {store.index_to_docstore_id[int(i)] for i in ids}
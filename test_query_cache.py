@@ -0,0 +1,74 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import query_cache
+from query_cache import CachedQueryEmbeddings, QueryCache, normalize_question
+
+def test_normalize_question():
+    assert normalize_question("  Who is   Jon Snow?? ") == normalize_question("who is jon snow")
+
+def test_lru_eviction_and_counters():
+    cache = QueryCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (3, 1, 1)
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, "time", lambda: now[0])
+    cache = QueryCache(ttl=10)
+    cache.set("a", 1)
+    now[0] += 5
+    assert cache.get("a") == 1
+    now[0] += 10
+    assert cache.get("a") is None
+
+def test_version_change_invalidates(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    cache = QueryCache("retrieval", version="v1", db_path=db_path)
+    cache.set("a", [1, 2])
+
+    # A new process with the same index version sees the persisted entry
+    assert QueryCache("retrieval", version="v1", db_path=db_path).get("a") == [1, 2]
+    # A rebuilt index drops it
+    assert QueryCache("retrieval", version="v2", db_path=db_path).get("a") is None
+    cache.set_version("v2")
+    assert cache.get("a") is None
+
+def test_cached_query_embeddings():
+    class Fake:
+        model_name = "fake"
+        calls = 0
+
+        def embed_query(self, text):
+            Fake.calls += 1
+            return [float(len(text))]
+
+    embeddings = CachedQueryEmbeddings(Fake(), QueryCache())
+    embeddings.embed_query("Who is Jon Snow?")
+    embeddings.embed_query("who is jon snow")
+    assert Fake.calls == 1
+    assert embeddings.model_name == "fake"
+
+def test_embed_queries_batches_misses():
+    class Fake:
+        batches = []
+
+        def embed_query(self, text):
+            return [float(len(text))]
+
+        def embed_documents(self, texts):
+            Fake.batches.append(list(texts))
+            return [[float(len(text))] for text in texts]
+
+    embeddings = CachedQueryEmbeddings(Fake(), QueryCache())
+    embeddings.embed_query("Who is Jon Snow?")
+    vectors = embeddings.embed_queries(["who is jon snow", "Where is Harrenhal?", "Who is Arya?"])
+    assert Fake.batches == [["Where is Harrenhal?", "Who is Arya?"]]
+    assert vectors == [[16.0], [19.0], [12.0]]
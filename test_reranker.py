@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+from langchain.docstore.document import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from reranker import Reranker
+
+class OverlapScorer:
+    """Scores a pair by the words the passage shares with the question, counting scored pairs"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.scored = 0
+
+    def __call__(self, pairs):
+        time.sleep(self.delay)
+        self.scored += len(pairs)
+        return [len(set(q.lower().split()) & set(p.lower().split())) for q, p in pairs]
+
+CANDIDATES = [
+    Document(page_content="Winter is coming, said the Starks."),
+    Document(page_content="The Lannisters always pay their debts."),
+    Document(page_content="Ned Stark was the Lord of Winterfell and Warden of the North."),
+    Document(page_content="Jon Snow went to the Wall."),
+]
+
+def test_rerank_orders_by_score():
+    reranker = Reranker(OverlapScorer(), batch_size=2, budget=None)
+    docs = reranker.rerank("Who was the lord of Winterfell?", CANDIDATES, k=2)
+    assert docs[0] is CANDIDATES[2]
+    # Ties keep the search order
+    assert docs[1] is CANDIDATES[0]
+    assert reranker.stats()["reranked"] == 1
+
+def test_scores_are_cached_per_question():
+    scorer = OverlapScorer()
+    reranker = Reranker(scorer, budget=None)
+    first = reranker.rerank("Who was the lord of Winterfell?", CANDIDATES, k=3)
+    assert reranker.rerank("who was the LORD of Winterfell? ", CANDIDATES, k=3) == first
+    assert scorer.scored == len(CANDIDATES)
+    reranker.rerank("Who went to the Wall?", CANDIDATES, k=3)
+    assert scorer.scored == 2 * len(CANDIDATES)
+
+def test_budget_keeps_search_order():
+    reranker = Reranker(OverlapScorer(delay=0.05), batch_size=1, budget=0.01)
+    docs = reranker.rerank("Who was the lord of Winterfell?", CANDIDATES, k=2)
+    assert docs == CANDIDATES[:2]
+    assert reranker.stats()["fallbacks"] == 1 and reranker.stats()["reranked"] == 0
@@ -0,0 +1,72 @@
+import os
+import sys
+import hashlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain.docstore.document import Document
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from langchain.vectorstores import FAISS
+from retrieval import batch_similarity_search, build_prompt, hybrid_batch_search, reciprocal_rank_fusion
+from lexical_index import BM25Index
+
+class HashEmbeddings(Embeddings):
+    """Deterministic fake embeddings; counts encoder calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        return np.random.default_rng(seed).random(16).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._vector(text)
+
+TEXTS = [f"chunk {i}" for i in range(20)]
+
+def make_store():
+    docs = [Document(page_content=text, metadata={"chunk_index": i}) for i, text in enumerate(TEXTS)]
+    return FAISS.from_documents(docs, HashEmbeddings())
+
+def test_batch_search_matches_single_searches():
+    store = make_store()
+    embeddings = HashEmbeddings()
+    questions = ["who is jon snow", "chunk 3", "where is harrenhal"]
+
+    batched = batch_similarity_search(store, embeddings, questions, k=3)
+    assert embeddings.calls == 1
+    for question, docs in zip(questions, batched):
+        expected = store.similarity_search(question, k=3)
+        assert [d.page_content for d in docs] == [d.page_content for d in expected]
+
+def test_build_prompt_contains_passages():
+    prompt = build_prompt("Who?", [Document(page_content="Ned"), Document(page_content="Jon")])
+    assert "Ned\n\nJon" in prompt and prompt.endswith("Question: Who?\nAnswer:")
+
+def test_reciprocal_rank_fusion_prefers_items_ranked_by_both():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "b"]]) == ["c", "b", "a", "d"]
+
+def test_hybrid_search_finds_named_chunk():
+    texts = TEXTS + ["Ser Barristan Selmy was Lord Commander of the Kingsguard."]
+    docs = [Document(page_content=text) for text in texts]
+    store = FAISS.from_documents(docs, HashEmbeddings())
+    lexical = BM25Index.from_vector_store(store)
+
+    found = hybrid_batch_search(store, HashEmbeddings(), lexical, ["Who is Ser Barristan Selmy?"], k=3, fetch_k=3)
+    assert texts[-1] in [d.page_content for d in found[0]]
+
+def test_hybrid_search_fuses_entity_candidates():
+    from entity_index import EntityIndex
+    texts = TEXTS + ["The Imp drank wine on the Kingsroad."]
+    store = FAISS.from_documents([Document(page_content=text) for text in texts], HashEmbeddings())
+    entities = EntityIndex.from_vector_store(store)
+
+    found = hybrid_batch_search(store, HashEmbeddings(), None, ["Where did Tyrion drink?"], k=3, fetch_k=3,
+                                entity_index=entities)
+    assert texts[-1] in [d.page_content for d in found[0]]
@@ -0,0 +1,59 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from semantic_cache import SemanticCache
+
+class FakeEmbeddings:
+    VECTORS = {
+        "who is jon snow's father": [1.0, 0.0, 0.0],
+        "who's jon's dad": [0.95, 0.1, 0.0],
+        "where is harrenhal": [0.0, 1.0, 0.0],
+        "what is the wall": [0.0, 0.0, 1.0],
+        "who is robb's mother": [0.0, 0.6, 0.8],
+        "who is jon's mother": [0.0, 0.61, 0.79],
+    }
+
+    def embed_query(self, text):
+        return self.VECTORS[text]
+
+def test_paraphrase_hits_and_unrelated_misses():
+    cache = SemanticCache(FakeEmbeddings(), threshold=0.9)
+    cache.add("who is jon snow's father", "Eddard Stark, officially", ["doc"])
+
+    hit = cache.lookup("who's jon's dad")
+    assert hit["answer"] == "Eddard Stark, officially"
+    assert hit["sources"] == ["doc"]
+    assert cache.lookup("where is harrenhal") is None
+    assert cache.stats()["hit_rate"] == 0.5
+
+def test_lru_eviction():
+    cache = SemanticCache(FakeEmbeddings(), capacity=2, eviction="lru")
+    cache.add("who is jon snow's father", "a")
+    cache.add("where is harrenhal", "b")
+    cache.lookup("who's jon's dad")
+    cache.add("what is the wall", "c")
+
+    assert cache.lookup("where is harrenhal") is None
+    assert cache.lookup("who is jon snow's father")["answer"] == "a"
+    assert cache.lookup("what is the wall")["answer"] == "c"
+
+def test_fifo_eviction():
+    cache = SemanticCache(FakeEmbeddings(), capacity=2, eviction="fifo")
+    cache.add("who is jon snow's father", "a")
+    cache.add("where is harrenhal", "b")
+    cache.lookup("who's jon's dad")
+    cache.add("what is the wall", "c")
+
+    assert cache.lookup("who is jon snow's father") is None
+    assert cache.lookup("where is harrenhal")["answer"] == "b"
+
+def test_key_must_match():
+    names = {"who is robb's mother": ["Robb Stark"], "who is jon's mother": ["Jon Snow"]}
+    cache = SemanticCache(FakeEmbeddings(), threshold=0.9, key=lambda question: names.get(question, []))
+    cache.add("who is robb's mother", "Catelyn Stark")
+
+    assert cache.lookup("who is jon's mother") is None
+    cache.add("who is jon's mother", "Unknown")
+    assert cache.lookup("who is jon's mother")["answer"] == "Unknown"
+    assert cache.lookup("who is robb's mother")["answer"] == "Catelyn Stark"
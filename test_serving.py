@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from serving import Overloaded, RequestRunner
+
+def test_identical_requests_are_coalesced():
+    calls = []
+
+    def answer(question):
+        calls.append(question)
+        time.sleep(0.05)
+        return question.upper()
+
+    async def main():
+        runner = RequestRunner(max_workers=2, max_pending=4)
+        results = await asyncio.gather(*[runner.run("q", answer, "q") for _ in range(5)])
+        return runner, results
+
+    runner, results = asyncio.run(main())
+    assert results == ["Q"] * 5
+    assert calls == ["q"]
+    assert runner.stats()["coalesced"] == 4 and runner.pending == 0
+
+def test_requests_beyond_queue_limit_are_rejected():
+    async def main():
+        runner = RequestRunner(max_workers=1, max_pending=2)
+        results = await asyncio.gather(
+            *[runner.run(None, time.sleep, 0.05) for _ in range(3)], return_exceptions=True
+        )
+        return runner, results
+
+    runner, results = asyncio.run(main())
+    assert sum(isinstance(r, Overloaded) for r in results) == 1
+    assert runner.stats()["rejected"] == 1 and runner.pending == 0
+
+def test_errors_reach_every_waiter_and_free_the_slot():
+    def fail(question):
+        time.sleep(0.02)
+        raise ValueError(question)
+
+    async def main():
+        runner = RequestRunner(max_workers=1, max_pending=1)
+        results = await asyncio.gather(*[runner.run("q", fail, "q") for _ in range(2)], return_exceptions=True)
+        return runner, results
+
+    runner, results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert runner.pending == 0
@@ -0,0 +1,49 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import session_store
+from session_store import SessionStore
+
+def test_sessions_are_separate():
+    sessions = SessionStore()
+    sessions.get("a").add_turn("Who is Jon Snow?", "Ned's bastard")
+    assert sessions.history("b") == []
+    assert sessions.history("a") == [("Who is Jon Snow?", "Ned's bastard")]
+    sessions.reset("a")
+    assert sessions.history("a") == []
+
+def test_history_is_bounded_by_turns_and_tokens():
+    session = SessionStore(max_turns=3, max_history_tokens=None).get("s")
+    for i in range(5):
+        session.add_turn(f"q{i}", f"a{i}")
+    assert session.history() == [("q2", "a2"), ("q3", "a3"), ("q4", "a4")]
+
+    session = SessionStore(max_turns=10, max_history_tokens=6).get("s")
+    session.add_turn("one two", "three")
+    session.add_turn("four five", "six")
+    session.add_turn("seven", "eight nine ten")
+    assert session.history() == [("seven", "eight nine ten")]
+
+def test_newest_turn_is_cut_to_fit_not_dropped():
+    session = SessionStore(max_history_tokens=5).get("s")
+    session.add_turn("q1", "a1")
+    session.add_turn("Who is Jon Snow?", "Ned's bastard,\nraised at Winterfell.")
+    assert session.history() == [("Who is Jon Snow?", "Ned's")]
+
+    session.add_turn("one two three four five six", "answer")
+    assert session.history() == [("one two three four five six", "")]
+
+def test_idle_and_capacity_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+    sessions = SessionStore(idle_timeout=60, max_sessions=2)
+    sessions.get("a").add_turn("q", "a")
+    sessions.get("b")
+    sessions.get("c")
+    assert len(sessions) == 2 and sessions.history("a") == []
+
+    now[0] += 61
+    sessions.get("d")
+    assert len(sessions) == 1
+    assert sessions.stats()["evictions"] == 4
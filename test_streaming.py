@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import pytest
+from langchain.docstore.document import Document
+
+pytest.importorskip("gradio")
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+os.environ["GOTBOT_WARM_UP"] = "0"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import app as gotbot
+from lazy_components import LazyComponent
+
+DOCS = [Document(page_content="Winter is coming.", metadata={"book_title": "A Game of Thrones", "chapter": "Bran"})]
+
+class StubGenerator:
+    """Streams a fixed answer, or fails after its first token"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def stream(self, prompt):
+        yield "Eddard"
+        if self.fail:
+            raise RuntimeError("generation failed")
+        yield " Stark"
+
+@pytest.fixture
+def stub_bot(monkeypatch):
+    calls = []
+
+    def retrieve(question, k, scope=None):
+        calls.append(scope)
+        return DOCS
+
+    monkeypatch.setattr(gotbot, "retrieve", retrieve)
+    monkeypatch.setattr(gotbot, "compress", lambda question, docs: docs)
+    monkeypatch.setattr(gotbot, "llm", LazyComponent("llm", StubGenerator))
+    return calls
+
+def test_events_are_passages_then_tokens_then_done(stub_bot):
+    events = list(gotbot.stream_events("Who is Ned?"))
+    assert [event["type"] for event in events] == ["passages", "token", "token", "done"]
+    assert events[0]["passages"][0]["content"] == "Winter is coming."
+    assert "".join(event["text"] for event in events[1:3]) == "Eddard Stark"
+
+def test_errors_end_the_stream(stub_bot, monkeypatch):
+    assert [event["type"] for event in gotbot.stream_events("  ")] == ["error"]
+
+    monkeypatch.setattr(gotbot, "llm", LazyComponent("llm", lambda: StubGenerator(fail=True)))
+    events = list(gotbot.stream_events("Who is Ned?"))
+    assert [event["type"] for event in events] == ["passages", "token", "error"]
+    assert "generation failed" in events[-1]["message"]
+
+def test_stream_endpoint_sends_ndjson_with_scope(stub_bot):
+    from fastapi.testclient import TestClient
+    from partitions import search_scope
+    import api
+
+    # Without a with block, so the runner is not shut down for later tests
+    client = TestClient(api.app)
+    response = client.post("/api/ask/stream", json={"text": "Who is Ned?", "up_to_book": 2})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["type"] for event in events] == ["passages", "token", "token", "done"]
+    assert stub_bot == [search_scope(up_to_book=2)]
+    assert api.runner.pending == 0
+
+def test_batch_endpoint_accepts_both_payloads(monkeypatch):
+    from fastapi.testclient import TestClient
+    import api
+
+    calls = []
+    def answer_questions(questions, k=2, generate=False):
+        calls.append((questions, generate))
+        return [{"question": q, "answer": q.upper(), "sources": [], "error": None} for q in questions]
+    monkeypatch.setattr(gotbot, "answer_questions", answer_questions)
+
+    client = TestClient(api.app)
+    gradio_style = client.post("/api/batch", json={"data": ["Who is Ned?\n\nWhere is Harrenhal?", True]})
+    list_style = client.post("/api/batch", json={"questions": ["Who is Ned?"]})
+    malformed = client.post("/api/batch", json={"data": [42]})
+    assert [r["answer"] for r in gradio_style.json()["data"][0]] == ["WHO IS NED?", "WHERE IS HARRENHAL?"]
+    assert list_style.json()["results"][0]["answer"] == "WHO IS NED?"
+    assert malformed.status_code == 400
+    assert calls == [(["Who is Ned?", "Where is Harrenhal?"], True), (["Who is Ned?"], False)]